@@ -0,0 +1,275 @@
+# レート制限を考慮した並行バッチ埋め込みエンジン（asyncio）
+#
+# チャンクをtiktokenのトークン数で上限を決めたバッチに詰め、RPM/TPMのトークンバケットの
+# 範囲内で複数バッチを同時に埋め込む。429などで失敗したバッチは retry-after（なければジッター付きの
+# 指数バックオフ）だけ待って、経過時間の上限まで再試行する。結果はそのままベクターストアへupsertし、
+# 上限まで再試行しても失敗したバッチは取り込み全体を止めずに集計して返す。
+
+import asyncio
+import email.utils
+import random
+import time
+
+import openai
+import tiktoken
+
+from local_embeddings import CharNgramEmbeddings, HashingEmbeddings
+from streaming_ingest import upsert_embeddings
+
+# OpenAI Embeddings APIの1リクエストあたりの上限
+MAX_INPUTS_PER_REQUEST = 2048
+MAX_TOKENS_PER_REQUEST = 300_000
+# トークンバケットに貯められる量（1分あたりの上限に対する割合）。起動直後は空から始めるので、
+# どの60秒間でも送る量は上限の (1 + この割合) 倍程度に収まる
+DEFAULT_BURST_FRACTION = 0.05
+# 1バッチの再試行に使う時間の上限（秒）。レート制限の枠（1分）より長くとる
+DEFAULT_RETRY_SECONDS = 300.0
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def load_encoding(encoding_name: str = "cl100k_base"):
+    """
+    tiktokenのエンコーディングを読み込む
+
+    初回はBPEファイルをダウンロードするので、ネットワークがない環境などで読み込めなければ None を返す。
+    """
+    if encoding_name is None:
+        return None
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        print(f"tiktokenのエンコーディング {encoding_name} を読み込めないため、文字数でトークン数を見積もります（{e}）")
+        return None
+
+
+def pack_batches(chunks, max_tokens: int = 100_000, max_items: int = MAX_INPUTS_PER_REQUEST,
+                 encoding_name: str = "cl100k_base"):
+    """
+    チャンクをトークン数・件数の上限内に収まるバッチへ詰める
+
+    Args:
+        chunks (Iterable[tuple[str, Document]]): (チャンクID, チャンク)
+        max_tokens (int): 1バッチの合計トークン数の上限
+        max_items (int): 1バッチの最大件数
+        encoding_name (str | None): tiktokenのエンコーディング名（text-embedding-3はcl100k_base）。
+            None、または読み込めない場合は文字数をトークン数とみなす（cl100k_baseではほぼ上限側の見積もり）
+
+    Yields:
+        tuple[list[tuple[str, Document]], int]: (バッチ, バッチの合計トークン数)
+    """
+    encoding = load_encoding(encoding_name)
+    max_tokens = min(max_tokens, MAX_TOKENS_PER_REQUEST)
+    batch, batch_tokens = [], 0
+    for chunk_id, chunk in chunks:
+        if encoding is None:
+            tokens = len(chunk.page_content)
+        else:
+            tokens = len(encoding.encode(chunk.page_content, disallowed_special=()))
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_items):
+            yield batch, batch_tokens
+            batch, batch_tokens = [], 0
+        batch.append((chunk_id, chunk))
+        batch_tokens += tokens
+    if batch:
+        yield batch, batch_tokens
+
+
+class TokenBucket:
+    """
+    1分あたりの上限量を一定速度で補充するトークンバケット
+
+    起動直後に1分ぶんをまとめて送ると、APIの枠（直近60秒）で上限の約2倍になって429が続くので、
+    バケットは空から始め、貯められる量も burst_fraction 分までにする。
+
+    Args:
+        per_minute (float): 1分あたりに使える量（リクエスト数やトークン数）
+        burst_fraction (float): 貯められる量（per_minute に対する割合）
+    """
+
+    def __init__(self, per_minute: float, burst_fraction: float = DEFAULT_BURST_FRACTION):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, per_minute * burst_fraction)
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1) -> None:
+        # 貯められる量を超える要求は満杯まで待って通し、超えた分は借りにする（次の要求がその分待つ）
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= min(amount, self.capacity):
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((min(amount, self.capacity) - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """
+    RPM（リクエスト数/分）とTPM（トークン数/分）の両方を守るリミッター
+
+    Args:
+        rpm (float): 1分あたりのリクエスト数の上限
+        tpm (float): 1分あたりのトークン数の上限
+    """
+
+    def __init__(self, rpm: float = 3_000, tpm: float = 1_000_000):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    async def acquire(self, tokens: int) -> None:
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+
+
+def retry_after(error) -> float | None:
+    """
+    エラーのレスポンスの retry-after-ms / retry-after ヘッダーから待つ秒数を返す（なければ None）
+
+    retry-after は秒数とHTTP日付のどちらの形式でもよい。
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    if headers.get("retry-after-ms"):
+        try:
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+async def embed_with_retry(embeddings, texts: list[str], max_seconds: float = DEFAULT_RETRY_SECONDS,
+                           base_delay: float = 1.0, max_delay: float = 60.0, limiter: RateLimiter = None,
+                           tokens: int = 0):
+    """
+    スロットリングなどの一時的なエラーを再試行する
+
+    サーバーが retry-after を返せばその秒数（同時に再試行が集中しないよう最大 base_delay のジッターを足す）、
+    なければ指数バックオフ＋フルジッターで待つ。回数ではなく経過時間で打ち切る。
+
+    Args:
+        embeddings: 埋め込みモデル
+        texts (list[str]): 埋め込むテキスト
+        max_seconds (float): 最初の呼び出しから再試行をやめるまでの秒数
+        base_delay (float): バックオフの初期値（秒）
+        max_delay (float): バックオフで1回に待つ秒数の上限（retry-after はそのまま待つ）
+        limiter (RateLimiter | None): 再試行も含めて、毎回のリクエストの前に枠を取るリミッター
+        tokens (int): limiter から取るトークン数
+
+    Returns:
+        tuple[list[list[float]], int]: (埋め込みベクトル, 再試行した回数)
+    """
+    deadline = time.monotonic() + max_seconds
+    attempt = 0
+    while True:
+        if limiter is not None:
+            await limiter.acquire(tokens)
+        try:
+            return await embeddings.aembed_documents(texts), attempt
+        except RETRYABLE_ERRORS as e:
+            delay = retry_after(e)
+            if delay is None:
+                delay = random.uniform(0, min(max_delay, base_delay * 2 ** min(attempt, 16)))
+            else:
+                delay += random.uniform(0, base_delay)
+            if time.monotonic() + delay > deadline:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+async def aembed_into(chunks, embeddings, db, concurrency: int = 8, rpm: float = 3_000,
+                      tpm: float = 1_000_000, max_batch_tokens: int = 100_000,
+                      max_batch_items: int = MAX_INPUTS_PER_REQUEST,
+                      retry_seconds: float = DEFAULT_RETRY_SECONDS) -> dict:
+    """
+    チャンクを並行にバッチ埋め込みし、完了したバッチから順にベクターストアへupsertする
+
+    Args:
+        chunks (Iterable[tuple[str, Document]]): (チャンクID, チャンク)
+        embeddings: 埋め込みモデル（aembed_documents を持つもの）
+        db: 書き込み先のベクターストア
+        concurrency (int): 同時に送るバッチ数
+        rpm (float): 1分あたりのリクエスト数の上限
+        tpm (float): 1分あたりのトークン数の上限
+        max_batch_tokens (int): 1バッチの合計トークン数の上限
+        max_batch_items (int): 1バッチの最大件数
+        retry_seconds (float): 1バッチの再試行に使う時間の上限（秒）
+
+    Returns:
+        dict: チャンク数、バッチ数、トークン数、再試行回数、経過秒数、chunks/sec
+            再試行しても埋め込めなかったバッチは failed_batches / failed_chunks に数え、
+            そのチャンクIDを failed_ids に入れる（それ以外のバッチは取り込みを続ける）
+    """
+    limiter = RateLimiter(rpm=rpm, tpm=tpm)
+    # バッチを先読みしすぎないよう、キューの長さで上限をかける
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    stats = {"chunks": 0, "batches": 0, "tokens": 0, "retries": 0, "failed_batches": 0, "failed_chunks": 0,
+             "failed_ids": []}
+    started = time.perf_counter()
+
+    # ローカルの埋め込みにはAPIの上限がないので、tiktokenを使わずに文字数で見積もり、レート制限もかけない
+    local = isinstance(embeddings, (CharNgramEmbeddings, HashingEmbeddings))
+    encoding_name = None if local else "cl100k_base"
+
+    async def producer():
+        for batch, tokens in pack_batches(chunks, max_batch_tokens, max_batch_items, encoding_name):
+            await queue.put((batch, tokens))
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def worker():
+        while (item := await queue.get()) is not None:
+            batch, tokens = item
+            texts = [chunk.page_content for _, chunk in batch]
+            try:
+                vectors, retries = await embed_with_retry(embeddings, texts, retry_seconds,
+                                                          limiter=None if local else limiter, tokens=tokens)
+            except RETRYABLE_ERRORS as e:
+                # 1バッチの失敗で、埋め込み済みのバッチを含む取り込み全体を止めない
+                print(f"バッチの埋め込みに失敗しました（{len(batch)}件）: {type(e).__name__}: {e}")
+                stats["failed_batches"] += 1
+                stats["failed_chunks"] += len(batch)
+                stats["failed_ids"].extend(chunk_id for chunk_id, _ in batch)
+                continue
+            # ベクターストアへの書き込みは同期APIなので、イベントループを止めないよう別スレッドで行う
+            await asyncio.to_thread(
+                upsert_embeddings,
+                db,
+                [chunk_id for chunk_id, _ in batch],
+                texts,
+                [chunk.metadata for _, chunk in batch],
+                vectors,
+            )
+            stats["chunks"] += len(batch)
+            stats["batches"] += 1
+            stats["tokens"] += tokens
+            stats["retries"] += retries
+
+    await asyncio.gather(producer(), *(worker() for _ in range(concurrency)))
+    stats["seconds"] = time.perf_counter() - started
+    stats["chunks_per_sec"] = stats["chunks"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+def embed_into(chunks, embeddings, db, **kwargs) -> dict:
+    """aembed_into() の同期版（スクリプトから呼び出す用）"""
+    return asyncio.run(aembed_into(chunks, embeddings, db, **kwargs))
@@ -0,0 +1,70 @@
+# 並行バッチ埋め込みエンジンのスループット計測
+#
+# ローカルのモック埋め込みサーバーを起動し、合成したチャンクをChromaへ取り込んで
+# chunks/sec を表示する。取り込みジョブの並行数やレート上限を見積もるために使う。
+
+import asyncio
+import random
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_openai import OpenAIEmbeddings
+
+from batch_embedder import aembed_into
+from mock_embedding_server import start_server
+
+NUM_CHUNKS = 20_000
+CHUNK_WORDS = 150
+CONCURRENCY_LEVELS = [1, 4, 16]
+# 数値にするとモックサーバーが直近60秒でこの数を超えたリクエストに429（retry-after: 1）を返すようになり、
+# レート制限と再試行の動作を確認できる（その場合は RATE_LIMITED_CHUNKS 件だけ取り込む）
+MOCK_RPM_LIMIT = None
+RATE_LIMITED_CHUNKS = 300
+CLIENT_RPM = 3_000
+CLIENT_TPM = 5_000_000
+MAX_BATCH_TOKENS = 8_000
+MOCK_LATENCY = 0.05
+
+
+def synthetic_chunks(count: int):
+    """Markdown風の合成チャンクを作る"""
+    rng = random.Random(0)
+    vocabulary = ["loader", "retriever", "vector", "chain", "prompt", "agent", "embedding",
+                  "document", "splitter", "memory", "tool", "graph", "index", "query"]
+    for i in range(count):
+        words = " ".join(rng.choice(vocabulary) for _ in range(CHUNK_WORDS))
+        yield f"synthetic/{i}.md#0", Document(page_content=f"# Section {i}\n\n{words}",
+                                               metadata={"file_path": f"synthetic/{i}.md"})
+
+
+async def main():
+    for concurrency in CONCURRENCY_LEVELS:
+        # 計測ごとにモックサーバーを起動し直し、RPMの枠を前の計測と共有しないようにする
+        runner, base_url = await start_server(rpm_limit=MOCK_RPM_LIMIT, latency=MOCK_LATENCY)
+        try:
+            embeddings = OpenAIEmbeddings(
+                model="text-embedding-3-small",
+                base_url=base_url,
+                api_key="mock",
+                max_retries=0,  # 再試行はエンジン側で行う
+                check_embedding_ctx_length=False,
+            )
+            db = Chroma(collection_name=f"bench_{concurrency}", embedding_function=embeddings)
+            stats = await aembed_into(
+                synthetic_chunks(NUM_CHUNKS if MOCK_RPM_LIMIT is None else RATE_LIMITED_CHUNKS),
+                embeddings,
+                db,
+                concurrency=concurrency,
+                rpm=CLIENT_RPM,
+                tpm=CLIENT_TPM,
+                max_batch_tokens=MAX_BATCH_TOKENS,
+            )
+            print(f"concurrency={concurrency:>2}: {stats['chunks']} chunks / {stats['batches']} batches / "
+                  f"{stats['retries']} retries / {runner.app['throttled']} throttled / "
+                  f"{stats['failed_chunks']} failed / {stats['seconds']:.2f}s / {stats['chunks_per_sec']:.0f} chunks/sec")
+        finally:
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
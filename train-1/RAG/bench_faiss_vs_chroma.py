@@ -0,0 +1,104 @@
+# FAISS（Flat / IVF-PQ / HNSW）とChromaの再現率・レイテンシ比較
+#
+# クラスタ構造を持つ合成ベクトル（既定で100万件）を登録し、全件探索の結果を正解として
+# recall@k と1クエリあたりのレイテンシを表示する。nprobe / efSearch を変えたときの
+# 精度と速度のトレードオフを見て、設定を選ぶために使う。
+
+import time
+
+import chromadb
+import faiss
+import numpy as np
+
+from faiss_store import make_faiss_index, set_search_params
+
+N_VECTORS = 1_000_000
+DIM = 384
+N_CLUSTERS = 1_000
+N_QUERIES = 200
+K = 10
+NPROBE_VALUES = [1, 4, 16, 64]
+EF_SEARCH_VALUES = [16, 32, 64, 128]
+CHROMA_BATCH = 5_000
+
+
+def synthetic_vectors(n: int, dim: int, n_clusters: int, seed: int = 0) -> np.ndarray:
+    """クラスタ中心の周りに散らばる正規化済みベクトルを作る"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, n_clusters, n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def make_queries(vectors: np.ndarray, n: int, seed: int = 1) -> np.ndarray:
+    """登録済みベクトルに雑音を加えたクエリを作る"""
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(0, len(vectors), n)] + 0.1 * rng.standard_normal((n, vectors.shape[1])).astype(np.float32)
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def timed_search(search, queries: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """1クエリずつ検索し、(結果ID, 各クエリのレイテンシms) を返す"""
+    results, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(search(query))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return np.array(results), np.array(latencies)
+
+
+def report(name: str, found: np.ndarray, latencies: np.ndarray, truth: np.ndarray) -> None:
+    print(f"{name:<22} recall@{K}={recall_at_k(found, truth):.3f}  "
+          f"p50={np.percentile(latencies, 50):.2f}ms  p95={np.percentile(latencies, 95):.2f}ms")
+
+
+if __name__ == "__main__":
+    print(f"合成ベクトルを作成中（{N_VECTORS}件 x {DIM}次元）...")
+    vectors = synthetic_vectors(N_VECTORS, DIM, N_CLUSTERS)
+    queries = make_queries(vectors, N_QUERIES)
+
+    # 正解（全件探索）
+    flat = make_faiss_index("flat", DIM, N_VECTORS)
+    flat.add(vectors)
+    _, truth = flat.search(queries, K)
+    found, latencies = timed_search(lambda q: flat.search(q[None, :], K)[1][0], queries)
+    report("faiss Flat", found, latencies, truth)
+
+    started = time.perf_counter()
+    ivfpq = make_faiss_index("ivfpq", DIM, N_VECTORS)
+    ivfpq.train(vectors[:min(N_VECTORS, 256 * 1024)])
+    ivfpq.add(vectors)
+    print(f"\nIVF-PQ 構築: {time.perf_counter() - started:.1f}秒")
+    for nprobe in NPROBE_VALUES:
+        set_search_params(ivfpq, nprobe=nprobe)
+        found, latencies = timed_search(lambda q: ivfpq.search(q[None, :], K)[1][0], queries)
+        report(f"faiss IVF-PQ nprobe={nprobe}", found, latencies, truth)
+
+    started = time.perf_counter()
+    hnsw = make_faiss_index("hnsw", DIM, N_VECTORS)
+    hnsw.add(vectors)
+    print(f"\nHNSW 構築: {time.perf_counter() - started:.1f}秒")
+    for ef_search in EF_SEARCH_VALUES:
+        set_search_params(hnsw, ef_search=ef_search)
+        found, latencies = timed_search(lambda q: hnsw.search(q[None, :], K)[1][0], queries)
+        report(f"faiss HNSW ef={ef_search}", found, latencies, truth)
+
+    started = time.perf_counter()
+    collection = chromadb.EphemeralClient().create_collection(
+        "bench_vectors", configuration={"hnsw": {"space": "ip"}}
+    )
+    for start in range(0, N_VECTORS, CHROMA_BATCH):
+        end = min(start + CHROMA_BATCH, N_VECTORS)
+        collection.add(ids=[str(i) for i in range(start, end)], embeddings=vectors[start:end])
+    print(f"\nChroma 構築: {time.perf_counter() - started:.1f}秒")
+    found, latencies = timed_search(
+        lambda q: [int(i) for i in collection.query(query_embeddings=[q], n_results=K)["ids"][0]],
+        queries,
+    )
+    report("chroma (HNSW)", found, latencies, truth)
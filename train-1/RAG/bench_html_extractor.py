@@ -0,0 +1,91 @@
+# HTML本文抽出のベンチマーク
+#
+# 保存済みのHTMLページ（BENCH_HTML_DIRECTORY の *.html、未指定なら固定シードで合成した
+# ドキュメントサイト風のページ）を、従来の SoupStrainer + get_text() と html_extractor.lxml_document で
+# 抽出し、1ページあたりの解析時間と出力サイズ、段落の欠落・重複、ナビゲーションなどの混入を比べる。
+# 合成ページでは各段落に一意の印（para-<番号>）を入れてあるので、出力に何回現れたかで欠落・重複を数えられる。
+
+import glob
+import os
+import random
+import re
+import time
+
+from html_extractor import lxml_document
+from web_fetcher import soup_document
+
+HTML_DIRECTORY = os.getenv("BENCH_HTML_DIRECTORY")
+NUM_PAGES = 200
+RUNS = 3
+
+_MARKER = re.compile(r"para-\d+-\d+")
+
+
+def synthetic_pages(count: int, seed: int = 0) -> list[str]:
+    """ナビゲーション・サイドバー・入れ子のdiv/section・コードブロックを含むドキュメントページを作る"""
+    rng = random.Random(seed)
+    words = ["LangChain", "retriever", "vector", "store", "document", "loader", "embedding",
+             "chain", "prompt", "template", "agent", "tool", "memory", "index", "query", "the",
+             "a", "to", "and", "of", "with", "for", "from", "using", "your"]
+    nav = "".join(f'<li><a href="/docs/{i}">Menu item {i}</a></li>' for i in range(60))
+    pages = []
+    for page in range(count):
+        sections = []
+        for s in range(rng.randint(3, 8)):
+            paragraphs = "".join(
+                f'<div class="paragraph"><p>para-{page}-{s * 100 + p} '
+                f'{" ".join(rng.choice(words) for _ in range(rng.randint(20, 80)))}</p></div>'
+                for p in range(rng.randint(1, 5))
+            )
+            code = '<pre><code class="language-python">pip install -U langchain\nimport langchain</code></pre>' \
+                if rng.random() < 0.4 else ""
+            sections.append(f'<section><div class="section-body"><h2>Section {s}</h2>{paragraphs}{code}</div></section>')
+        pages.append(
+            f'<html lang="en"><head><title>Page {page}</title><meta name="description" content="page {page}">'
+            f'<script>window.__DATA__ = {{"page": {page}}};</script><style>.x {{ color: red; }}</style></head>'
+            f'<body><header><nav><ul>{nav}</ul></nav></header>'
+            f'<div class="main-wrapper"><aside><div class="sidebar"><ul>{nav}</ul></div></aside>'
+            f'<main><div class="container"><article><div class="markdown"><h1>Document {page}</h1>'
+            f'{"".join(sections)}</div></article></div></main></div>'
+            f'<footer><div>Copyright footer text</div></footer></body></html>'
+        )
+    return pages
+
+
+def load_pages() -> list[str]:
+    if HTML_DIRECTORY:
+        paths = sorted(glob.glob(os.path.join(HTML_DIRECTORY, "*.html")))
+        pages = []
+        for path in paths:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                pages.append(f.read())
+        return pages
+    return synthetic_pages(NUM_PAGES)
+
+
+def measure(name: str, extractor, pages: list[str]) -> None:
+    best = float("inf")
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        docs = [extractor(html, f"page-{i}") for i, html in enumerate(pages)]
+        best = min(best, time.perf_counter() - started)
+    chars = sum(len(doc.page_content) for doc in docs)
+    expected = missing = duplicated = 0
+    for html, doc in zip(pages, docs):
+        markers = set(_MARKER.findall(html))
+        found = _MARKER.findall(doc.page_content)
+        expected += len(markers)
+        missing += len(markers - set(found))
+        duplicated += len(found) - len(set(found))
+    boilerplate = sum(doc.page_content.count("Menu item") + doc.page_content.count("window.__DATA__")
+                      for doc in docs)
+    print(f"{name:<16} {best / len(pages) * 1000:8.3f} ms/page  出力 {chars / len(pages):9.0f} 文字/page  "
+          f"段落 欠落 {missing}/{expected} 重複 {duplicated}  ナビ等の混入 {boilerplate}")
+
+
+if __name__ == "__main__":
+    pages = load_pages()
+    print(f"{len(pages)} ページ（平均 {sum(map(len, pages)) / len(pages):.0f} 文字）"
+          f"{'' if HTML_DIRECTORY else '、合成データ'}")
+    measure("SoupStrainer", soup_document, pages)
+    measure("lxml", lxml_document, pages)
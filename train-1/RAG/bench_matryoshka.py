@@ -0,0 +1,67 @@
+# 次元削減（256 / 512 / 1024 次元）とフルサイズの比較ベンチマーク
+#
+# vector_store.py と同じコーパス（LangChainリポジトリの.md/.mdx）を分割し、
+# text-embedding-3-small のフルサイズのベクトルを1回だけ埋め込む（キャッシュ経由）。
+# それを切り詰め・再正規化して、インデックスサイズ・クエリレイテンシ・recall@k を比較する。
+# 正解はフルサイズでの全件探索の上位k件。
+
+import random
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_text_splitters import CharacterTextSplitter
+
+from embedding_cache import get_embeddings
+from git_blob_loader import GitBlobLoader
+from matryoshka import truncate_and_normalize
+
+load_dotenv()
+
+DIMENSIONS = [256, 512, 1024, 1536]
+MAX_CHUNKS = 20_000
+N_QUERIES = 200
+K = 10
+QUERY_CHARS = 200
+
+
+if __name__ == "__main__":
+    loader = GitBlobLoader(
+        repo_path="./langchain.git",
+        clone_url="https://github.com/langchain-ai/langchain",
+        branch="master",
+        file_filter=lambda path: path.endswith((".md", ".mdx")),
+    )
+    text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
+    chunks = text_splitter.split_documents(loader.load())
+    rng = random.Random(0)
+    if len(chunks) > MAX_CHUNKS:
+        chunks = rng.sample(chunks, MAX_CHUNKS)
+    print(f"チャンク数: {len(chunks)}")
+
+    # フルサイズで1回だけ埋め込む（2回目以降はキャッシュから読み込まれる）
+    embeddings = get_embeddings(model="text-embedding-3-small")
+    full_vectors = np.asarray(embeddings.embed_documents([c.page_content for c in chunks]), dtype=np.float32)
+    # クエリは、ランダムに選んだチャンクの冒頭部分（質問文の代わり）
+    query_texts = [c.page_content[:QUERY_CHARS] for c in rng.sample(chunks, min(N_QUERIES, len(chunks)))]
+    full_queries = np.asarray(embeddings.embed_documents(query_texts), dtype=np.float32)
+    print(f"埋め込みキャッシュ: {embeddings.stats()}")
+
+    full_dim = full_vectors.shape[1]
+    truth = np.argsort(-(truncate_and_normalize(full_queries, full_dim)
+                         @ truncate_and_normalize(full_vectors, full_dim).T), axis=1)[:, :K]
+
+    print(f"\n{'次元数':>6} {'インデックス':>12} {'p50':>9} {'p95':>9} {'recall@' + str(K):>10}")
+    for dimensions in DIMENSIONS:
+        index = truncate_and_normalize(full_vectors, dimensions)
+        queries = truncate_and_normalize(full_queries, dimensions)
+        found, latencies = [], []
+        for query in queries:
+            started = time.perf_counter()
+            scores = index @ query
+            top = np.argpartition(-scores, K)[:K]
+            found.append(top[np.argsort(-scores[top])])
+            latencies.append((time.perf_counter() - started) * 1000)
+        recall = np.mean([len(set(f) & set(t)) / K for f, t in zip(found, truth)])
+        print(f"{dimensions:>6} {index.nbytes / 1e6:>10.1f}MB {np.percentile(latencies, 50):>7.2f}ms "
+              f"{np.percentile(latencies, 95):>7.2f}ms {recall:>10.3f}")
@@ -0,0 +1,49 @@
+# MMRのマイクロベンチマーク（候補1000件 × 1536次元）
+#
+# mmr.mmr_select と LangChainの maximal_marginal_relevance のレイテンシを比較し、
+# 同じ候補を選ぶことと、1回のMMRが TARGET_MS 以内に収まるかを確認する。
+
+import time
+
+import numpy as np
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+
+from mmr import mmr_select
+
+N_CANDIDATES = 1000
+DIM = 1536
+K_VALUES = [4, 10, 20]
+LAMBDA_MULT = 0.5
+RUNS = 200
+TARGET_MS = 1.0
+
+
+def timed(func, runs: int) -> np.ndarray:
+    func()  # ウォームアップ
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return np.array(latencies)
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    # 似た候補が多い状況を再現するため、少数のクラスタ中心の周りに候補を作る
+    centers = rng.standard_normal((20, DIM)).astype(np.float32)
+    candidates = centers[rng.integers(0, len(centers), N_CANDIDATES)] + 0.3 * rng.standard_normal((N_CANDIDATES, DIM)).astype(np.float32)
+    candidates /= np.linalg.norm(candidates, axis=1, keepdims=True)
+    query = candidates[0] + 0.5 * rng.standard_normal(DIM).astype(np.float32)
+    query /= np.linalg.norm(query)
+
+    print(f"候補 {N_CANDIDATES}件 x {DIM}次元、lambda={LAMBDA_MULT}")
+    for k in K_VALUES:
+        ours = mmr_select(query, candidates, k, LAMBDA_MULT, normalized=True)
+        reference = maximal_marginal_relevance(query, candidates, LAMBDA_MULT, k)
+        latencies = timed(lambda: mmr_select(query, candidates, k, LAMBDA_MULT, normalized=True), RUNS)
+        reference_latencies = timed(lambda: maximal_marginal_relevance(query, candidates, LAMBDA_MULT, k), max(1, RUNS // 20))
+        verdict = "OK" if np.percentile(latencies, 50) < TARGET_MS else "NG"
+        print(f"k={k:<3} mmr_select p50={np.percentile(latencies, 50):.3f}ms p95={np.percentile(latencies, 95):.3f}ms "
+              f"[{verdict}]  LangChain p50={np.percentile(reference_latencies, 50):.2f}ms  "
+              f"同じ結果: {ours == reference}")
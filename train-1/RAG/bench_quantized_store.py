@@ -0,0 +1,47 @@
+# 量子化ベクトルストアのメモリ削減率と recall@k の計測
+#
+# float32の全件探索を正解として、int8 / 1bit 量子化 + 再スコアリングの recall@k、
+# レイテンシ、メモリ使用量を表示する。recall の低下が RECALL_TOLERANCE 以内かも判定する。
+
+import tempfile
+import time
+
+import numpy as np
+
+from bench_faiss_vs_chroma import make_queries, recall_at_k, synthetic_vectors
+from quantized_store import QUANTIZATION_TYPES, QuantizedVectorStore
+
+N_VECTORS = 200_000
+DIM = 1536
+N_CLUSTERS = 500
+N_QUERIES = 200
+K = 10
+RESCORE_FACTORS = [1, 4, 10, 40]
+RECALL_TOLERANCE = 0.02
+
+
+if __name__ == "__main__":
+    print(f"合成ベクトルを作成中（{N_VECTORS}件 x {DIM}次元）...")
+    vectors = synthetic_vectors(N_VECTORS, DIM, N_CLUSTERS)
+    queries = make_queries(vectors, N_QUERIES)
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :K]
+
+    for quantization in QUANTIZATION_TYPES:
+        with tempfile.TemporaryDirectory() as directory:
+            texts = [str(i) for i in range(N_VECTORS)]
+            QuantizedVectorStore.write(directory, vectors, texts, [{} for _ in texts], quantization)
+            store = QuantizedVectorStore(embedding=None, directory=directory)
+            memory = store.memory_bytes()
+            print(f"\n=== {quantization}: {memory['quantized'] / 1e6:.1f} MB "
+                  f"（float32 {memory['float32'] / 1e6:.1f} MB の 1/{memory['float32'] / memory['quantized']:.1f}） ===")
+            for factor in RESCORE_FACTORS:
+                store.rescore_factor = factor
+                found, latencies = [], []
+                for query in queries:
+                    started = time.perf_counter()
+                    found.append([row for row, _ in store.search_vector(query, K)])
+                    latencies.append((time.perf_counter() - started) * 1000)
+                recall = recall_at_k(np.array(found), truth)
+                verdict = "OK" if recall >= 1.0 - RECALL_TOLERANCE else "NG"
+                print(f"rescore x{factor:<3} recall@{K}={recall:.3f} [{verdict}]  "
+                      f"p50={np.percentile(latencies, 50):.2f}ms  p95={np.percentile(latencies, 95):.2f}ms")
@@ -0,0 +1,203 @@
+# 検索のレイテンシ・再現率ベンチマーク（OpenAI APIを使わない）
+#
+# 合成コーパス（1万〜100万チャンク）を vector_store.py と同じ設定で分割し、決定的なローカル埋め込み
+# （local_embeddings.HashingEmbeddings）で埋め込んで、各バックエンドに登録する。
+# クエリはチャンク内の連続した単語列なので「元のチャンク」が既知の正解になる。
+# 取り込みスループット、p50/p95/p99 レイテンシ、recall@k（全件探索の上位k件が正解）、
+# 元チャンクのhit@k、インデックスのメモリ量を計測し、JSONで BENCH_RESULTS_DIR に書き出す。
+# ベクターストアや分割設定を変えたときの退行チェックに使う。
+
+import json
+import os
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import chromadb
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_text_splitters import CharacterTextSplitter
+
+from faiss_store import make_faiss_index, set_search_params
+from local_embeddings import HashingEmbeddings
+from quantized_store import QuantizedVectorStore
+from streaming_ingest import peak_rss_mb
+
+CORPUS_SIZES = [10_000, 100_000, 1_000_000]
+BACKENDS = ["numpy-exact", "faiss-flat", "faiss-hnsw", "faiss-ivfpq", "quantized-int8", "quantized-binary", "chroma"]
+DIM = 256
+N_TOPICS = 1_000
+WORDS_PER_TOPIC = 200
+WORDS_PER_PARAGRAPH = 110
+PARAGRAPHS_PER_DOC = 8
+QUERY_WORDS = 16
+N_QUERIES = 500
+K = 10
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 0
+NPROBE = 16
+EF_SEARCH = 64
+RESCORE_FACTOR = 10
+CHROMA_BATCH = 5_000
+BENCH_RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results")
+
+
+def synthetic_documents(num_chunks: int, seed: int = 0) -> list[Document]:
+    """
+    トピックごとの語彙から段落を作り、PARAGRAPHS_PER_DOC 段落ずつの文書にまとめる
+
+    段落は CHUNK_SIZE より少し短いので、分割後はおおむね1段落が1チャンクになる。
+    """
+    rng = np.random.default_rng(seed)
+    topics = rng.integers(0, N_TOPICS, num_chunks)
+    word_ids = topics[:, None] * WORDS_PER_TOPIC + rng.integers(0, WORDS_PER_TOPIC, (num_chunks, WORDS_PER_PARAGRAPH))
+    vocabulary = np.array([f"w{i:06d}" for i in range(N_TOPICS * WORDS_PER_TOPIC)])
+    paragraphs = [" ".join(row) for row in vocabulary[word_ids]]
+    return [
+        Document(page_content="\n\n".join(paragraphs[start:start + PARAGRAPHS_PER_DOC]),
+                 metadata={"source": f"doc-{start // PARAGRAPHS_PER_DOC}.md"})
+        for start in range(0, num_chunks, PARAGRAPHS_PER_DOC)
+    ]
+
+
+def make_query_set(chunks: list[Document], n: int, seed: int = 1) -> tuple[list[str], np.ndarray]:
+    """チャンク内の連続した QUERY_WORDS 語をクエリにする。(クエリ, 元チャンクの行番号) を返す"""
+    rng = np.random.default_rng(seed)
+    sources = rng.choice(len(chunks), size=min(n, len(chunks)), replace=False)
+    queries = []
+    for row in sources:
+        words = chunks[row].page_content.split()
+        start = int(rng.integers(0, max(1, len(words) - QUERY_WORDS + 1)))
+        queries.append(" ".join(words[start:start + QUERY_WORDS]))
+    return queries, sources
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """全件探索の上位k件（正解）"""
+    scores = queries @ vectors.T
+    top = np.argpartition(-scores, k, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def build_backend(name: str, vectors: np.ndarray, workdir: str):
+    """
+    バックエンドを構築する
+
+    Returns:
+        tuple: (クエリベクトルから上位K件の行番号を返す関数, インデックスのバイト数)
+    """
+    if name == "numpy-exact":
+        return (lambda q: exact_top_k(vectors, q[None, :], K)[0]), vectors.nbytes
+    if name.startswith("faiss-"):
+        index = make_faiss_index(name.split("-", 1)[1], vectors.shape[1], len(vectors))
+        if not index.is_trained:
+            index.train(vectors[:min(len(vectors), 256 * 1024)])
+        index.add(vectors)
+        set_search_params(index, nprobe=NPROBE, ef_search=EF_SEARCH)
+        return (lambda q: index.search(q[None, :], K)[1][0]), faiss.serialize_index(index).nbytes
+    if name.startswith("quantized-"):
+        directory = os.path.join(workdir, name)
+        QuantizedVectorStore.write(directory, vectors, [""] * len(vectors), [{}] * len(vectors),
+                                   name.split("-", 1)[1])
+        store = QuantizedVectorStore(embedding=None, directory=directory, rescore_factor=RESCORE_FACTOR)
+        return (lambda q: [row for row, _ in store.search_vector(q, K)]), store.memory_bytes()["quantized"]
+    if name == "chroma":
+        directory = os.path.join(workdir, name)
+        collection = chromadb.PersistentClient(path=directory).create_collection(
+            "bench_retrieval", configuration={"hnsw": {"space": "ip"}}
+        )
+        for start in range(0, len(vectors), CHROMA_BATCH):
+            end = min(start + CHROMA_BATCH, len(vectors))
+            collection.add(ids=[str(i) for i in range(start, end)], embeddings=vectors[start:end])
+        search = lambda q: [int(i) for i in collection.query(query_embeddings=[q], n_results=K)["ids"][0]]
+        return search, directory_bytes(directory)
+    raise ValueError(f"未対応のバックエンドです: {name}")
+
+
+def latency_summary(latencies: list[float]) -> dict:
+    return {f"p{p}_ms": round(float(np.percentile(latencies, p)), 3) for p in (50, 95, 99)}
+
+
+def run_corpus(num_chunks: int, embeddings: HashingEmbeddings, text_splitter) -> dict:
+    """1つのコーパスサイズについて、全バックエンドを計測する"""
+    documents = synthetic_documents(num_chunks)
+    started = time.perf_counter()
+    chunks = text_splitter.split_documents(documents)
+    split_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    vectors = np.asarray(embeddings.embed_documents([c.page_content for c in chunks]), dtype=np.float32)
+    embed_seconds = time.perf_counter() - started
+
+    query_texts, sources = make_query_set(chunks, N_QUERIES)
+    queries = np.asarray(embeddings.embed_documents(query_texts), dtype=np.float32)
+    truth = exact_top_k(vectors, queries, K)
+    result = {
+        "chunks": len(chunks),
+        "split_seconds": round(split_seconds, 3),
+        "embed_chunks_per_sec": round(len(chunks) / embed_seconds, 1),
+        "backends": {},
+    }
+    print(f"\n=== {len(chunks)} チャンク（分割 {split_seconds:.1f}秒、埋め込み {embed_seconds:.1f}秒） ===")
+
+    for name in BACKENDS:
+        with tempfile.TemporaryDirectory() as workdir:
+            started = time.perf_counter()
+            search, index_bytes = build_backend(name, vectors, workdir)
+            build_seconds = time.perf_counter() - started
+            found, latencies = [], []
+            for query in queries:
+                started = time.perf_counter()
+                found.append(list(search(query)))
+                latencies.append((time.perf_counter() - started) * 1000)
+        recall = float(np.mean([len(set(f) & set(t)) / K for f, t in zip(found, truth)]))
+        hit = float(np.mean([source in f for f, source in zip(found, sources)]))
+        metrics = {
+            "ingest_chunks_per_sec": round(len(chunks) / build_seconds, 1),
+            "build_seconds": round(build_seconds, 3),
+            **latency_summary(latencies),
+            f"recall@{K}": round(recall, 4),
+            f"source_hit@{K}": round(hit, 4),
+            "index_mb": round(index_bytes / 1e6, 2),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+        result["backends"][name] = metrics
+        print(f"{name:<17} 取り込み {metrics['ingest_chunks_per_sec']:>10.0f}件/秒  "
+              f"p50={metrics['p50_ms']:.2f}ms p95={metrics['p95_ms']:.2f}ms p99={metrics['p99_ms']:.2f}ms  "
+              f"recall@{K}={recall:.3f} hit@{K}={hit:.3f}  {metrics['index_mb']:.1f}MB")
+    return result
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    embeddings = HashingEmbeddings(dimensions=DIM)
+    text_splitter = CharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "embedding": embeddings.model,
+        "splitter": {"type": type(text_splitter).__name__, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP},
+        "params": {"k": K, "n_queries": N_QUERIES, "nprobe": NPROBE, "ef_search": EF_SEARCH,
+                   "rescore_factor": RESCORE_FACTOR},
+        "corpora": [run_corpus(size, embeddings, text_splitter) for size in CORPUS_SIZES],
+    }
+
+    os.makedirs(BENCH_RESULTS_DIR, exist_ok=True)
+    output_path = os.path.join(BENCH_RESULTS_DIR, f"retrieval-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n結果を書き出しました: {output_path}")
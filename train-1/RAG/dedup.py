@@ -0,0 +1,124 @@
+# 埋め込み前のチャンク重複除去（完全一致ハッシュ + MinHash/LSHによる近似重複検出）
+#
+# インストール手順・注意書き・APIリファレンスのスタブなど、ドキュメント中で何度も現れる
+# 定型チャンクを1つにまとめ、まとめた元ファイルのパスをメタデータ "source_paths" に残す。
+
+import hashlib
+import re
+
+import numpy as np
+from langchain_core.documents import Document
+
+_WHITESPACE = re.compile(r"\s+")
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+
+
+def normalize_for_hash(text: str) -> str:
+    """空白の違いと大文字・小文字を無視するための正規化"""
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+def shingle_hashes(text: str, k: int = 5) -> np.ndarray:
+    """
+    文字k-gram（シングル）のハッシュ値をNumPyでまとめて計算する
+
+    日本語と英語が混在しても扱えるよう、単語ではなく文字単位のシングルを使う。
+
+    Returns:
+        np.ndarray: uint64 のハッシュ値（重複除去済み）
+    """
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < k:
+        codes = np.pad(codes, (0, k - len(codes)))
+    # 多項式ローリングハッシュをk回のずらし加算で計算
+    hashes = np.zeros(len(codes) - k + 1, dtype=np.uint64)
+    for j in range(k):
+        hashes = hashes * np.uint64(1_000_003) + codes[j:len(codes) - k + 1 + j]
+    return np.unique(hashes % _MERSENNE_PRIME)
+
+
+class MinHasher:
+    """
+    MinHash署名を計算する
+
+    Args:
+        num_perm (int): ハッシュ関数（署名の長さ）の数
+        seed (int): ハッシュ関数の係数を決める乱数シード
+    """
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        # multiply-shift法: 64bitの奇数係数を掛けて（2^64で折り返し）上位32bitを取る
+        self.a = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str, k: int = 5) -> np.ndarray:
+        hashes = shingle_hashes(text, k) & np.uint64(0xFFFFFFFF)
+        permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) >> np.uint64(32)
+        return permuted.min(axis=1).astype(np.uint32)
+
+
+def deduplicate(chunks: list[Document], threshold: float = 0.85, num_perm: int = 128,
+                bands: int = 16, shingle_size: int = 5) -> tuple[list[Document], dict]:
+    """
+    完全一致と近似重複のチャンクを1つにまとめる
+
+    最初に現れたチャンクを代表とし、重複したチャンクのファイルパスを代表のメタデータ
+    "source_paths"（リスト）に追加する。"duplicate_count" はまとめたチャンク数。
+
+    Args:
+        chunks (list[Document]): 分割後のチャンク
+        threshold (float): 近似重複とみなす推定Jaccard類似度の下限
+        num_perm (int): MinHash署名の長さ
+        bands (int): LSHのバンド数（num_perm を割り切れる数）
+        shingle_size (int): 文字シングルの長さ
+
+    Returns:
+        tuple[list[Document], dict]: (重複を除いたチャンク, 完全一致・近似重複の件数)
+    """
+    rows = num_perm // bands
+    hasher = MinHasher(num_perm)
+    unique, signatures = [], []
+    exact_index, buckets = {}, {}
+    stats = {"input": len(chunks), "exact_duplicates": 0, "near_duplicates": 0}
+
+    def merge(representative: Document, duplicate: Document) -> None:
+        path = duplicate.metadata.get("file_path") or duplicate.metadata.get("source")
+        if path and path not in representative.metadata["source_paths"]:
+            representative.metadata["source_paths"].append(path)
+        representative.metadata["duplicate_count"] += 1
+
+    for chunk in chunks:
+        normalized = normalize_for_hash(chunk.page_content)
+        digest = hashlib.sha1(normalized.encode("utf-8")).digest()
+        if digest in exact_index:
+            merge(unique[exact_index[digest]], chunk)
+            stats["exact_duplicates"] += 1
+            continue
+
+        signature = hasher.signature(normalized, shingle_size)
+        band_keys = [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(bands)]
+        candidates = {index for key in band_keys for index in buckets.get(key, ())}
+        match = next(
+            (index for index in sorted(candidates)
+             if np.mean(signatures[index] == signature) >= threshold),
+            None,
+        )
+        if match is not None:
+            merge(unique[match], chunk)
+            stats["near_duplicates"] += 1
+            continue
+
+        path = chunk.metadata.get("file_path") or chunk.metadata.get("source")
+        representative = Document(
+            page_content=chunk.page_content,
+            metadata={**chunk.metadata, "source_paths": [path] if path else [], "duplicate_count": 1},
+        )
+        exact_index[digest] = len(unique)
+        for key in band_keys:
+            buckets.setdefault(key, []).append(len(unique))
+        unique.append(representative)
+        signatures.append(signature)
+
+    stats["output"] = len(unique)
+    return unique, stats
@@ -0,0 +1,248 @@
+# サイトマップ（または開始URL）から辿る差分クローラー
+#
+# 前回のクロール結果（URLごとの本文ハッシュ・sitemapのlastmod・ページ内リンク）を状態ファイルに保存し、
+#   1. サイトマップの lastmod が前回と同じページは取得しない
+#   2. 取得するページも web_fetcher の条件付きGETで問い合わせ、304 で検証子が前回処理したときと同じなら解析しない
+#   3. 解析したページも、抽出した本文のハッシュが前回と同じなら出力しない
+# の3段階で、新しいページと内容が変わったページのDocumentだけをRAGの取り込みに渡す。
+# URLは正規化（フラグメント・トラッキング用パラメーターの除去、末尾スラッシュの統一など）してから比較する。
+# 正規化したURLは状態のキーにだけ使い、取得には元のURLを、相対リンクの解決にはレスポンスの最終URLを使う
+# （末尾スラッシュを除いたURLを基準にすると、ディレクトリのページの相対リンクが1階層上にずれるため）。
+
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import time
+from urllib.parse import parse_qsl, urldefrag, urlencode, urlsplit, urlunsplit
+
+import aiohttp
+from lxml import etree
+
+from html_extractor import parse_page
+from web_fetcher import DEFAULT_PER_HOST_LIMIT, HttpCache, WebFetcher
+
+DEFAULT_STATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".docs_crawl_state.json")
+DEFAULT_MAX_PAGES = 10_000
+# 取り除くクエリパラメーター（完全一致と接頭辞）
+TRACKING_PARAMS = frozenset({"gclid", "fbclid", "msclkid", "yclid", "mc_cid", "mc_eid", "ref", "ref_src", "_ga", "_gl"})
+TRACKING_PREFIXES = ("utm_",)
+# HTMLではないので辿らない拡張子
+SKIP_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico", ".pdf", ".zip", ".gz", ".tar",
+                   ".css", ".js", ".json", ".xml", ".txt", ".mp4", ".mp3", ".woff", ".woff2", ".ttf")
+_SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+
+def normalize_url(url: str) -> str:
+    """
+    URLを正規化する（同じページを指すURLを1つにまとめる）
+
+    - スキームとホスト名を小文字にし、既定のポート（:80 / :443）を除く
+    - フラグメント（#以降）とトラッキング用のパラメーター（utm_* / gclid など）を除き、残りを並べ替える
+    - パスの末尾のスラッシュを除く（ルートの "/" は残す）。連続するスラッシュは1つにする
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    path = "/".join(segment for segment in parts.path.split("/") if segment)
+    path = "/" + path if path else "/"
+    query = urlencode(sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                             if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def content_hash(text: str) -> str:
+    """抽出した本文のハッシュ（空白の違いは無視する）"""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def parse_sitemap(xml: bytes) -> tuple[list[tuple[str, str]], list[str]]:
+    """
+    サイトマップを解析する
+
+    Returns:
+        tuple: ([(ページのURL, lastmod)], [子サイトマップのURL])（サイトマップインデックスなら後者に入る）
+    """
+    if xml[:2] == b"\x1f\x8b":
+        xml = gzip.decompress(xml)
+    root = etree.fromstring(xml, parser=etree.XMLParser(resolve_entities=False, no_network=True, recover=True))
+    pages, sitemaps = [], []
+    for entry in root:
+        loc = entry.findtext(f"{_SITEMAP_NS}loc") or entry.findtext("loc")
+        if not loc:
+            continue
+        if entry.tag in (f"{_SITEMAP_NS}sitemap", "sitemap"):
+            sitemaps.append(loc.strip())
+        else:
+            pages.append((loc.strip(), (entry.findtext(f"{_SITEMAP_NS}lastmod") or entry.findtext("lastmod") or "").strip()))
+    return pages, sitemaps
+
+
+class DocsCrawler:
+    """
+    ドキュメントサイトを差分クロールし、新規・変更ページのDocumentだけを返す
+
+    Args:
+        state_path (str): 前回のクロール結果を保存するJSONファイル
+        cache (HttpCache | None): 条件付きGETに使うキャッシュ（省略時は web_fetcher の既定の場所）
+        scope (str | None): このURLで始まるページだけを辿る（省略時は開始URL / サイトマップと同じホスト）
+        max_pages (int): 1回のクロールで取得する最大ページ数
+        per_host_limit (int): ホストごとの同時接続数
+    """
+
+    def __init__(self, state_path: str = DEFAULT_STATE_PATH, cache: HttpCache = None, scope: str = None,
+                 max_pages: int = DEFAULT_MAX_PAGES, per_host_limit: int = DEFAULT_PER_HOST_LIMIT):
+        self.state_path = state_path
+        self.cache = cache or HttpCache()
+        self.scope = scope
+        self.max_pages = max_pages
+        self.per_host_limit = per_host_limit
+        self.pages = {}
+        if os.path.exists(state_path):
+            with open(state_path, encoding="utf-8") as f:
+                self.pages = json.load(f)["pages"]
+        self.stats = {}
+        self._gone = []
+
+    def _save_state(self) -> None:
+        with open(self.state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"pages": self.pages}, f, ensure_ascii=False)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def _validators(self, url: str) -> list:
+        # キャッシュに保存されている ETag / Last-Modified（処理した時点のものを状態ファイルに残す）
+        cached = self.cache.get(url) or {}
+        return [cached.get("etag"), cached.get("last_modified")]
+
+    def _in_scope(self, url: str) -> bool:
+        return url.startswith(self.scope) and not urlsplit(url).path.lower().endswith(SKIP_EXTENSIONS)
+
+    async def _sitemap_pages(self, fetcher: WebFetcher, sitemap_url: str) -> dict[str, tuple[str, str]]:
+        # サイトマップインデックスは子サイトマップを順に展開する（{正規化したURL: (loc, lastmod)}）
+        pages, pending, seen = {}, [sitemap_url], set()
+        while pending:
+            url = pending.pop()
+            if url in seen:
+                continue
+            seen.add(url)
+            async with fetcher.session.get(url) as response:
+                response.raise_for_status()
+                entries, children = parse_sitemap(await response.read())
+            for loc, lastmod in entries:
+                pages.setdefault(normalize_url(loc), (loc, lastmod))
+            pending.extend(children)
+        return pages
+
+    async def _visit(self, fetcher: WebFetcher, url: str, fetch_url: str, lastmod: str, changed: list) -> list[str]:
+        # 1ページを処理し、ページ内のリンクを返す（url は正規化したURL、fetch_url は取得に使う元のURL）
+        previous = self.pages.get(url)
+        if previous and lastmod and previous.get("lastmod") == lastmod:
+            self.stats["skipped_lastmod"] += 1
+            return previous.get("links", [])
+        try:
+            page = await fetcher.fetch(fetch_url)
+        except aiohttp.ClientResponseError as e:
+            if e.status in (404, 410) and previous:
+                # 前回あったページが消えた
+                del self.pages[url]
+                self._gone.append(url)
+                return []
+            print(f"取得に失敗しました: {url} ({e})")
+            self.stats["errors"] += 1
+            return previous.get("links", []) if previous else []
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"取得に失敗しました: {url} ({e})")
+            self.stats["errors"] += 1
+            # 一時的な失敗でページが消えたと判定しないよう、前回の状態を残す
+            return previous.get("links", []) if previous else []
+        validators = self._validators(fetch_url)
+        if page["not_modified"] and previous and previous.get("validators") == validators:
+            # 304 で、かつ前回このクローラーが処理したときと同じ検証子なら内容は変わっていない
+            # （キャッシュは他のローダーと共有しているので、検証子が違えば保存済みの本文を解析して比べる）
+            self.stats["not_modified"] += 1
+            previous["lastmod"] = lastmod
+            return previous.get("links", [])
+        doc, links = parse_page(page["text"], page["final_url"])
+        doc.metadata["source"] = url
+        links = sorted({urldefrag(link)[0] for link in links if link.startswith(("http://", "https://"))})
+        digest = content_hash(doc.page_content)
+        self.pages[url] = {"hash": digest, "lastmod": lastmod, "links": links, "validators": validators}
+        if previous and previous.get("hash") == digest:
+            self.stats["unchanged"] += 1
+        else:
+            self.stats["changed" if previous else "new"] += 1
+            doc.metadata["content_hash"] = digest
+            changed.append(doc)
+        return links
+
+    async def acrawl(self, start_url: str = None, sitemap_url: str = None, follow_links: bool = None):
+        """
+        クロールして、新規・変更ページの文書と消えたページのURLを返す
+
+        Args:
+            start_url (str | None): ここからリンクを辿る
+            sitemap_url (str | None): サイトマップ（インデックス）のURL。指定するとそこに載ったページを対象にする
+            follow_links (bool | None): ページ内のリンクも辿るか（省略時はサイトマップがなければ辿る）
+
+        Returns:
+            tuple[list[Document], list[str], dict]: (新規・変更ページの文書, 消えたページのURL, 統計)
+        """
+        if not start_url and not sitemap_url:
+            raise ValueError("start_url か sitemap_url を指定してください")
+        started = time.perf_counter()
+        follow_links = not sitemap_url if follow_links is None else follow_links
+        seed = normalize_url(start_url or sitemap_url)
+        if self.scope is None:
+            parts = urlsplit(seed)
+            self.scope = f"{parts.scheme}://{parts.netloc}/"
+        self.stats = {"pages": 0, "new": 0, "changed": 0, "unchanged": 0, "not_modified": 0, "skipped_lastmod": 0,
+                      "errors": 0, "deleted": 0}
+        changed = []
+        self._gone = []
+
+        async with WebFetcher(self.cache, per_host_limit=self.per_host_limit) as fetcher:
+            frontier = {}
+            if sitemap_url:
+                frontier = {url: entry for url, entry in (await self._sitemap_pages(fetcher, sitemap_url)).items()
+                            if self._in_scope(url)}
+            if start_url:
+                frontier.setdefault(seed, (start_url.strip(), ""))
+            # max_pages で打ち切られても未取得のページが後回しになり続けないよう、状態にないページから処理する
+            frontier = dict(sorted(frontier.items(), key=lambda item: item[0] in self.pages))
+            visited = set()
+            # 見つかったページを段ごとにまとめて並行に処理する（同時接続数は WebFetcher が制限する）
+            while frontier and len(visited) < self.max_pages:
+                batch = dict(list(frontier.items())[:self.max_pages - len(visited)])
+                visited.update(batch)
+                results = await asyncio.gather(*(self._visit(fetcher, url, fetch_url, lastmod, changed)
+                                                 for url, (fetch_url, lastmod) in batch.items()))
+                # max_pages で切り詰めた残りは次回に回す（辿り切っていないので削除の判定もしない）
+                frontier = {url: entry for url, entry in frontier.items() if url not in batch}
+                if follow_links:
+                    for links in results:
+                        for link in links:
+                            key = normalize_url(link)
+                            if key not in visited and self._in_scope(key):
+                                frontier.setdefault(key, (link, ""))
+            complete = not frontier
+
+        # 最後まで辿れたときだけ、今回見つからなかったページを消えたとみなす
+        deleted = self._gone
+        if complete:
+            missing = sorted(url for url in self.pages if url not in visited and url.startswith(self.scope))
+            for url in missing:
+                del self.pages[url]
+            deleted = deleted + missing
+        self._save_state()
+        seconds = time.perf_counter() - started
+        self.stats.update(pages=len(visited), deleted=len(deleted), fetched=fetcher.stats["fetched"],
+                          bytes=fetcher.stats["bytes"], seconds=seconds,
+                          pages_per_sec=len(visited) / seconds if seconds else 0.0)
+        return changed, deleted, self.stats
+
+    def crawl(self, start_url: str = None, sitemap_url: str = None, follow_links: bool = None):
+        """acrawl() の同期版"""
+        return asyncio.run(self.acrawl(start_url, sitemap_url, follow_links))
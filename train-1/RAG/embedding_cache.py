@@ -0,0 +1,188 @@
+# 埋め込みベクトルのディスクキャッシュ（RAGスクリプト共通）
+#
+# (モデル名, 次元数, 正規化したテキストのハッシュ) をキーに、float32のバイト列をSQLiteへ保存する。
+# 同じテキストを再度埋め込むときはAPIを呼ばずにキャッシュから返す。
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from local_embeddings import CharNgramEmbeddings
+from matryoshka import TruncatedEmbeddings
+
+DEFAULT_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".embedding_cache.sqlite3"),
+)
+DEFAULT_MAX_ENTRIES = 1_000_000
+# 埋め込みのバックエンド: "openai"（OpenAIEmbeddings + ディスクキャッシュ）/ "local"（ネットワーク不要の文字n-gram）
+EMBEDDING_BACKEND = os.getenv("RAG_EMBEDDING_BACKEND", "openai")
+EMBEDDING_BACKENDS = ("openai", "local")
+LOCAL_EMBEDDING_DIMENSIONS = 1024
+
+# SQLiteのプレースホルダー数の上限を超えないように分割して問い合わせる
+_SQL_BATCH = 500
+
+
+def normalize_text(text: str) -> str:
+    """キャッシュキー用にテキストを正規化する（Unicode NFC + 前後の空白除去）"""
+    return unicodedata.normalize("NFC", text).strip()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddingsをラップし、結果をSQLiteに永続化するキャッシュ
+
+    Args:
+        underlying (Embeddings): 実際に埋め込みを計算するEmbeddings
+        model_name (str | None): キーに含めるモデル名（省略時は underlying.model）
+        dimensions (int | None): キーに含める次元数（省略時は underlying.dimensions）
+        path (str): SQLiteファイルのパス
+        max_entries (int): 保存する最大件数。超えた分は最終利用が古いものから削除（LRU）
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str = None, dimensions: int = None,
+                 path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.underlying = underlying
+        self.model_name = model_name or getattr(underlying, "model", type(underlying).__name__)
+        self.dimensions = dimensions if dimensions is not None else getattr(underlying, "dimensions", None)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _key(self, text: str) -> bytes:
+        raw = f"{self.model_name}\x00{self.dimensions}\x00{normalize_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).digest()
+
+    def _lookup(self, keys: list[bytes]) -> dict:
+        found = {}
+        for start in range(0, len(keys), _SQL_BATCH):
+            batch = keys[start:start + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            )
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def _touch(self, keys: list[bytes]) -> None:
+        now = time.time()
+        self._conn.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in keys]
+        )
+
+    def _store(self, items: list[tuple[bytes, list[float]]]) -> None:
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+            [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items],
+        )
+        self._count += len(items)
+        if self._count > self.max_entries:
+            self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            overflow = self._count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN"
+                    " (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (overflow,)
+                )
+                self._count -= overflow
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self._key(text) for text in texts]
+        with self._lock:
+            found = self._lookup(keys)
+            self._touch(list(found))
+            self._conn.commit()
+
+        # キャッシュにないテキストだけを（重複を除いて）まとめて埋め込む
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            # 初回とキャッシュ経由で同じ値になるよう、float32に丸めて返す
+            vectors = np.asarray(vectors, dtype=np.float32).tolist()
+            new_items = list(zip(missing.keys(), vectors))
+            found.update(new_items)
+            with self._lock:
+                self._store(new_items)
+                self._conn.commit()
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        key = self._key(text)
+        with self._lock:
+            found = self._lookup([key])
+            if found:
+                self._touch([key])
+                self._conn.commit()
+        if found:
+            self.hits += 1
+            return found[key]
+        self.misses += 1
+        vector = np.asarray(self.underlying.embed_query(text), dtype=np.float32).tolist()
+        with self._lock:
+            self._store([(key, vector)])
+            self._conn.commit()
+        return vector
+
+    def stats(self) -> dict:
+        """ヒット／ミス数とキャッシュ件数を返す"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self._count,
+        }
+
+
+def get_embeddings(dimensions: int = None, reduction: str = "api", backend: str = None, **kwargs) -> Embeddings:
+    """
+    キャッシュ付きのOpenAIEmbeddings（またはローカルの埋め込み）を作成する
+
+    Args:
+        dimensions (int | None): 次元数を減らす場合の次元数（Noneならモデルのフルサイズ）
+        reduction (str): 次元の減らし方
+            "api": APIの dimensions パラメーターで縮小したベクトルを取得する
+            "truncate": フルサイズのベクトルをキャッシュし、ローカルで切り詰めて再正規化する
+        backend (str | None): "openai" または "local"（省略時は環境変数 RAG_EMBEDDING_BACKEND）
+            "local" では model / reduction を無視し、dimensions 次元の CharNgramEmbeddings を返す
+        **kwargs: OpenAIEmbeddingsにそのまま渡す引数（model など）
+
+    Returns:
+        Embeddings: キャッシュでラップしたEmbeddings
+    """
+    backend = backend or EMBEDDING_BACKEND
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"未対応の埋め込みバックエンドです: {backend}（{EMBEDDING_BACKENDS} から選択）")
+    if backend == "local":
+        # 計算の方がSQLiteを引くより速いので、キャッシュでラップしない
+        return CharNgramEmbeddings(dimensions or LOCAL_EMBEDDING_DIMENSIONS)
+    if dimensions and reduction == "truncate":
+        return TruncatedEmbeddings(CachedEmbeddings(OpenAIEmbeddings(**kwargs)), dimensions)
+    if dimensions:
+        kwargs["dimensions"] = dimensions
+    return CachedEmbeddings(OpenAIEmbeddings(**kwargs))
@@ -1,12 +1,15 @@
-from langchain_openai import OpenAIEmbeddings
 from dotenv import load_dotenv
+
+from embedding_cache import get_embeddings
+
 load_dotenv()
 
 
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+embeddings = get_embeddings(model="text-embedding-3-small")
 
 query = "AWSのS3からデータを読み込むためのDocument loaderはありますか？"
 
 vector = embeddings.embed_query(query)
 print(len(vector))  # ベクトルの次元数の表示
 print(vector)  # 埋め込みベクトルの表示
+print(embeddings.stats())  # キャッシュのヒット／ミス数
@@ -1,34 +1,48 @@
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
 from langchain_openai import ChatOpenAI
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.documents import Document
 from dotenv import load_dotenv
 import os
-import pandas as pd
+import sys
+import time
+
+# 親ディレクトリ（train-1/RAG）の共通モジュールを読み込む
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from embedding_cache import get_embeddings
+from semantic_cache import SemanticCache, context_key, file_version
+from snapshot import SnapshotVectorStore, export_snapshot, snapshot_info
+from excel_index import DEFAULT_INDEX_DIRECTORY, embedding_settings, open_excel_index
 
 
 load_dotenv()
 
 file_path = 'data/sample.xlsx'
-
-# Load Excel file using pandas
-df = pd.read_excel(file_path)
-
-# Convert DataFrame to documents
-docs = []
-for index, row in df.iterrows():
-    # Convert each row to a string representation, handling NaN values
-    content = ' | '.join([f"{col}: {str(row[col]) if pd.notna(row[col]) else 'N/A'}" for col in df.columns])
-    doc = Document(
-        page_content=content,
-        metadata={"row": index, "source": file_path}
-    )
-    docs.append(doc)
-
-vector_stores = Chroma.from_documents(docs, OpenAIEmbeddings())
+# 行ドキュメントのスナップショット。ブックと埋め込みモデルが書き出し時と同じなら埋め込みをせずにmmapで開き、
+# なければ（またはブックが変わっていれば）行インデックスを更新してから書き出し直す
+snapshot_directory = os.getenv("EXCEL_SNAPSHOT_DIRECTORY")
+# 行インデックスの保存先。ブックが前回と同じなら埋め込まずに開き、変わっていれば変わった行だけを埋め込み直す
+index_directory = os.getenv("EXCEL_INDEX_DIRECTORY", DEFAULT_INDEX_DIRECTORY)
+# 回答のセマンティックキャッシュ。直近 ANSWER_CACHE_HISTORY_TURNS 回の会話とブックの内容が同じで、
+# 質問の類似度が ANSWER_CACHE_THRESHOLD 以上なら、検索とLLMを呼ばずに前回の回答を返す
+ANSWER_CACHE_THRESHOLD = float(os.getenv("EXCEL_ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_SECONDS = 3600
+ANSWER_CACHE_MAX_ENTRIES = 1000
+ANSWER_CACHE_HISTORY_TURNS = 1
+
+embeddings = get_embeddings()
+workbook_version = file_version(file_path)
+snapshot_key = {"workbook": workbook_version, "embedding": embedding_settings(embeddings)}
+if snapshot_directory and snapshot_info(snapshot_directory) == snapshot_key:
+    vector_stores = SnapshotVectorStore(embeddings, snapshot_directory)
+else:
+    # 永続化したChromaを開き、ブックの変更があった行だけを埋め込み直す
+    vector_stores, index_stats = open_excel_index(file_path, embeddings, index_directory)
+    print(f"行インデックス: {index_stats['status']}（{index_stats['rows']}行、埋め込み {index_stats['embedded']}行、"
+          f"削除 {index_stats['deleted']}行、{index_stats['seconds'] * 1000:.0f}ms）")
+    # 埋め込めなかった行がある（incomplete）ときは、次回の起動で埋め込み直してから書き出す
+    if snapshot_directory and index_stats["status"] != "incomplete":
+        export_snapshot(vector_stores, snapshot_directory, info=snapshot_key)
 retriever = vector_stores.as_retriever(search_kwargs={'k': 1})
 
 # create chatbot
@@ -69,21 +83,36 @@ qa_chain = (
     | output_parser
 )
 
+answer_cache = SemanticCache(embeddings, threshold=ANSWER_CACHE_THRESHOLD, ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+                             max_entries=ANSWER_CACHE_MAX_ENTRIES)
 # interaction
 chat_history = []
 for _ in range(10):
     query = input("ボットへの質問: ")
-
-    # Get answer
-    result = qa_chain.invoke({"question": query, "chat_history": chat_history})
-
-    # Get source documents
-    source_docs = retriever.invoke(query)
+    started = time.perf_counter()
+    context = context_key(chat_history, workbook_version, ANSWER_CACHE_HISTORY_TURNS)
+    cached, query_vector = answer_cache.lookup(query, context)
+
+    if cached is None:
+        # Get answer
+        result = qa_chain.invoke({"question": query, "chat_history": chat_history})
+
+        # Get source documents
+        source_docs = retriever.invoke(query)
+        answer_cache.store(query, (result, source_docs), context, query_vector)
+        # 同じ質問を続けて聞き直したときは、この回答を含む履歴が文脈になるので、その文脈にも保存しておく
+        repeat_context = context_key(chat_history + [(query, result)], workbook_version, ANSWER_CACHE_HISTORY_TURNS)
+        answer_cache.store(query, (result, source_docs), repeat_context, query_vector)
+    else:
+        result, source_docs = cached
 
     chat_history.append((query, result))
     print("\n")
     print("Answer: ", result)
+    print(f"（{'キャッシュ' if cached is not None else 'LLM'}、{(time.perf_counter() - started) * 1000:.1f}ms）")
     print("\n")
     if source_docs:
         print("Source document: ", source_docs[0].page_content)
     print("\n")
+
+print(f"回答キャッシュ: {answer_cache.stats()}")
@@ -0,0 +1,139 @@
+# Excelの行インデックスを永続化し、ブックが変わったときは変わった行だけを埋め込み直す
+#
+# 起動のたびに全行を埋め込んでChromaを作り直すと、質問できるまでに行数分の埋め込みがかかる。
+# ここではChromaを persist_directory に保存し、manifest.json にブックのチェックサムと埋め込みモデルを記録する。
+#   - チェックサムもモデルも同じなら、保存済みのインデックスをそのまま開く（埋め込みなし）
+#   - ブックだけが変わったら、行の本文のハッシュをIDにして、新しい本文の行だけを埋め込み、
+#     なくなった行を削除する。本文が同じで位置だけ変わった行は metadata の行番号だけを書き換える
+#   - 埋め込みモデルなどが変わったら作り直す
+# マニフェストはインデックスの更新が終わってから最後に書くので、途中で落ちた場合は次回もう一度差分を取り直す。
+
+import hashlib
+import os
+import sys
+import time
+
+from langchain_community.vectorstores import Chroma
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from batch_embedder import embed_into
+from index_manifest import load_manifest, manifest_diff, save_manifest
+from semantic_cache import file_version
+
+from excel_stream import DEFAULT_CHUNK_SIZE, iter_excel_documents
+
+INDEX_VERSION = 1
+DEFAULT_INDEX_DIRECTORY = ".excel_index"
+# Chromaへの削除・metadata更新を1回で送る件数
+UPDATE_BATCH_SIZE = 1000
+
+
+def row_id(text: str, seen: dict) -> str:
+    """
+    行の本文からIDを作る（同じ本文の行が複数あれば、2件目以降に "-<連番>" を付ける）
+
+    Args:
+        text (str): 行の page_content
+        seen (dict): これまでに出てきたIDの件数（呼び出し側で1つのブックにつき1つ用意する）
+
+    Returns:
+        str: "row-<本文のSHA-256の先頭32文字>[-<連番>]"
+    """
+    base = "row-" + hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+    count = seen.get(base, 0)
+    seen[base] = count + 1
+    return f"{base}-{count}" if count else base
+
+
+def embedding_settings(embeddings) -> dict:
+    """埋め込みモデル名と次元数（キャッシュなどのラッパーは外して調べる）"""
+    model = dimensions = None
+    while embeddings is not None:
+        model = model or getattr(embeddings, "model", None)
+        dimensions = dimensions or getattr(embeddings, "dimensions", None)
+        embeddings = getattr(embeddings, "underlying", None)
+    return {"model": model, "dimensions": dimensions}
+
+
+def _batches(items: list, size: int = UPDATE_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def open_excel_index(file_path: str, embeddings, directory: str = DEFAULT_INDEX_DIRECTORY, sheet_name: str = None,
+                     chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    永続化した行インデックスを開き、ブックの変更があれば差分だけを反映する
+
+    Args:
+        file_path (str): Excelファイルのパス
+        embeddings: 埋め込みモデル
+        directory (str): インデックスを保存するディレクトリ
+        sheet_name (str | None): シート名（省略時は先頭のシート）
+        chunk_size (int): 一度に読み込む行数
+
+    Returns:
+        tuple[Chroma, dict]: (ベクターストア, 統計)
+            統計は status（"unchanged" / "updated" / "rebuilt" / "incomplete"）、workbook（チェックサム）、rows、
+            embedded（埋め込んだ行数）、moved（行番号だけ更新した行数）、deleted、seconds
+    """
+    started = time.perf_counter()
+    workbook = file_version(file_path)
+    manifest = {
+        "version": INDEX_VERSION,
+        "workbook": workbook,
+        "sheet": sheet_name,
+        "embedding": embedding_settings(embeddings),
+    }
+    stats = {"status": "unchanged", "workbook": workbook, "rows": 0, "embedded": 0, "moved": 0, "deleted": 0}
+    mismatched = manifest_diff(directory, manifest)
+    db = Chroma(persist_directory=directory, embedding_function=embeddings)
+    if not mismatched:
+        stats["rows"] = db._collection.count()
+        stats["seconds"] = time.perf_counter() - started
+        return db, stats
+
+    if mismatched == ["workbook"]:
+        stats["status"] = "updated"
+    else:
+        # 埋め込みモデルなどが変わった（または初回）ので、保存済みの行は使えない
+        stats["status"] = "rebuilt"
+        if load_manifest(directory) is not None:
+            db.delete_collection()
+            db = Chroma(persist_directory=directory, embedding_function=embeddings)
+
+    # 保存済みの行はChroma自体から読む（途中で落ちた回に追加された行も含めて差分を取るため）
+    stored = db._collection.get(include=["metadatas"])
+    stored_rows = {stored_id: (metadata or {}).get("row")
+                   for stored_id, metadata in zip(stored["ids"], stored["metadatas"])}
+
+    seen, current, moved = {}, set(), []
+
+    def new_rows():
+        # ブックを読みながら、保存済みでない本文の行だけを埋め込みに回す
+        for doc in iter_excel_documents(file_path, sheet_name, chunk_size):
+            chunk_id = row_id(doc.page_content, seen)
+            current.add(chunk_id)
+            if chunk_id not in stored_rows:
+                yield chunk_id, doc
+            elif stored_rows[chunk_id] != doc.metadata["row"]:
+                moved.append((chunk_id, doc.metadata))
+
+    embedded = embed_into(new_rows(), embeddings, db)
+    stats["embedded"] = embedded["chunks"]
+    for batch in _batches(moved):
+        db._collection.update(ids=[chunk_id for chunk_id, _ in batch], metadatas=[metadata for _, metadata in batch])
+    deleted = [chunk_id for chunk_id in stored_rows if chunk_id not in current]
+    for batch in _batches(deleted):
+        db.delete(ids=batch)
+
+    if embedded["failed_chunks"]:
+        # 埋め込めなかった行がある。チェックサムを空にして書いておくと、次回はブックの変更として
+        # Chromaにない行（今回失敗した行）だけを埋め込み直す
+        print(f"{embedded['failed_chunks']}行を埋め込めなかったため、次回の起動時に再試行します")
+        stats["status"] = "incomplete"
+        save_manifest(directory, {**manifest, "workbook": None})
+    else:
+        save_manifest(directory, manifest)
+    stats.update(rows=len(current), moved=len(moved), deleted=len(deleted), seconds=time.perf_counter() - started)
+    return db, stats
@@ -0,0 +1,136 @@
+# 大きなExcelブックを行チャンク単位で読み、行ごとのDocumentを順に返すストリーミング変換
+#
+# pd.read_excel でブック全体をDataFrameに読み込み、df.iterrows() とセルごとのリスト内包表記で
+# 行の文字列を作る方法は、数十万行のシートでは遅く、全行分のDataFrameとSeriesでメモリも大きくなる。
+# ここでは openpyxl の read_only モードで行を順に読み、chunk_size 行ずつ
+#   1. 列ごとに「列名: 値」の文字列をまとめて作り（空セルは N/A）
+#   2. 列同士を " | " でまとめて連結する
+# という列単位の処理で行の文字列を作り、Documentをジェネレーターで返す。
+# 同時にメモリに載るのは1チャンク分だけになる。
+
+import os
+
+import numpy as np
+import openpyxl
+from langchain_core.documents import Document
+
+DEFAULT_CHUNK_SIZE = 10_000
+COLUMN_SEPARATOR = " | "
+MISSING_VALUE = "N/A"
+
+
+def _column_names(header) -> list[str]:
+    # pd.read_excel と同じく、空の見出しは "Unnamed: <列番号>"、重複する見出しは "<名前>.<連番>" にする
+    names, seen = [], {}
+    for j, value in enumerate(header):
+        name = f"Unnamed: {j}" if value is None else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        names.append(name)
+    return names
+
+
+def _trim(row) -> tuple:
+    # 書式だけが設定された空のセルなど、行末の空セルを除く（pd.read_excel と同じ）
+    end = len(row)
+    while end and row[end - 1] is None:
+        end -= 1
+    return row[:end]
+
+
+def _cell_strings(values: np.ndarray) -> np.ndarray:
+    # 1列分のセルをまとめて文字列にする（空セルは N/A）
+    strings = np.full(len(values), MISSING_VALUE, dtype=object)
+    present = values != None  # noqa: E711  object配列の要素ごとの比較
+    strings[present] = values[present].astype(str)
+    return strings
+
+
+def rows_to_texts(columns: list[str], rows: list[tuple]) -> list[str]:
+    """
+    行のタプルを「列名: 値 | 列名: 値 | ...」の文字列にする（列ごとにまとめて処理する）
+
+    Args:
+        columns (list[str]): 列名
+        rows (list[tuple]): 行の値（openpyxl の values_only=True の行）
+
+    Returns:
+        list[str]: 行ごとの文字列
+    """
+    width = len(columns)
+    cells = np.full((len(rows), width), None, dtype=object)
+    for i, row in enumerate(rows):
+        cells[i, :len(row)] = row[:width]
+    # 列ごとに「列名: 値」を作り（object配列の + は要素ごとの文字列連結）、最後に1行1回だけ連結する
+    fields = [f"{name}: " + _cell_strings(cells[:, j]) for j, name in enumerate(columns)]
+    return [COLUMN_SEPARATOR.join(row) for row in zip(*fields)]
+
+
+def iter_row_chunks(file_path: str, sheet_name: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    シートを read_only モードで開き、1行目を見出しとして chunk_size 行ずつ返す
+
+    Args:
+        file_path (str): Excelファイルのパス
+        sheet_name (str | None): シート名（省略時は先頭のシート。pd.read_excel と同じ）
+        chunk_size (int): 1チャンクの行数
+
+    Yields:
+        tuple[int, list[str], list[tuple]]: (チャンク先頭の行番号（0始まり、見出しを除く）, 列名, 行)
+    """
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _column_names(_trim(header))
+        start, chunk, blanks = 0, [], []
+        for row in rows:
+            # pd.read_excel と同じく、途中の空行は全列 N/A の行として残し、末尾の空行だけを捨てる
+            # （空行は次に値のある行が来るまで保留する）
+            if all(value is None for value in row):
+                blanks.append(row)
+                continue
+            chunk.extend(blanks)
+            blanks.clear()
+            # 見出しより右に値のある行があれば、pd.read_excel と同じく "Unnamed: <列番号>" の列を足す
+            width = len(_trim(row))
+            if width > len(columns):
+                columns = _column_names(list(header[:len(columns)]) + [None] * (width - len(columns)))
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield start, columns, chunk
+                start, chunk = start + len(chunk), []
+        if chunk:
+            yield start, columns, chunk
+    finally:
+        workbook.close()
+
+
+def iter_excel_documents(file_path: str, sheet_name: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Excelの各行をDocumentにして順に返す
+
+    page_content は「列名: 値 | 列名: 値 | ...」（空セルは N/A）、metadata は {"row": 行番号, "source": ファイルパス}。
+
+    Args:
+        file_path (str): Excelファイルのパス
+        sheet_name (str | None): シート名（省略時は先頭のシート）
+        chunk_size (int): 一度に文字列へ変換する行数
+
+    Yields:
+        Document: 行ごとの文書
+    """
+    for start, columns, rows in iter_row_chunks(file_path, sheet_name, chunk_size):
+        for offset, text in enumerate(rows_to_texts(columns, rows)):
+            yield Document(page_content=text, metadata={"row": start + offset, "source": file_path})
+
+
+if __name__ == "__main__":
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "sample.xlsx")
+    for doc in iter_excel_documents(path):
+        print(doc.metadata, doc.page_content)
@@ -0,0 +1,121 @@
+# FAISSを使ったベクターストア（Chromaの代わりに設定で選べる）
+#
+# Flat（全件探索）・IVF-PQ（転置ファイル + 直積量子化）・HNSW（グラフ探索）の3種類の
+# インデックスを作成でき、nprobe / efSearch で精度と速度のバランスを調整できる。
+# LangChainのFAISSクラスでラップするので、as_retriever() などはChromaと同じように使える。
+
+import math
+import warnings
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+INDEX_TYPES = ("flat", "ivfpq", "hnsw")
+
+
+def _largest_divisor(dim: int, limit: int) -> int:
+    # 直積量子化のサブベクトル数は次元数を割り切る必要がある
+    return max(m for m in range(1, min(dim, limit) + 1) if dim % m == 0)
+
+
+def make_faiss_index(index_type: str, dim: int, num_vectors: int, nlist: int = None,
+                     pq_m: int = 64, hnsw_m: int = 32, ef_construction: int = 200):
+    """
+    内積（正規化済みベクトルならコサイン類似度）で検索するFAISSインデックスを作成する
+
+    Args:
+        index_type (str): "flat" / "ivfpq" / "hnsw"
+        dim (int): ベクトルの次元数
+        num_vectors (int): 登録予定の件数（IVFのクラスタ数の目安に使う）
+        nlist (int | None): IVFのクラスタ数（省略時は 4√N）
+        pq_m (int): 直積量子化のサブベクトル数の上限
+        hnsw_m (int): HNSWの1ノードあたりのリンク数
+        ef_construction (int): HNSW構築時の探索幅
+
+    Returns:
+        faiss.Index: 未学習のインデックス
+    """
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim)
+    if index_type == "ivfpq":
+        nlist = nlist or max(1, int(4 * math.sqrt(num_vectors)))
+        # k-meansの学習にはクラスタあたり39件、PQのコードブックには256件以上が必要
+        if num_vectors < max(256, nlist * 39):
+            warnings.warn(f"IVF-PQの学習には件数が少なすぎるため（{num_vectors}件）、Flatインデックスを使います")
+            return faiss.IndexFlatIP(dim)
+        quantizer = faiss.IndexFlatIP(dim)
+        return faiss.IndexIVFPQ(quantizer, dim, nlist, _largest_divisor(dim, pq_m), 8,
+                                faiss.METRIC_INNER_PRODUCT)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+        return index
+    raise ValueError(f"未対応のインデックス種別です: {index_type}（{INDEX_TYPES} から選択）")
+
+
+def set_search_params(index, nprobe: int = None, ef_search: int = None) -> None:
+    """
+    検索時のパラメーターを設定する
+
+    Args:
+        index (faiss.Index): 対象インデックス
+        nprobe (int | None): IVFで探索するクラスタ数（大きいほど高精度・低速）
+        ef_search (int | None): HNSWの探索幅（大きいほど高精度・低速）
+    """
+    if nprobe is not None and hasattr(index, "nprobe"):
+        index.nprobe = nprobe
+    if ef_search is not None and hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+
+
+def build_faiss_store(docs, embeddings, index_type: str = "hnsw", nprobe: int = 16,
+                      ef_search: int = 64, ids: list[str] = None, **index_kwargs) -> FAISS:
+    """
+    文書を埋め込んでFAISSベクターストアを作成する
+
+    Args:
+        docs (list[Document]): 登録する文書
+        embeddings: 埋め込みモデル
+        index_type (str): "flat" / "ivfpq" / "hnsw"
+        nprobe (int): IVFの探索クラスタ数
+        ef_search (int): HNSWの探索幅
+        ids (list[str] | None): 文書ID
+        **index_kwargs: make_faiss_index() に渡す追加の引数
+
+    Returns:
+        FAISS: as_retriever() などが使えるLangChainのベクターストア
+    """
+    texts = [doc.page_content for doc in docs]
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+
+    index = make_faiss_index(index_type, vectors.shape[1], len(vectors), **index_kwargs)
+    if not index.is_trained:
+        index.train(vectors)
+    set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+
+    # 登録側のベクトルは正規化済みなので、内積の順位はクエリの長さによらずコサイン類似度と同じ
+    store = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+    )
+    store.add_embeddings(zip(texts, vectors.tolist()), metadatas=[doc.metadata for doc in docs], ids=ids)
+    return store
+
+
+def load_faiss_store(folder_path: str, embeddings, nprobe: int = 16, ef_search: int = 64) -> FAISS:
+    """
+    save_local() で保存したFAISSベクターストアを読み込み、検索パラメーターを設定し直す
+
+    自分で保存したファイルだけを読み込むこと（docstoreはpickleで保存されている）。
+    """
+    store = FAISS.load_local(folder_path, embeddings, allow_dangerous_deserialization=True,
+                             distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT)
+    set_search_params(store.index, nprobe=nprobe, ef_search=ef_search)
+    return store
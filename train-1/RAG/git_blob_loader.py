@@ -0,0 +1,197 @@
+# 作業ツリーをチェックアウトせず、Gitのオブジェクトデータベースから直接blobを読むローダー
+#
+# GitLoaderはリポジトリ全体をチェックアウトし、ディスク上の全ファイルを走査してから
+# file_filterを適用する。このローダーはツリーオブジェクトから対象パスを列挙し、
+# 1本の `git cat-file --batch` プロセスでblobの中身をまとめて読み出す。
+# bareクローンや `--filter=blob:none` の部分クローンでも動作する。
+
+import os
+import subprocess
+import threading
+
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+
+
+class GitBlobLoader(BaseLoader):
+    """
+    Gitのツリーから対象ファイルを列挙し、blobを一括で読み込むローダー
+
+    Args:
+        repo_path (str): ローカルのリポジトリパス（bareでも可）
+        clone_url (str | None): クローン元URL。指定時は初回にクローン、以降はフェッチする
+        branch (str): 対象ブランチ
+        file_filter (Callable[[str], bool] | None): リポジトリ相対パスを受け取るフィルター関数
+        partial (bool): 初回クローンを `--filter=blob:none` の部分クローンにするか
+    """
+
+    def __init__(self, repo_path: str, clone_url: str = None, branch: str = "main",
+                 file_filter=None, partial: bool = True):
+        self.repo_path = repo_path
+        self.clone_url = clone_url
+        self.branch = branch
+        self.file_filter = file_filter
+        self.partial = partial
+        self._commit = None
+
+    def _git(self, *args: str, input: bytes = None) -> bytes:
+        return subprocess.run(
+            ["git", "-C", self.repo_path, *args], input=input, capture_output=True, check=True
+        ).stdout
+
+    def sync(self) -> str:
+        """
+        リポジトリをbareクローン（初回）またはフェッチし、対象ブランチのコミットSHAを返す
+
+        Returns:
+            str: 対象ブランチが指すコミットSHA
+        """
+        if self.clone_url and not os.path.exists(self.repo_path):
+            args = ["git", "clone", "--bare", "--branch", self.branch]
+            if self.partial:
+                args.append("--filter=blob:none")
+            subprocess.run([*args, self.clone_url, self.repo_path], capture_output=True, check=True)
+        elif self.clone_url:
+            self._git("fetch", "--no-tags", "origin",
+                      f"+refs/heads/{self.branch}:refs/remotes/origin/{self.branch}")
+        self._commit = self._resolve_commit()
+        return self._commit
+
+    def _resolve_commit(self) -> str:
+        for ref in (f"refs/remotes/origin/{self.branch}", f"refs/heads/{self.branch}"):
+            result = subprocess.run(
+                ["git", "-C", self.repo_path, "rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}"],
+                capture_output=True,
+            )
+            if result.returncode == 0:
+                return result.stdout.decode().strip()
+        raise ValueError(f"ブランチ {self.branch} が {self.repo_path} に見つかりません")
+
+    def local_commit(self) -> str | None:
+        """
+        フェッチせずに、ローカルのリポジトリが指している対象ブランチのコミットSHAを返す
+
+        Returns:
+            str | None: コミットSHA（リポジトリやブランチがまだなければNone）
+        """
+        if not os.path.exists(self.repo_path):
+            return None
+        try:
+            self._commit = self._resolve_commit()
+        except ValueError:
+            return None
+        return self._commit
+
+    @property
+    def commit(self) -> str:
+        """対象コミットSHA（未同期なら同期する）"""
+        if self._commit is None:
+            self.sync()
+        return self._commit
+
+    def list_files(self) -> list[tuple[str, str]]:
+        """
+        ツリーオブジェクトからフィルターに合致するファイルを列挙する（blobの中身は読まない）
+
+        Returns:
+            list[tuple[str, str]]: (リポジトリ相対パス, blob SHA) のリスト
+        """
+        output = self._git("ls-tree", "-r", "-z", "--full-tree", self.commit)
+        files = []
+        for entry in output.split(b"\0"):
+            if not entry:
+                continue
+            info, path = entry.split(b"\t", 1)
+            _, object_type, sha = info.split(b" ")
+            path = path.decode("utf-8", errors="surrogateescape")
+            if object_type == b"blob" and (self.file_filter is None or self.file_filter(path)):
+                files.append((path, sha.decode()))
+        return files
+
+    def _prefetch_missing(self, shas: list[str]) -> None:
+        # 部分クローンでは、足りないblobを1回のフェッチでまとめて取得する
+        # （cat-fileに任せるとblobごとに1回ずつフェッチが走ってしまう）
+        if self._git("config", "--default", "false", "--get", "remote.origin.promisor").strip() != b"true":
+            return
+        output = self._git("rev-list", "--objects", "--no-walk", "--missing=print", self.commit)
+        wanted = set(shas)
+        missing = [line[1:] for line in output.decode().splitlines()
+                   if line.startswith("?") and line[1:] in wanted]
+        if missing:
+            self._git("-c", "fetch.negotiationAlgorithm=noop", "fetch", "origin", "--no-tags",
+                      "--no-write-fetch-head", "--recurse-submodules=no", "--filter=blob:none",
+                      "--stdin", input="\n".join(missing).encode() + b"\n")
+
+    def iter_blobs(self, files: list[tuple[str, str]]):
+        """
+        長寿命の `git cat-file --batch` プロセスでblobの中身を順に読み出す
+
+        Args:
+            files (list[tuple[str, str]]): (リポジトリ相対パス, blob SHA) のリスト
+
+        Yields:
+            tuple[str, str, bytes]: (リポジトリ相対パス, blob SHA, 中身)
+        """
+        if not files:
+            return
+        self._prefetch_missing([sha for _, sha in files])
+        process = subprocess.Popen(
+            ["git", "-C", self.repo_path, "cat-file", "--batch"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+
+        # 出力を読みながら書き込まないとパイプが詰まるため、SHAの送信は別スレッドで行う
+        def feed():
+            try:
+                for _, sha in files:
+                    process.stdin.write(sha.encode() + b"\n")
+                process.stdin.close()
+            except (BrokenPipeError, OSError):
+                # 読み出し側が途中で終了した場合
+                pass
+
+        writer = threading.Thread(target=feed, daemon=True)
+        writer.start()
+        try:
+            for path, sha in files:
+                header = process.stdout.readline().split()
+                if len(header) < 3 or header[1] != b"blob":
+                    raise ValueError(f"blob {sha} ({path}) を読み込めません: {header!r}")
+                content = process.stdout.read(int(header[2]))
+                process.stdout.read(1)  # 末尾の改行
+                yield path, sha, content
+        finally:
+            process.stdout.close()
+            if writer.is_alive():
+                # 途中で読み出しを打ち切った場合は、書き込み待ちのプロセスを止める
+                process.kill()
+            writer.join()
+            process.wait()
+
+    def load_files(self, files: list[tuple[str, str]]):
+        """
+        指定したファイルをDocumentとして読み込む（GitLoaderと同じメタデータ）
+
+        テキストとして読めないファイルは読み飛ばす。
+
+        Yields:
+            Document: 読み込んだ文書
+        """
+        for path, _, content in self.iter_blobs(files):
+            try:
+                text = content.decode("utf-8")
+            except UnicodeDecodeError:
+                continue
+            file_name = os.path.basename(path)
+            yield Document(
+                page_content=text,
+                metadata={
+                    "source": path,
+                    "file_path": path,
+                    "file_name": file_name,
+                    "file_type": os.path.splitext(file_name)[1],
+                },
+            )
+
+    def lazy_load(self):
+        yield from self.load_files(self.list_files())
@@ -1,5 +1,5 @@
 # P93
-from langchain_community.document_loaders import GitLoader
+from git_blob_loader import GitBlobLoader
 
 
 def file_filter(file_path: str) -> bool:
@@ -7,9 +7,10 @@ def file_filter(file_path: str) -> bool:
     return file_path.endswith('.mdx')
 
 
-loader = GitLoader(
+# チェックアウトせず、bareの部分クローンからblobを直接読み込む
+loader = GitBlobLoader(
     clone_url="https://github.com/langchain-ai/langchain",
-    repo_path="./langchain",
+    repo_path="./langchain.git",
     branch="master",
     file_filter=file_filter,
 )
@@ -1,6 +1,7 @@
 # P94
-from langchain_community.document_loaders import GitLoader
+from git_blob_loader import GitBlobLoader
 from langchain_text_splitters import CharacterTextSplitter
+from parallel_splitter import split_documents_parallel
 
 
 def file_filter(file_path: str) -> bool:
@@ -8,9 +9,10 @@ def file_filter(file_path: str) -> bool:
     return file_path.endswith('.mdx')
 
 
-loader = GitLoader(
+# チェックアウトせず、bareの部分クローンからblobを直接読み込む
+loader = GitBlobLoader(
     clone_url="https://github.com/langchain-ai/langchain",
-    repo_path="./langchain",
+    repo_path="./langchain.git",
     branch="master",
     file_filter=file_filter,
 )
@@ -20,5 +22,6 @@ print(len(raw_docs))
 
 
 text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-docs = text_splitter.split_documents(raw_docs)
+# CPUコア数に応じて並列に分割（チャンクの順序とメタデータは維持される）
+docs = split_documents_parallel(raw_docs, text_splitter)
 print(len(docs))
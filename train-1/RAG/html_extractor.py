@@ -0,0 +1,153 @@
+# lxmlによるHTML本文抽出（DOMを1回だけ走査し、各テキストノードを1回だけ出力する）
+#
+# SoupStrainerで article / section / div / p などを残してから get_text() する方法は、
+# Pythonで書かれたパーサーでページ全体を読むうえ、要素の境界が失われて見出しと本文がつながり、
+# 要素の入れ子によっては同じ段落が重複する。ここではCで書かれたlxmlで解析し、
+#   - main / article があればそこを本文とみなし、nav / script などと <body> 直下の header / footer は丸ごと読み飛ばす
+#   - 要素の開始・終了のイベントを1回だけ走査し、el.text と el.tail をそれぞれ1回だけ出力する
+#   - 見出しは Markdown の "#" で階層を残し、ブロック要素の境界で改行する（pre の中は空白を保つ）
+# ことで、重複のないテキストを作る。
+
+import re
+from urllib.parse import urljoin
+
+import lxml.html
+from lxml import etree
+from langchain_core.documents import Document
+
+# 中身ごと読み飛ばす要素（ナビゲーション・スクリプトなど本文以外）
+SKIP_TAGS = frozenset({
+    "script", "style", "noscript", "template", "svg", "iframe", "canvas", "button",
+    "nav", "aside",
+})
+# サイト全体のヘッダー・フッター。<body> 直下にあるときだけ読み飛ばす
+# （<article><header><h1>タイトル</h1></header> のような本文中のものは残す）
+PAGE_CHROME_TAGS = frozenset({"header", "footer"})
+# 前後で改行する要素
+BLOCK_TAGS = frozenset({
+    "address", "article", "blockquote", "body", "dd", "details", "dl", "dt", "div", "fieldset", "figcaption",
+    "figure", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "li", "main", "ol", "p", "pre", "section", "summary",
+    "table", "tbody", "thead", "tfoot", "tr", "ul", "br",
+})
+HEADING_LEVELS = {f"h{level}": level for level in range(1, 7)}
+# セルの区切り
+CELL_TAGS = frozenset({"td", "th"})
+
+_SPACES = re.compile(r"[ \t\r\f\v ]+")
+# pre の中身は空白を詰めないよう、いったんこのプレースホルダーに置き換えておく
+_PRE_MARK = "\x00{}\x00"
+_PRE_PATTERN = re.compile(r"\x00(\d+)\x00")
+
+
+def _main_element(root):
+    # <main> があればそれを、なければ最も長い <article> を、どちらもなければ <body> を本文とみなす
+    main = root.find(".//main")
+    if main is not None:
+        return main
+    articles = root.findall(".//article")
+    if articles:
+        return max(articles, key=lambda el: len(el.text_content()))
+    body = root.find(".//body")
+    return body if body is not None else root
+
+
+def _metadata(root, url: str) -> dict:
+    metadata = {"source": url}
+    title = root.find(".//title")
+    if title is not None and title.text:
+        metadata["title"] = title.text.strip()
+    description = root.find(".//meta[@name='description']")
+    if description is not None:
+        metadata["description"] = description.get("content", "No description found.")
+    if root.tag == "html":
+        metadata["language"] = root.get("lang", "No language found.")
+    return metadata
+
+
+def extract_text(root) -> str:
+    """
+    要素以下の本文テキストを、各テキストノードを1回だけ使って組み立てる
+
+    Args:
+        root: lxmlの要素
+
+    Returns:
+        str: 見出しを "#" 付きの行にし、ブロック要素ごとに改行したテキスト
+    """
+    parts, preformatted = [], []
+    body = root if root.tag == "body" else None
+    walker = etree.iterwalk(root, events=("start", "end", "comment", "pi"))
+    for event, el in walker:
+        tag = el.tag
+        if event in ("comment", "pi"):
+            # コメント・処理命令は start / end が来ないので、ここで後ろのテキストだけを出力する
+            if el.tail:
+                parts.append(el.tail)
+        elif event == "start":
+            if tag in SKIP_TAGS or tag == "pre" or (tag in PAGE_CHROME_TAGS and el.getparent() is body):
+                if tag == "pre":
+                    parts.append("\n" + _PRE_MARK.format(len(preformatted)) + "\n")
+                    preformatted.append(el.text_content().strip("\n"))
+                # 読み飛ばした要素でも end イベントは来るので、tail はそこで出力される
+                walker.skip_subtree()
+                continue
+            if tag in BLOCK_TAGS:
+                parts.append("\n")
+            if tag in HEADING_LEVELS:
+                parts.append("#" * HEADING_LEVELS[tag] + " ")
+            elif tag == "li":
+                parts.append("- ")
+            elif tag in CELL_TAGS:
+                parts.append(" | ")
+            if el.text:
+                parts.append(el.text)
+        else:
+            if tag in BLOCK_TAGS:
+                parts.append("\n")
+            if el is not root and el.tail:
+                parts.append(el.tail)
+
+    lines = []
+    for line in "".join(parts).split("\n"):
+        line = _SPACES.sub(" ", line).strip()
+        if line and line not in ("-", "|") and not set(line) <= {"#", " "}:
+            lines.append(line)
+    text = "\n".join(lines)
+    return _PRE_PATTERN.sub(lambda match: preformatted[int(match.group(1))], text)
+
+
+def parse_page(html: str, url: str = "") -> tuple[Document, list[str]]:
+    """
+    HTMLを1回だけ解析し、本文のDocumentとページ内のリンク（絶対URL）を返す
+
+    リンクは本文以外（nav / サイドバーなど）からも集める（クローラーが次のページを見つけるため）。
+
+    Args:
+        html (str): HTML
+        url (str): ページのURL（metadataのsource、相対リンクの基準）
+
+    Returns:
+        tuple[Document, list[str]]: (文書, <a href> のリンク)
+    """
+    if not html.strip():
+        return Document(page_content="", metadata={"source": url}), []
+    root = lxml.html.document_fromstring(html)
+    links = [urljoin(url, el.get("href").strip()) for el in root.iter("a") if el.get("href")]
+    return Document(page_content=extract_text(_main_element(root)), metadata=_metadata(root, url)), links
+
+
+def lxml_document(html: str, url: str = "") -> Document:
+    """
+    HTMLの本文を取り出してDocumentにする（web_fetcher の parser としてそのまま使える）
+
+    Args:
+        html (str): HTML
+        url (str): ページのURL（metadataのsource）
+
+    Returns:
+        Document: 本文とメタデータ（source / title / description / language のうち取れたもの）
+    """
+    if not html.strip():
+        return Document(page_content="", metadata={"source": url})
+    root = lxml.html.document_fromstring(html)
+    return Document(page_content=extract_text(_main_element(root)), metadata=_metadata(root, url))
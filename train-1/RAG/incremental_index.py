@@ -0,0 +1,126 @@
+# Gitリポジトリの差分だけをベクターデータベースへ反映するためのインクリメンタル取り込み
+#
+# 前回インデックスしたコミットとファイルごとのblob SHAを状態ファイルに記録しておき、
+# 次回はblobが変わったファイルだけを分割・埋め込み・upsert／削除する。
+
+import json
+import os
+
+from dedup import deduplicate
+
+
+def load_state(state_path: str) -> dict:
+    """
+    インデックス状態ファイルを読み込む
+
+    Args:
+        state_path (str): 状態ファイルのパス
+
+    Returns:
+        dict: {"commit": コミットSHA, "files": {パス: {"blob": blob SHA, "chunks": チャンク数}}}
+    """
+    if not os.path.exists(state_path):
+        return {"commit": None, "files": {}}
+    with open(state_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state_path: str, state: dict) -> None:
+    """
+    インデックス状態ファイルを書き込む（途中で落ちても壊れないよう一時ファイル経由で置き換える）
+
+    Args:
+        state_path (str): 状態ファイルのパス
+        state (dict): 保存する状態
+    """
+    os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, state_path)
+
+
+def diff_blobs(old_files: dict, new_blobs: dict) -> tuple[list, list, list]:
+    """
+    前回の状態と現在のblob一覧を比較する
+
+    Args:
+        old_files (dict): 状態ファイルの "files"
+        new_blobs (dict): {リポジトリ相対パス: blob SHA}
+
+    Returns:
+        tuple[list, list, list]: (追加されたパス, 変更されたパス, 削除されたパス)
+    """
+    added = [path for path in new_blobs if path not in old_files]
+    modified = [
+        path for path, sha in new_blobs.items()
+        if path in old_files and old_files[path]["blob"] != sha
+    ]
+    deleted = [path for path in old_files if path not in new_blobs]
+    return sorted(added), sorted(modified), sorted(deleted)
+
+
+def chunk_ids(path: str, count: int) -> list[str]:
+    """ファイル単位で決定的なチャンクIDを作る（削除時に再計算できるようにするため）"""
+    return [f"{path}#{i}" for i in range(count)]
+
+
+def update_index(db, text_splitter, loader, state_path: str, batch_size: int = 1000,
+                 dedup_threshold: float = None) -> dict:
+    """
+    前回のインデックス以降に変わったファイルだけをベクターデータベースへ反映する
+
+    Args:
+        db: 永続化されたベクターストア（add_documents / delete を持つもの）
+        text_splitter: チャンク分割に使うテキストスプリッター
+        loader (GitBlobLoader): 対象リポジトリ・ブランチ・フィルターを設定したローダー
+        state_path (str): 状態ファイルのパス
+        batch_size (int): 1回のupsertで送るチャンク数
+        dedup_threshold (float | None): 指定するとファイルごとに完全一致・近似重複のチャンクをまとめてから埋め込む
+            （ファイル単位で閉じているので、他のファイルの変更・削除に影響されない。ファイルをまたぐ重複は
+            フル再構築のときだけまとめる）
+
+    Returns:
+        dict: 追加・変更・削除ファイル数と、upsert／削除／重複としてまとめたチャンク数
+    """
+    state = load_state(state_path)
+    commit = loader.sync()
+    stats = {"commit": commit, "added": 0, "modified": 0, "deleted": 0,
+             "upserted_chunks": 0, "deleted_chunks": 0, "duplicate_chunks": 0}
+    if state["commit"] == commit:
+        return stats
+
+    new_blobs = dict(loader.list_files())
+    added, modified, deleted = diff_blobs(state["files"], new_blobs)
+    stats.update(added=len(added), modified=len(modified), deleted=len(deleted))
+
+    # 変更・削除されたファイルの古いチャンクを削除
+    stale_ids = []
+    for path in modified + deleted:
+        stale_ids.extend(chunk_ids(path, state["files"][path]["chunks"]))
+    for start in range(0, len(stale_ids), batch_size):
+        db.delete(ids=stale_ids[start:start + batch_size])
+    stats["deleted_chunks"] = len(stale_ids)
+    for path in deleted:
+        del state["files"][path]
+
+    # 追加・変更されたファイルだけを読み込み、分割・埋め込み
+    # （テキストとして読めないファイルはチャンク0件として記録し、次回以降は読み直さない）
+    changed = added + modified
+    for path in changed:
+        state["files"][path] = {"blob": new_blobs[path], "chunks": 0}
+    for doc in loader.load_files([(path, new_blobs[path]) for path in changed]):
+        path = doc.metadata["file_path"]
+        chunks = text_splitter.split_documents([doc])
+        if dedup_threshold is not None:
+            chunks, dedup_stats = deduplicate(chunks, threshold=dedup_threshold)
+            stats["duplicate_chunks"] += dedup_stats["input"] - dedup_stats["output"]
+        ids = chunk_ids(path, len(chunks))
+        for start in range(0, len(chunks), batch_size):
+            db.add_documents(chunks[start:start + batch_size], ids=ids[start:start + batch_size])
+        state["files"][path]["chunks"] = len(chunks)
+        stats["upserted_chunks"] += len(chunks)
+
+    state["commit"] = commit
+    save_state(state_path, state)
+    return stats
@@ -0,0 +1,92 @@
+# 永続化したインデックスのマニフェスト
+#
+# インデックスと一緒に、作成元のコミット・分割パラメーター・埋め込みモデルと次元数などを
+# manifest.json に保存しておき、起動時に現在の設定と一致すればインデックスをそのまま開き、
+# 一致しなければ作り直す。マニフェストはインデックスの書き込みが終わってから最後に書くので、
+# 途中で落ちた場合は不一致として作り直しになる。
+
+import json
+import os
+
+MANIFEST_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+
+def splitter_params(text_splitter) -> dict:
+    """
+    テキストスプリッターの種類と、分割結果に影響するパラメーターを取り出す
+
+    Args:
+        text_splitter: LangChainのテキストスプリッター
+
+    Returns:
+        dict: 種類名と chunk_size / chunk_overlap / separator など
+    """
+    params = {"type": type(text_splitter).__name__}
+    for name in ("chunk_size", "chunk_overlap", "separator", "separators", "is_separator_regex",
+                 "keep_separator", "strip_whitespace"):
+        value = getattr(text_splitter, f"_{name}", None)
+        if value is not None:
+            params[name] = value
+    return params
+
+
+def build_manifest(commit: str, text_splitter, embedding_model: str, dimensions: int = None, **extra) -> dict:
+    """
+    インデックスのマニフェストを作る
+
+    Args:
+        commit (str): インデックス作成元のコミットSHA
+        text_splitter: チャンク分割に使うテキストスプリッター
+        embedding_model (str): 埋め込みモデル名
+        dimensions (int | None): 埋め込みの次元数（Noneはモデルのフルサイズ）
+        **extra: バックエンドや重複除去の設定など、変わったら作り直しが必要な値
+
+    Returns:
+        dict: JSONに保存できるマニフェスト
+    """
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "commit": commit,
+        "splitter": splitter_params(text_splitter),
+        "embedding": {"model": embedding_model, "dimensions": dimensions},
+        **extra,
+    }
+    # タプルなどをJSONと同じ形にそろえて、読み込んだマニフェストと比較できるようにする
+    return json.loads(json.dumps(manifest, ensure_ascii=False))
+
+
+def load_manifest(directory: str) -> dict | None:
+    """保存されたマニフェストを読み込む（なければNone）"""
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(directory: str, manifest: dict) -> None:
+    """マニフェストを書き込む（一時ファイル経由で置き換える）"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def manifest_diff(directory: str, manifest: dict) -> list[str]:
+    """
+    保存されたマニフェストと比較し、一致しない項目名を返す
+
+    Args:
+        directory (str): インデックスのディレクトリ
+        manifest (dict): 現在の設定から作ったマニフェスト
+
+    Returns:
+        list[str]: 不一致の項目名（空なら一致。インデックスがなければ ["manifest"]）
+    """
+    saved = load_manifest(directory)
+    if saved is None:
+        return ["manifest"]
+    return sorted(key for key in saved.keys() | manifest.keys() if saved.get(key) != manifest.get(key))
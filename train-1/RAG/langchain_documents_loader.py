@@ -1,38 +1,41 @@
 # Web Document Loader for RAG Implementation
-from langchain_community.document_loaders import WebBaseLoader
-import bs4
+#
+# Pages are fetched concurrently over one pooled keep-alive session (see web_fetcher.py).
+# ETag / Last-Modified are cached on disk, so unchanged pages cost a 304 and are not re-parsed.
+import os
+from functools import partial
+
+from docs_crawler import DocsCrawler
+from html_extractor import lxml_document
+from web_fetcher import afetch_documents, fetch_documents, soup_document
+
+# Concurrent connections per host (be polite to the docs site)
+PER_HOST_LIMIT = 4
+# Crawl a whole docs site instead of the example URLs (sitemap takes precedence over start URL)
+DOCS_SITEMAP_URL = os.getenv("DOCS_SITEMAP_URL")
+DOCS_START_URL = os.getenv("DOCS_START_URL")
 
 
 def load_web_content_simple(urls):
     """
-    Simple and fast text extraction using WebBaseLoader with BeautifulSoup
+    Simple and fast main-content extraction with lxml (each text node once, headings kept as "#")
     """
-    loader = WebBaseLoader(
-        web_paths=urls,
-        bs_kwargs={"parse_only": bs4.SoupStrainer(
-            ["article", "main", "section", "div", "p", "h1", "h2", "h3", "h4", "h5", "h6"]
-        )}
-    )
-    docs = loader.load()
+    docs, stats = fetch_documents(urls, parser=lxml_document, parser_key="lxml", per_host_limit=PER_HOST_LIMIT)
+    print_fetch_stats(stats)
     return docs
 
 
 def load_web_content_with_custom_parser(urls, css_selector=None):
     """
-    Custom parsing using WebBaseLoader with specific CSS selectors
+    Custom parsing that only keeps elements with the given CSS class
     """
-    if css_selector:
-        bs_kwargs = {"parse_only": bs4.SoupStrainer(class_=css_selector)}
-    else:
-        bs_kwargs = {"parse_only": bs4.SoupStrainer(
-            ["article", "main", "section", "div", "p", "h1", "h2", "h3", "h4", "h5", "h6"]
-        )}
-
-    loader = WebBaseLoader(
-        web_paths=urls,
-        bs_kwargs=bs_kwargs
+    docs, stats = fetch_documents(
+        urls,
+        parser=partial(soup_document, css_class=css_selector),
+        parser_key=f"soup:{css_selector or ''}",
+        per_host_limit=PER_HOST_LIMIT,
     )
-    docs = loader.load()
+    print_fetch_stats(stats)
     return docs
 
 
@@ -40,13 +43,37 @@ async def load_web_content_async(urls):
     """
     Async loading for better performance with multiple URLs
     """
-    loader = WebBaseLoader(web_paths=urls)
-    docs = await loader.aload()
+    docs, stats = await afetch_documents(urls, parser=lxml_document, parser_key="lxml", per_host_limit=PER_HOST_LIMIT)
+    print_fetch_stats(stats)
     return docs
 
 
+def load_changed_docs(sitemap_url=None, start_url=None):
+    """
+    Incremental crawl: returns only new or changed pages since the last crawl, plus URLs that disappeared
+    """
+    crawler = DocsCrawler(per_host_limit=PER_HOST_LIMIT)
+    docs, deleted, stats = crawler.crawl(start_url=start_url, sitemap_url=sitemap_url)
+    print(f"Crawled {stats['pages']} pages in {stats['seconds']:.2f}s ({stats['pages_per_sec']:.1f} pages/sec): "
+          f"{stats['new']} new, {stats['changed']} changed, {stats['unchanged']} unchanged, "
+          f"{stats['not_modified']} not modified (304), {stats['skipped_lastmod']} skipped by sitemap lastmod, "
+          f"{stats['deleted']} deleted, {stats['errors']} errors")
+    return docs, deleted
+
+
+def print_fetch_stats(stats):
+    print(f"Fetched {stats['pages']} pages in {stats['seconds']:.2f}s ({stats['pages_per_sec']:.1f} pages/sec): "
+          f"{stats['fetched']} downloaded, {stats['not_modified']} not modified (304), "
+          f"{stats['parsed']} parsed, {stats['errors']} errors")
+
+
 # Example usage
-if __name__ == "__main__":
+if __name__ == "__main__" and (DOCS_SITEMAP_URL or DOCS_START_URL):
+    # Incremental crawl of a docs site: only new or changed pages go to the RAG pipeline
+    changed_docs, deleted_urls = load_changed_docs(sitemap_url=DOCS_SITEMAP_URL, start_url=DOCS_START_URL)
+    print(f"{len(changed_docs)} documents to (re)index, {len(deleted_urls)} to delete")
+
+elif __name__ == "__main__":
     # Example URLs to load
     web_urls = [
         "https://python.langchain.com/docs/how_to/document_loader_web/",
@@ -54,7 +81,7 @@ if __name__ == "__main__":
     ]
 
     # Simple web loading
-    print("Loading web content with WebBaseLoader...")
+    print("Loading web content...")
     simple_docs = load_web_content_simple(web_urls)
     print(f"Loaded {len(simple_docs)} documents")
 
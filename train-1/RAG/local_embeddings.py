@@ -0,0 +1,176 @@
+# ネットワーク不要の決定的なローカル埋め込み（ベンチマーク・テスト・オフライン環境用）
+#
+# 特徴量をシード付きハッシュで固定次元に振り分け（符号付きハッシュ）、L2正規化する。
+# 同じテキスト・同じシードなら、どの環境でも同じベクトルになる。
+#   HashingEmbeddings:   単語と単語bigram（ベンチマークのクエリ・コーパス生成用）
+#   CharNgramEmbeddings: 文字n-gram。空白で区切らない日本語にも使え、ハッシュ計算をNumPyで
+#                        バッチ全体まとめて行い、大きなバッチは複数プロセスに分ける
+
+import os
+import re
+import threading
+import weakref
+import zlib
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from parallel_splitter import _mp_context
+
+_TOKEN = re.compile(r"\w+")
+_SPACES = re.compile(r"\s+")
+# 文字n-gramの多項式ハッシュの基数と、splitmix64の混合定数（uint64の桁あふれで mod 2^64 になる）
+_BASE = np.uint64(1_000_003)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_GOLDEN = 0x9E3779B97F4A7C15
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    特徴量ハッシュによる決定的な埋め込み
+
+    Args:
+        dimensions (int): ベクトルの次元数
+        seed (int): ハッシュのシード（変えると別の埋め込み空間になる）
+    """
+
+    def __init__(self, dimensions: int = 256, seed: int = 0):
+        self.dimensions = dimensions
+        self.seed = seed
+        self.model = f"hashing-{dimensions}-{seed}"
+
+    def _features(self, text: str) -> list[str]:
+        tokens = _TOKEN.findall(text.lower())
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def _vector(self, text: str) -> np.ndarray:
+        hashes = np.array([zlib.crc32(f.encode("utf-8"), self.seed) for f in self._features(text)],
+                          dtype=np.uint32)
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        if len(hashes):
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(vector, hashes % self.dimensions, signs)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._vector(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._vector(text).tolist()
+
+
+def _mix(hashes: np.ndarray) -> np.ndarray:
+    # splitmix64の最終段。多項式ハッシュの偏りを消し、下位ビット（次元）と最上位ビット（符号）を独立にする
+    hashes = (hashes ^ (hashes >> np.uint64(30))) * _MIX1
+    hashes = (hashes ^ (hashes >> np.uint64(27))) * _MIX2
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+def _embed_char_ngrams(texts: list[str], dimensions: int, ngram_range: tuple[int, int], seed: int) -> np.ndarray:
+    # 全テキストの文字コードを1本の配列につなげ、n-gramのハッシュをn回のベクトル演算で計算する。
+    # テキストの境界をまたぐn-gramは捨て、(テキスト番号, 次元) ごとの符号付き個数を bincount 1回で数える
+    cleaned = [_SPACES.sub(" ", text.lower()).strip() for text in texts]
+    cleaned = [f" {text} " if text else "" for text in cleaned]
+    lengths = np.array([len(text) for text in cleaned], dtype=np.int64)
+    codes = np.frombuffer("".join(cleaned).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    owner = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+    counts = np.zeros(len(texts) * dimensions, dtype=np.float64)
+    with np.errstate(over="ignore"):
+        for n in range(ngram_range[0], ngram_range[1] + 1):
+            size = len(codes) - n + 1
+            if size <= 0:
+                continue
+            hashes = np.full(size, (seed * _GOLDEN + n) & 0xFFFFFFFFFFFFFFFF, dtype=np.uint64)
+            for j in range(n):
+                hashes = hashes * _BASE + codes[j:j + size]
+            inside = owner[:size] == owner[n - 1:n - 1 + size]
+            hashes = _mix(hashes[inside])
+            signs = np.where(hashes >> np.uint64(63), -1.0, 1.0)
+            slots = owner[:size][inside] * dimensions + (hashes % np.uint64(dimensions)).astype(np.int64)
+            counts += np.bincount(slots, weights=signs, minlength=len(counts))
+    vectors = counts.reshape(len(texts), dimensions).astype(np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class CharNgramEmbeddings(Embeddings):
+    """
+    文字n-gramの特徴量ハッシュによるローカル埋め込み（OpenAIEmbeddingsの代わりに使える）
+
+    APIを呼ばないのでネットワーク不要で、CI・ベンチマーク・インターネットに出られない環境でも
+    インデックスを作れる。意味の近さではなく文字列の近さを表すベクトルになる点に注意。
+
+    Args:
+        dimensions (int): ベクトルの次元数
+        ngram_range (tuple[int, int]): 使う文字n-gramの長さの範囲（両端を含む）
+        seed (int): ハッシュのシード（変えると別の埋め込み空間になる）
+        max_workers (int | None): 並列に計算するプロセス数（省略時はCPUコア数、1なら並列化しない）
+        parallel_threshold (int): この件数以上のバッチだけを複数プロセスに分ける
+        start_workers (bool): 作成時にワーカープロセスを起動しておく（ベンチマークなどで起動時間を計測から外す）。
+            False なら parallel_threshold 以上のバッチが初めて来たときに起動する
+
+    使い終わったら close() するか、with 文で使うとワーカープロセスを終了する。
+    """
+
+    def __init__(self, dimensions: int = 1024, ngram_range: tuple[int, int] = (2, 4), seed: int = 0,
+                 max_workers: int = None, parallel_threshold: int = 2_048, start_workers: bool = False):
+        self.dimensions = dimensions
+        self.ngram_range = tuple(ngram_range)
+        self.seed = seed
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.parallel_threshold = parallel_threshold
+        self.model = f"char-ngram-{self.ngram_range[0]}-{self.ngram_range[1]}-{dimensions}-{seed}"
+        self.embedded = 0
+        # 少ない件数しか埋め込まない使い方（チャットの質問など）ではプロセスを起動しないよう、プールは遅延作成する。
+        # 複数の取り込みスレッドから同時に呼ばれても1つだけ作るよう、作成はロックの中で行う
+        self._pool = None
+        self._pool_finalizer = None
+        self._pool_lock = threading.Lock()
+        if start_workers:
+            self._get_pool()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None and self.max_workers > 1:
+                self._pool = _mp_context().Pool(self.max_workers)
+                self._pool_finalizer = weakref.finalize(self, self._pool.terminate)
+            return self._pool
+
+    def close(self) -> None:
+        """ワーカープロセスを終了する（以降に大きなバッチが来たら起動し直す）"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool_finalizer.detach()
+                self._pool.close()
+                self._pool.join()
+                self._pool = self._pool_finalizer = None
+
+    def __enter__(self) -> "CharNgramEmbeddings":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        pool = self._get_pool() if len(texts) >= self.parallel_threshold else None
+        if pool is None:
+            return _embed_char_ngrams(texts, self.dimensions, self.ngram_range, self.seed)
+        shard_size = -(-len(texts) // self.max_workers)
+        shards = [texts[start:start + shard_size] for start in range(0, len(texts), shard_size)]
+        # Pool.starmap は複数スレッドから同時に呼んでよい
+        return np.concatenate(pool.starmap(
+            _embed_char_ngrams, [(shard, self.dimensions, self.ngram_range, self.seed) for shard in shards],
+        ))
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.embedded += len(texts)
+        return self._embed(list(texts)).tolist() if texts else []
+
+    def embed_query(self, text: str) -> list[float]:
+        self.embedded += 1
+        return self._embed([text])[0].tolist()
+
+    def stats(self) -> dict:
+        """埋め込んだテキスト数を返す（キャッシュは使わない）"""
+        return {"embedded": self.embedded}
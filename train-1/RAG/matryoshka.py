@@ -0,0 +1,50 @@
+# text-embedding-3 の次元削減（Matryoshka表現）
+#
+# text-embedding-3系のベクトルは先頭の次元ほど重要な情報を持つように学習されているため、
+# 先頭 d 次元で切り詰めて再正規化しても検索に使える。APIの dimensions パラメーターと
+# 同じ結果になるので、フルサイズの埋め込みをキャッシュしておけば次元数を変えて再利用できる。
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def truncate_and_normalize(vectors, dimensions: int) -> np.ndarray:
+    """
+    ベクトルを先頭 dimensions 次元で切り詰め、L2正規化する
+
+    Args:
+        vectors: (N, D) または (D,) のベクトル
+        dimensions (int): 残す次元数
+
+    Returns:
+        np.ndarray: 切り詰め・正規化したfloat32ベクトル
+    """
+    truncated = np.asarray(vectors, dtype=np.float32)[..., :dimensions]
+    norms = np.linalg.norm(truncated, axis=-1, keepdims=True)
+    return truncated / np.maximum(norms, 1e-12)
+
+
+class TruncatedEmbeddings(Embeddings):
+    """
+    埋め込み結果をローカルで切り詰めて次元を減らすEmbeddings
+
+    インデックス作成時（embed_documents）と検索時（embed_query）の両方に同じ次元数を適用する。
+
+    Args:
+        underlying (Embeddings): フルサイズのベクトルを返すEmbeddings
+        dimensions (int): 残す次元数
+    """
+
+    def __init__(self, underlying: Embeddings, dimensions: int):
+        self.underlying = underlying
+        self.dimensions = dimensions
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return truncate_and_normalize(self.underlying.embed_documents(texts), self.dimensions).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return truncate_and_normalize(self.underlying.embed_query(text), self.dimensions).tolist()
+
+    def stats(self) -> dict:
+        """ラップしたEmbeddingsのキャッシュ統計（あれば）を返す"""
+        return self.underlying.stats() if hasattr(self.underlying, "stats") else {}
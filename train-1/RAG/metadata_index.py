@@ -0,0 +1,337 @@
+# メタデータの転置インデックスと、候補を先に絞ってから類似度を計算するフィルター付き検索
+#
+# 取り込み時に file_path / ディレクトリ（すべての親ディレクトリ）/ 拡張子 / source ごとに
+# 行番号のリストを作っておき、「docs/integrations/**/*.mdx」のような条件では
+# 該当する行だけをベクトル検索の対象にする。上位k件を取ってから絞り込む後段フィルターと違い、
+# 範囲外の文書に上位を取られて結果が足りなくなることがなく、走査する件数も減る。
+
+import bisect
+import json
+import os
+import re
+
+import faiss
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from mmr import mmr_select
+
+FIELDS = ("file_path", "dir", "extension", "source")
+
+
+def _glob_to_regex(pattern: str) -> re.Pattern:
+    # ** は0個以上のディレクトリ、* と ? は "/" をまたがない
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile("".join(parts) + r"\Z")
+
+
+def _keys(metadata: dict) -> dict[str, set]:
+    # 重複除去でまとめたチャンクは、元になったすべてのファイルで見つかるようにする
+    paths = metadata.get("source_paths") or [metadata.get("file_path") or metadata.get("source")]
+    keys = {field: set() for field in FIELDS}
+    for path in filter(None, paths):
+        keys["file_path"].add(path)
+        directory = os.path.dirname(path)
+        while directory:
+            keys["dir"].add(directory)
+            directory = os.path.dirname(directory)
+        keys["extension"].add(os.path.splitext(path)[1] or "no_extension")
+    if metadata.get("source"):
+        keys["source"].add(metadata["source"])
+    return keys
+
+
+class MetadataIndex:
+    """
+    メタデータの値から行番号を引く転置インデックス
+
+    行番号はベクターストアへ登録した順番と同じで、ids[行番号] がストア上のIDになる。
+
+    Args:
+        ids (list[str]): 各行のID
+        postings (dict): {フィールド名: {値: 行番号の配列}}
+    """
+
+    def __init__(self, ids: list[str], postings: dict[str, dict[str, np.ndarray]]):
+        self.ids = ids
+        self.postings = postings
+        self._sorted_paths = sorted(postings["file_path"])
+        # FAISSの行位置（行番号 -> index_to_docstore_id のキー）と、作ったときのFAISSの件数
+        self._faiss_positions = None
+        self._faiss_ntotal = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_metadatas(cls, metadatas, ids: list[str] = None) -> "MetadataIndex":
+        """
+        メタデータのリストからインデックスを作る
+
+        Args:
+            metadatas (Iterable[dict]): 各行のメタデータ
+            ids (list[str] | None): 各行のID（省略時は行番号の文字列）
+        """
+        rows = {field: {} for field in FIELDS}
+        count = 0
+        for row, metadata in enumerate(metadatas):
+            for field, values in _keys(metadata or {}).items():
+                for value in values:
+                    rows[field].setdefault(value, []).append(row)
+            count += 1
+        postings = {field: {value: np.array(r, dtype=np.int32) for value, r in values.items()}
+                    for field, values in rows.items()}
+        return cls(ids if ids is not None else [str(row) for row in range(count)], postings)
+
+    @classmethod
+    def from_documents(cls, docs, ids: list[str] = None) -> "MetadataIndex":
+        """取り込む文書（チャンク）からインデックスを作る"""
+        return cls.from_metadatas((doc.metadata for doc in docs), ids)
+
+    @classmethod
+    def from_vector_store(cls, db, batch_size: int = 5_000) -> "MetadataIndex":
+        """
+        登録済みのベクターストアのメタデータからインデックスを作る
+
+        Chroma / ShardedVectorStore / LangChainのFAISS / QuantizedVectorStore / SnapshotVectorStore に対応する。
+        """
+        collections = ([shard._collection for shard in db.shards.values()] if hasattr(db, "shards")
+                       else [db._collection] if hasattr(db, "_collection") else None)
+        if collections is not None:
+            ids, metadatas = [], []
+            for collection in collections:
+                for offset in range(0, collection.count(), batch_size):
+                    page = collection.get(limit=batch_size, offset=offset, include=["metadatas"])
+                    ids.extend(page["ids"])
+                    metadatas.extend(page["metadatas"])
+            return cls.from_metadatas(metadatas, ids)
+        if hasattr(db, "index_to_docstore_id"):
+            ids = [db.index_to_docstore_id[i] for i in range(db.index.ntotal)]
+            index = cls.from_metadatas((db.docstore.search(doc_id).metadata for doc_id in ids), ids)
+            # 行番号がそのままFAISSの行位置になる
+            index._faiss_positions = np.arange(len(ids), dtype=np.int64)
+            index._faiss_ntotal = db.index.ntotal
+            return index
+        if hasattr(db, "columns"):
+            return cls.from_metadatas((json.loads(db.columns["metadata"][row]) for row in range(len(db))),
+                                      [db.columns["id"][row] for row in range(len(db))])
+        if hasattr(db, "docs"):
+            return cls.from_metadatas(doc["metadata"] for doc in db.docs)
+        raise TypeError(f"メタデータを読み出せないベクターストアです: {type(db).__name__}")
+
+    def save(self, path: str) -> None:
+        """JSONに保存する（一時ファイル経由で置き換える）"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids,
+                       "postings": {field: {value: rows.tolist() for value, rows in values.items()}
+                                    for field, values in self.postings.items()}},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "MetadataIndex":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        postings = {field: {value: np.array(rows, dtype=np.int32) for value, rows in values.items()}
+                    for field, values in data["postings"].items()}
+        return cls(data["ids"], postings)
+
+    def faiss_positions(self, db) -> np.ndarray:
+        """
+        行番号ごとのFAISSの行位置（FAISSにないIDは -1）
+
+        初回に作ってキャッシュし、FAISSの件数が変わったとき（文書の追加・削除）だけ作り直す。
+        """
+        if self._faiss_positions is None or self._faiss_ntotal != db.index.ntotal:
+            positions = {doc_id: pos for pos, doc_id in db.index_to_docstore_id.items()}
+            self._faiss_positions = np.array([positions.get(doc_id, -1) for doc_id in self.ids], dtype=np.int64)
+            self._faiss_ntotal = db.index.ntotal
+        return self._faiss_positions
+
+    def _paths_matching(self, pattern: str) -> list[str]:
+        # ワイルドカードより前の固定部分で、ソート済みのパス一覧を二分探索してから照合する
+        # （_glob_to_regex と同じく "[" は文字そのものとして扱うので、ワイルドカードは * と ? だけ）
+        literal = re.split(r"[*?]", pattern, maxsplit=1)[0]
+        regex = _glob_to_regex(pattern)
+        start = bisect.bisect_left(self._sorted_paths, literal)
+        matched = []
+        for path in self._sorted_paths[start:]:
+            if not path.startswith(literal):
+                break
+            if regex.match(path):
+                matched.append(path)
+        return matched
+
+    def select(self, file_path: str = None, dir_prefix: str = None, extension: str = None,
+               source: str = None, path_glob: str = None) -> np.ndarray:
+        """
+        条件をすべて満たす行番号を返す（ベクトルの類似度は計算しない）
+
+        Args:
+            file_path (str | None): ファイルパスの完全一致
+            dir_prefix (str | None): このディレクトリ以下（例: "docs/integrations"）
+            extension (str | None): 拡張子（例: ".mdx"）
+            source (str | None): source の完全一致
+            path_glob (str | None): パスのglob（例: "docs/integrations/**/*.mdx"）
+
+        Returns:
+            np.ndarray: 昇順の行番号（条件がなければ全行）
+        """
+        empty = np.empty(0, dtype=np.int32)
+        selected = None
+        conditions = [("file_path", file_path), ("dir", dir_prefix and dir_prefix.strip("/")),
+                      ("extension", extension), ("source", source)]
+        for field, value in conditions:
+            if value is not None:
+                rows = self.postings[field].get(value, empty)
+                selected = rows if selected is None else np.intersect1d(selected, rows, assume_unique=True)
+        if path_glob is not None:
+            postings = [self.postings["file_path"][path] for path in self._paths_matching(path_glob)]
+            rows = np.unique(np.concatenate(postings)) if postings else empty
+            selected = rows if selected is None else np.intersect1d(selected, rows, assume_unique=True)
+        return np.arange(len(self.ids), dtype=np.int32) if selected is None else selected
+
+    def file_counts(self, field: str = "extension") -> dict[str, int]:
+        """フィールドの値ごとのファイル数（例: 拡張子の分布）"""
+        counts = {}
+        for path in self.postings["file_path"]:
+            value = _keys({"file_path": path})[field]
+            for v in value:
+                counts[v] = counts.get(v, 0) + 1
+        return dict(sorted(counts.items(), key=lambda item: -item[1]))
+
+
+def _shard_vectors(db, docs: list[Document]) -> np.ndarray:
+    # ShardedVectorStore の検索結果のベクトルを、IDの "<シャード名>#" からシャードごとにまとめて取り出す
+    by_shard = {}
+    for doc in docs:
+        by_shard.setdefault(doc.id.rsplit("#", 1)[0], []).append(doc.id)
+    vectors = {}
+    for name, ids in by_shard.items():
+        result = db.shards[name]._collection.get(ids=ids, include=["embeddings"])
+        vectors.update(zip(result["ids"], result["embeddings"]))
+    return np.asarray([vectors[doc.id] for doc in docs], dtype=np.float32).reshape(len(docs), -1)
+
+
+def search_candidates(db, metadata_index: MetadataIndex, query_vector, rows: np.ndarray,
+                      k: int = 4, with_vectors: bool = False):
+    """
+    行番号で絞った候補だけを対象に、クエリベクトルに近い上位k件を返す
+
+    Args:
+        db: ベクターストア（Chroma / ShardedVectorStore / LangChainのFAISS / QuantizedVectorStore / SnapshotVectorStore）
+        metadata_index (MetadataIndex): db に登録した順番で作ったインデックス
+        query_vector: クエリの埋め込みベクトル
+        rows (np.ndarray): MetadataIndex.select() の結果
+        k (int): 返す件数
+        with_vectors (bool): 文書の保存済みベクトルも返す（MMRの再ランキング用。再埋め込みはしない）
+
+    Returns:
+        list[Document]: 類似度の高い順の文書（with_vectors なら (文書, ベクトル (件数, 次元数)) のタプル）
+    """
+    k = min(k, len(rows))
+    if k == 0:
+        return ([], np.empty((0, 0), dtype=np.float32)) if with_vectors else []
+    query = np.asarray(query_vector, dtype=np.float32)
+    if hasattr(db, "shards"):
+        # 候補を含むシャードだけに、候補IDを渡して並列に問い合わせる
+        docs = [doc for doc, _ in db.search_by_vector(query, k, ids=[metadata_index.ids[row] for row in rows])]
+        return (docs, _shard_vectors(db, docs)) if with_vectors else docs
+    if hasattr(db, "_collection"):
+        # Chromaは ids を渡すと、その中だけでHNSW探索する
+        result = db._collection.query(query_embeddings=[query], n_results=k,
+                                      ids=[metadata_index.ids[row] for row in rows],
+                                      include=["documents", "metadatas"] + (["embeddings"] if with_vectors else []))
+        docs = [Document(page_content=text, metadata=metadata or {}, id=doc_id)
+                for doc_id, text, metadata in zip(result["ids"][0], result["documents"][0], result["metadatas"][0])]
+        if with_vectors:
+            return docs, np.asarray(result["embeddings"][0], dtype=np.float32).reshape(len(docs), -1)
+        return docs
+    if hasattr(db, "index_to_docstore_id"):
+        # FAISSはIDSelectorで候補以外の行を探索中に読み飛ばす
+        positions = metadata_index.faiss_positions(db)[rows]
+        selector = faiss.IDSelectorBatch(positions[positions >= 0])
+        if hasattr(db.index, "hnsw"):
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(db.index.hnsw.efSearch, k))
+        elif hasattr(db.index, "nprobe"):
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=db.index.nprobe)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        _, found = db.index.search(query[None, :], k, params=params)
+        found = [int(pos) for pos in found[0] if pos >= 0]
+        docs = [db.docstore.search(db.index_to_docstore_id[pos]) for pos in found]
+        if not with_vectors:
+            return docs
+        if hasattr(db.index, "make_direct_map") and found:
+            db.index.make_direct_map()
+        return docs, np.stack([db.index.reconstruct(pos) for pos in found]) if found else np.empty((0, 0))
+    # QuantizedVectorStore / SnapshotVectorStore は候補行のfloat32ベクトルだけで厳密に計算する
+    vectors = db.row_vectors(rows) if hasattr(db, "row_vectors") else np.asarray(db.vectors[rows])
+    scores = vectors @ query
+    top = np.argsort(-scores)[:k]
+    if hasattr(db, "document"):
+        docs = [db.document(int(rows[i])) for i in top]
+    else:
+        docs = [Document(**db.docs[int(rows[i])]) for i in top]
+    return (docs, np.asarray(vectors[top], dtype=np.float32)) if with_vectors else docs
+
+
+class FilteredRetriever(BaseRetriever):
+    """
+    メタデータの条件で候補を絞ってから検索するリトリーバー
+
+    例: FilteredRetriever(vector_store=db, metadata_index=index, filter={"path_glob": "docs/integrations/**/*.mdx"})
+
+    search_type="mmr" なら、絞った候補の中で類似度の上位 fetch_k 件を取り出し、MMRで k 件を選ぶ。
+
+    Args:
+        vector_store: 検索対象のベクターストア
+        metadata_index (MetadataIndex): vector_store に登録した順番で作ったインデックス
+        filter (dict): MetadataIndex.select() に渡す条件
+        k (int): 返す件数
+        search_type (str): "similarity" または "mmr"
+        fetch_k (int): MMRの候補にする件数
+        lambda_mult (float): MMRで1に近いほど関連度、0に近いほど多様性を重視する
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vector_store: object
+    metadata_index: MetadataIndex
+    filter: dict = {}
+    k: int = 4
+    search_type: str = "similarity"
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        rows = self.metadata_index.select(**self.filter)
+        query_vector = self.vector_store.embeddings.embed_query(query)
+        if self.search_type != "mmr":
+            return search_candidates(self.vector_store, self.metadata_index, query_vector, rows, self.k)
+        docs, vectors = search_candidates(self.vector_store, self.metadata_index, query_vector, rows,
+                                          max(self.fetch_k, self.k), with_vectors=True)
+        if not docs:
+            return []
+        return [docs[i] for i in mmr_select(query_vector, vectors, self.k, self.lambda_mult)]
@@ -0,0 +1,129 @@
+# NumPyでベクトル化したMMR（Maximal Marginal Relevance）による多様性の再ランキング
+#
+# LangChainの maximal_marginal_relevance は、1件選ぶたびに候補全体と選択済み全体の類似度を
+# 計算し直し、候補をPythonのループで走査する。ここではクエリとの類似度を行列×ベクトル1回で求めたあと、
+# MMRスコアの上界が大きい候補だけを小さな行列積でまとめて評価する（遅延評価）。
+# 多様性の項は選択が進むほど大きくなるだけなので、上界で打ち切っても結果は通常のMMRと同じになる。
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+# MMRの遅延評価で、1回に正確なスコアを計算する候補数の初期値
+_MMR_BATCH = 16
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def mmr_select(query_embedding, candidate_embeddings, k: int = 4, lambda_mult: float = 0.5,
+               normalized: bool = False) -> list[int]:
+    """
+    MMRで候補から k 件を選ぶ
+
+    score = lambda_mult * sim(query, d) - (1 - lambda_mult) * max(sim(d, 選択済み))
+
+    Args:
+        query_embedding: クエリベクトル (D,)
+        candidate_embeddings: 候補ベクトル (N, D)
+        k (int): 選ぶ件数
+        lambda_mult (float): 1に近いほど関連度、0に近いほど多様性を重視する
+        normalized (bool): ベクトルがL2正規化済みなら True（正規化のコピーを省く）
+
+    Returns:
+        list[int]: 選んだ候補の添字（選んだ順）
+    """
+    candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    k = min(k, len(candidates))
+    if k <= 0:
+        return []
+    if not normalized:
+        candidates, query = _normalize(candidates), _normalize(query)
+
+    relevance = candidates @ query
+    selected = [int(np.argmax(relevance))]
+    # redundancy[i] は候補 i と「選択済みの先頭 seen[i] 件」との最大類似度で、bound[i] はそれを使ったMMRスコア。
+    # 選択済みが増えるほど多様性の項は大きくなるだけなので、古いスコアもその候補の上界として使える
+    redundancy = candidates @ candidates[selected[0]]
+    seen = np.ones(len(candidates), dtype=np.int64)
+    bound = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+    bound[selected[0]] = -np.inf
+    while len(selected) < k:
+        # 上界の大きい候補から batch 件だけ、まだ比べていない選択済みとの類似度を計算してスコアを確定する。
+        # 確定したスコアが残りの上界以上なら選び、そうでなければ batch を倍にする（遅延評価）
+        batch = _MMR_BATCH
+        while True:
+            batch = min(batch, len(candidates) - len(selected))
+            top = np.argpartition(-bound, batch - 1)[:batch]
+            stale = top[seen[top] < len(selected)]
+            if len(stale):
+                start = int(seen[stale].min())
+                # 比較済みの選択済みが含まれても、その類似度は redundancy 以下なので最大値は変わらない
+                similarity = candidates[stale] @ candidates[selected[start:]].T
+                redundancy[stale] = np.maximum(redundancy[stale], similarity.max(axis=1))
+                seen[stale] = len(selected)
+                bound[stale] = lambda_mult * relevance[stale] - (1.0 - lambda_mult) * redundancy[stale]
+            best = int(top[np.argmax(bound[top])])
+            if bound[best] >= bound.max() or batch >= len(candidates) - len(selected):
+                break
+            batch *= 2
+        selected.append(best)
+        bound[best] = -np.inf
+    return selected
+
+
+def _fetch_candidates(db, query_vector: np.ndarray, fetch_k: int) -> tuple[list[Document], np.ndarray]:
+    # 類似度の上位 fetch_k 件と、そのベクトルをストアから取り出す（再埋め込みはしない）
+    if hasattr(db, "_collection"):  # Chroma
+        result = db._collection.query(query_embeddings=[query_vector], n_results=fetch_k,
+                                      include=["documents", "metadatas", "embeddings"])
+        docs = [Document(page_content=text, metadata=metadata or {}, id=doc_id)
+                for doc_id, text, metadata in zip(result["ids"][0], result["documents"][0], result["metadatas"][0])]
+        return docs, np.asarray(result["embeddings"][0], dtype=np.float32).reshape(len(docs), -1)
+    if hasattr(db, "index_to_docstore_id"):  # LangChainのFAISS
+        _, found = db.index.search(query_vector[None, :], fetch_k)
+        positions = [int(pos) for pos in found[0] if pos >= 0]
+        if hasattr(db.index, "make_direct_map") and positions:
+            db.index.make_direct_map()
+        docs = [db.docstore.search(db.index_to_docstore_id[pos]) for pos in positions]
+        vectors = np.stack([db.index.reconstruct(pos) for pos in positions]) if positions else np.empty((0, 0))
+        return docs, vectors
+    if hasattr(db, "search_vector"):  # QuantizedVectorStore / SnapshotVectorStore
+        rows = np.array([row for row, _ in db.search_vector(query_vector, fetch_k)], dtype=np.int64)
+        if hasattr(db, "document"):
+            return [db.document(int(row)) for row in rows], db.row_vectors(rows)
+        return [Document(**db.docs[int(row)]) for row in rows], np.asarray(db.vectors[rows])
+    # その他のストアは本文を埋め込み直す（埋め込みキャッシュがあればAPIは呼ばれない）
+    docs = db.similarity_search_by_vector(query_vector.tolist(), k=fetch_k)
+    return docs, np.asarray(db.embeddings.embed_documents([doc.page_content for doc in docs]), dtype=np.float32)
+
+
+class MMRRetriever(BaseRetriever):
+    """
+    類似度の上位 fetch_k 件を取り出し、MMRで多様性を考慮した k 件を返すリトリーバー
+
+    Args:
+        vector_store: 検索対象のベクターストア
+        k (int): 返す件数
+        fetch_k (int): MMRの候補にする件数
+        lambda_mult (float): 1に近いほど関連度、0に近いほど多様性を重視する
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vector_store: object
+    k: int = 4
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        query_vector = np.asarray(self.vector_store.embeddings.embed_query(query), dtype=np.float32)
+        docs, vectors = _fetch_candidates(self.vector_store, query_vector, self.fetch_k)
+        if not docs:
+            return []
+        return [docs[i] for i in mmr_select(query_vector, vectors, self.k, self.lambda_mult)]
@@ -0,0 +1,98 @@
+# OpenAI互換の埋め込みAPIのモックサーバー（ネットワークなしでの取り込み試験用）
+#
+# POST /v1/embeddings に対し、テキストのハッシュから決定的なベクトルを返す。
+# RPMの上限を超えると429を返すので、レート制限と再試行の動作確認にも使える。
+
+import asyncio
+import base64
+import hashlib
+import time
+from collections import deque
+
+import numpy as np
+from aiohttp import web
+
+DEFAULT_DIMENSIONS = 1536
+
+
+def fake_vector(text, dimensions: int) -> np.ndarray:
+    """テキスト（またはトークン列）から決定的な単位ベクトルを作る"""
+    seed = hashlib.sha256(repr(text).encode("utf-8")).digest()
+    rng = np.random.default_rng(int.from_bytes(seed[:8], "little"))
+    vector = rng.standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def create_app(rpm_limit: int = None, latency: float = 0.0) -> web.Application:
+    """
+    モックサーバーのアプリケーションを作成する
+
+    Args:
+        rpm_limit (int | None): 直近60秒のリクエスト数の上限（Noneなら無制限）
+        latency (float): 1リクエストごとに追加する疑似レイテンシ（秒）
+    """
+    recent = deque()
+    app = web.Application()
+    app["requests"] = 0
+    app["throttled"] = 0
+
+    async def embeddings(request: web.Request) -> web.Response:
+        now = time.monotonic()
+        while recent and now - recent[0] > 60:
+            recent.popleft()
+        if rpm_limit is not None and len(recent) >= rpm_limit:
+            app["throttled"] += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status=429,
+                headers={"retry-after": "1"},
+            )
+        recent.append(now)
+        app["requests"] += 1
+
+        body = await request.json()
+        inputs = body["input"]
+        # 文字列1件・トークン列1件の場合もリストにそろえる
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dimensions = body.get("dimensions") or DEFAULT_DIMENSIONS
+        if latency:
+            await asyncio.sleep(latency)
+
+        data = []
+        for i, item in enumerate(inputs):
+            vector = fake_vector(item, dimensions)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        tokens = sum(len(item) for item in inputs)
+        return web.json_response({
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "mock"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    app.router.add_post("/v1/embeddings", embeddings)
+    return app
+
+
+async def start_server(host: str = "127.0.0.1", port: int = 0, **kwargs):
+    """
+    モックサーバーをバックグラウンドで起動する
+
+    Returns:
+        tuple[web.AppRunner, str]: (停止用のランナー, OpenAIEmbeddingsに渡すbase_url)
+    """
+    runner = web.AppRunner(create_app(**kwargs))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{bound_port}/v1"
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host="127.0.0.1", port=8765)
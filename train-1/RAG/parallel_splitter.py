@@ -0,0 +1,73 @@
+# プロセスプールによるテキスト分割の並列化
+#
+# 文書をシャードに分けて複数プロセスで分割し、元の順序どおりにチャンクを返す。
+# プロセス間ではDocumentではなく (本文, メタデータ) のタプルだけをやり取りして
+# pickleのコストを抑える。
+
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from langchain_core.documents import Document
+
+# ワーカープロセスごとに1回だけ受け取るテキストスプリッター
+_worker_splitter = None
+
+
+def _init_worker(text_splitter) -> None:
+    global _worker_splitter
+    _worker_splitter = text_splitter
+
+
+def _split_shard(shard: list[tuple[str, dict]]) -> list[tuple[str, dict]]:
+    texts = [text for text, _ in shard]
+    metadatas = [metadata for _, metadata in shard]
+    chunks = _worker_splitter.create_documents(texts, metadatas=metadatas)
+    return [(chunk.page_content, chunk.metadata) for chunk in chunks]
+
+
+def _mp_context():
+    # spawnだとワーカーが __main__ を読み込み直し、モジュール直下で処理を書いたスクリプトが
+    # 再実行されてしまうため、使える環境ではforkを使う
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def iter_split_documents(documents, text_splitter, max_workers: int = None, shard_size: int = 256):
+    """
+    文書をシャード単位でプロセスプールに分散して分割し、元の順序でチャンクを返す
+
+    処理中のシャードはワーカー数の2倍までに抑えるため、入力がジェネレーターでも
+    全件をメモリに載せない。
+
+    Args:
+        documents (Iterable[Document]): 分割する文書
+        text_splitter: テキストスプリッター（pickle可能なもの）
+        max_workers (int | None): ワーカープロセス数（省略時はCPUコア数）
+        shard_size (int): 1シャードあたりの文書数
+
+    Yields:
+        Document: メタデータを保持したチャンク（入力順）
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    iterator = ((doc.page_content, doc.metadata) for doc in documents)
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=_mp_context(),
+                             initializer=_init_worker, initargs=(text_splitter,)) as executor:
+        pending = deque()
+        while shard := list(islice(iterator, shard_size)):
+            pending.append(executor.submit(_split_shard, shard))
+            if len(pending) >= max_workers * 2:
+                for text, metadata in pending.popleft().result():
+                    yield Document(page_content=text, metadata=metadata)
+        while pending:
+            for text, metadata in pending.popleft().result():
+                yield Document(page_content=text, metadata=metadata)
+
+
+def split_documents_parallel(documents, text_splitter, max_workers: int = None,
+                             shard_size: int = 256) -> list[Document]:
+    """iter_split_documents() の結果をリストで返す（split_documents と同じ使い方ができる）"""
+    return list(iter_split_documents(documents, text_splitter, max_workers, shard_size))
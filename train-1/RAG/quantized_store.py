@@ -0,0 +1,159 @@
+# 量子化ベクトル（int8 / 1bit）で候補を絞り、ディスク上の元ベクトルで再スコアリングするベクターストア
+#
+# メモリには量子化したベクトルだけを置き（int8で1/4、1bitで1/32）、上位候補だけを
+# memmapしたfloat32ベクトルで厳密に再計算する。
+
+import json
+import os
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+QUANTIZATION_TYPES = ("int8", "binary")
+
+# 量子化ベクトルのスコア計算は、この行数ずつ区切る（float32に戻した一時配列をCPUキャッシュに収める）
+_BLOCK_ROWS = 2_048
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values: np.ndarray) -> np.ndarray:
+        return _POPCOUNT_TABLE[values]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def quantize(vectors: np.ndarray, quantization: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    正規化済みのfloat32ベクトルを量子化する
+
+    Args:
+        vectors (np.ndarray): (N, D) のfloat32ベクトル
+        quantization (str): "int8"（次元ごとのスケールで対称量子化）または "binary"（符号ビット）
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (量子化コード, int8のスケール（binaryでは空配列）)
+    """
+    if quantization == "int8":
+        scale = np.abs(vectors).max(axis=0) / 127.0
+        scale[scale == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+        return codes, scale.astype(np.float32)
+    if quantization == "binary":
+        return np.packbits(vectors > 0, axis=1), np.empty(0, dtype=np.float32)
+    raise ValueError(f"未対応の量子化方式です: {quantization}（{QUANTIZATION_TYPES} から選択）")
+
+
+class QuantizedVectorStore(VectorStore):
+    """
+    量子化ベクトルで候補を生成し、元のfloat32ベクトルで再スコアリングするベクターストア
+
+    Args:
+        embedding: 埋め込みモデル
+        directory (str): インデックスを保存したディレクトリ
+        rescore_factor (int): 再スコアリングする候補数（k の何倍か）
+    """
+
+    def __init__(self, embedding, directory: str, rescore_factor: int = 10):
+        self.embedding = embedding
+        self.directory = directory
+        self.rescore_factor = rescore_factor
+        with open(os.path.join(directory, "config.json"), encoding="utf-8") as f:
+            self.quantization = json.load(f)["quantization"]
+        self.codes = np.load(os.path.join(directory, "codes.npy"))
+        self.scale = np.load(os.path.join(directory, "scale.npy"))
+        # 元ベクトルはメモリに読み込まず、必要な行だけディスクから読む
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "docs.jsonl"), encoding="utf-8") as f:
+            self.docs = [json.loads(line) for line in f]
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    @staticmethod
+    def write(directory: str, vectors: np.ndarray, texts: list[str], metadatas: list[dict],
+              quantization: str = "int8") -> None:
+        """正規化・量子化したインデックスをディレクトリへ書き出す"""
+        os.makedirs(directory, exist_ok=True)
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        codes, scale = quantize(vectors, quantization)
+        np.save(os.path.join(directory, "vectors.npy"), vectors)
+        np.save(os.path.join(directory, "codes.npy"), codes)
+        np.save(os.path.join(directory, "scale.npy"), scale)
+        with open(os.path.join(directory, "docs.jsonl"), "w", encoding="utf-8") as f:
+            for text, metadata in zip(texts, metadatas):
+                f.write(json.dumps({"page_content": text, "metadata": metadata}, ensure_ascii=False) + "\n")
+        with open(os.path.join(directory, "config.json"), "w", encoding="utf-8") as f:
+            json.dump({"quantization": quantization, "dim": vectors.shape[1]}, f)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, directory: str = "./quantized_index",
+                   quantization: str = "int8", rescore_factor: int = 10, **kwargs):
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = embedding.embed_documents(texts)
+        cls.write(directory, vectors, texts, metadatas, quantization)
+        return cls(embedding, directory, rescore_factor=rescore_factor)
+
+    def memory_bytes(self) -> dict:
+        """メモリに載る量子化コードと、同じ件数をfloat32で持った場合のバイト数"""
+        return {"quantized": self.codes.nbytes + self.scale.nbytes,
+                "float32": self.vectors.shape[0] * self.vectors.shape[1] * 4}
+
+    def _candidate_scores(self, query: np.ndarray) -> np.ndarray:
+        # 値が大きいほど類似する近似スコアを、ブロックごとに計算する
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        if self.quantization == "int8":
+            weighted = (query * self.scale).astype(np.float32)
+            for start in range(0, len(self.codes), _BLOCK_ROWS):
+                block = self.codes[start:start + _BLOCK_ROWS]
+                scores[start:start + len(block)] = block.astype(np.float32) @ weighted
+        else:
+            query_bits = np.packbits(query > 0)
+            for start in range(0, len(self.codes), _BLOCK_ROWS):
+                block = self.codes[start:start + _BLOCK_ROWS]
+                distance = _popcount(block ^ query_bits).sum(axis=1, dtype=np.int32)
+                scores[start:start + len(block)] = -distance
+        return scores
+
+    def search_vector(self, query, k: int = 4) -> list[tuple[int, float]]:
+        """
+        量子化スコアで候補を絞り、元ベクトルのコサイン類似度で並べ替える
+
+        Returns:
+            list[tuple[int, float]]: (行番号, コサイン類似度) の上位k件
+        """
+        query = _normalize(np.asarray(query, dtype=np.float32))
+        scores = self._candidate_scores(query)
+        num_candidates = min(len(scores), max(k, k * self.rescore_factor))
+        candidates = np.argpartition(-scores, num_candidates - 1)[:num_candidates]
+        candidates.sort()  # memmapを先頭から順に読むため
+        exact = np.asarray(self.vectors[candidates]) @ query
+        order = np.argsort(-exact)[:k]
+        return [(int(candidates[i]), float(exact[i])) for i in order]
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, **kwargs):
+        return [
+            (Document(page_content=self.docs[row]["page_content"], metadata=self.docs[row]["metadata"]), score)
+            for row, score in self.search_vector(embedding, k)
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs):
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        # コサイン類似度 [-1, 1] を [0, 1] に変換
+        return lambda score: (score + 1.0) / 2.0
@@ -0,0 +1,190 @@
+# 質問の意味でヒットする回答キャッシュ（セマンティックキャッシュ）
+#
+# 質問を埋め込み、以前の質問とのコサイン類似度がしきい値以上で、かつ文脈キー（直近の会話履歴と
+# ブックのバージョンのハッシュ）が一致すれば、LLMを呼ばずに保存済みの回答を返す。
+# 質問ベクトルは (max_entries, 次元数) の配列に持ち、照合は行列×ベクトル1回で行う。
+# 有効期限（TTL）を過ぎた回答は使わず、件数が上限を超えたら最終利用が古いものから捨てる（LRU）。
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_THRESHOLD = 0.95
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_MAX_ENTRIES = 1_000
+
+
+def file_version(path: str, chunk_size: int = 1 << 20) -> str:
+    """ファイル内容のSHA-256（ブックが更新されたら別のバージョンになる）"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def context_key(chat_history, version: str = "", turns: int = 1) -> str:
+    """
+    キャッシュを共有してよい文脈を表すキーを作る
+
+    Args:
+        chat_history (list[tuple[str, str]]): (質問, 回答) のリスト
+        version (str): ブックのバージョンなど、回答の前提になるデータの識別子
+        turns (int): キーに含める直近の会話数（0なら会話履歴は見ない）
+
+    Returns:
+        str: 文脈キー
+    """
+    recent = chat_history[-turns:] if turns > 0 else []
+    raw = "\x00".join([version] + [f"{human}\x01{ai}" for human, ai in recent])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SemanticCache:
+    """
+    意味の近い質問に保存済みの回答を返すインメモリキャッシュ
+
+    Args:
+        embeddings (Embeddings): 質問を埋め込むモデル
+        threshold (float): ヒットとみなすコサイン類似度の下限
+        ttl_seconds (float): 回答を使ってよい秒数
+        max_entries (int): 保存する最大件数。超えた分は最終利用が古いものから削除（LRU）
+        clock: 現在時刻（秒）を返す関数
+    """
+
+    def __init__(self, embeddings: Embeddings, threshold: float = DEFAULT_THRESHOLD,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 clock=time.monotonic):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        # スロット番号 -> (回答, 保存時刻)。並び順が最終利用順（末尾が最新）
+        self._entries = OrderedDict()
+        self._vectors = None
+        self._contexts = np.full(max_entries, -1, dtype=np.int64)
+        # 文脈キーと文脈IDの対応と、文脈IDごとの保存件数（最後の1件が消えたら文脈IDも消す）
+        self._context_ids = {}
+        self._context_counts = {}
+        self._context_keys = {}
+        self._next_context_id = 0
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _context_id(self, context: str) -> int:
+        if context not in self._context_ids:
+            self._context_ids[context] = self._next_context_id
+            self._context_keys[self._next_context_id] = context
+            self._next_context_id += 1
+        return self._context_ids[context]
+
+    def _remove(self, slot: int) -> None:
+        del self._entries[slot]
+        context_id = int(self._contexts[slot])
+        self._contexts[slot] = -1
+        self._context_counts[context_id] -= 1
+        if not self._context_counts[context_id]:
+            del self._context_counts[context_id]
+            del self._context_ids[self._context_keys.pop(context_id)]
+
+    def lookup(self, question: str, context: str = "") -> tuple[object, np.ndarray]:
+        """
+        キャッシュを引く
+
+        Args:
+            question (str): 質問
+            context (str): context_key() で作った文脈キー
+
+        Returns:
+            tuple: (回答（ミスなら None）, 質問ベクトル（store() に渡すと埋め込みを省ける）)
+        """
+        vector = self._embed(question)
+        with self._lock:
+            if self._vectors is not None and context in self._context_ids:
+                candidates = np.flatnonzero(self._contexts == self._context_ids[context])
+                scores = self._vectors[candidates] @ vector
+                # しきい値以上の候補を類似度の高い順に見て、期限切れでない最初の回答を返す
+                for index in np.argsort(-scores):
+                    if scores[index] < self.threshold:
+                        break
+                    slot = int(candidates[index])
+                    answer, stored_at = self._entries[slot]
+                    if self.clock() - stored_at <= self.ttl_seconds:
+                        self._entries.move_to_end(slot)
+                        self.hits += 1
+                        return answer, vector
+                    self._remove(slot)
+                    self.expired += 1
+            self.misses += 1
+            return None, vector
+
+    def store(self, question: str, answer, context: str = "", vector: np.ndarray = None) -> None:
+        """
+        回答を保存する
+
+        Args:
+            question (str): 質問
+            answer: 回答（文字列以外でもよい）
+            context (str): context_key() で作った文脈キー
+            vector (np.ndarray | None): lookup() が返した質問ベクトル
+        """
+        if vector is None:
+            vector = self._embed(question)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            now = self.clock()
+            # 期限切れを先に捨て、それでも満杯なら最終利用が最も古いものを捨てる
+            for slot in [slot for slot, (_, stored_at) in self._entries.items()
+                         if now - stored_at > self.ttl_seconds]:
+                self._remove(slot)
+                self.expired += 1
+            if len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evicted += 1
+            slot = int(np.flatnonzero(self._contexts < 0)[0])
+            self._vectors[slot] = vector
+            context_id = self._context_id(context)
+            self._contexts[slot] = context_id
+            self._context_counts[context_id] = self._context_counts.get(context_id, 0) + 1
+            self._entries[slot] = (answer, now)
+
+    def invoke(self, chain, inputs: dict, context: str = "", question_key: str = "question"):
+        """
+        キャッシュにあれば保存済みの回答を返し、なければ chain.invoke(inputs) の結果を保存して返す
+
+        Args:
+            chain: Runnable（qa_chain など）
+            inputs (dict): chain に渡す入力
+            context (str): context_key() で作った文脈キー
+            question_key (str): inputs の中の質問のキー
+        """
+        answer, vector = self.lookup(inputs[question_key], context)
+        if answer is None:
+            answer = chain.invoke(inputs)
+            self.store(inputs[question_key], answer, context, vector)
+        return answer
+
+    def stats(self) -> dict:
+        """ヒット／ミス数、ヒット率と保存件数を返す"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "entries": len(self._entries),
+        }
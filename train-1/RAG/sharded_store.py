@@ -0,0 +1,232 @@
+# シャード分割したベクターストア（並列に問い合わせ、ヒープで上位k件をマージする）
+#
+# コーパス全体を1つのChromaコレクションに入れると、クエリのレイテンシも作り直しのコストも
+# リポジトリ全体の大きさに比例して増える。ここでは文書を docs ディレクトリ単位（またはパスのハッシュ）で
+# シャードに分け、シャードごとに永続化したChromaを持つ。
+#   - 検索: クエリを1回だけ埋め込み、全シャードへスレッドプールで同時に問い合わせ、
+#           各シャードの結果（距離の昇順）を heapq.merge で k 件までマージする
+#   - 構築: シャードごとに独立して作る（並列に作成でき、1シャードだけの作り直しもできる）
+#           重複チャンクの除去もシャードの中で行うので、1シャードだけ作り直しても全体を作り直したときと同じになる
+
+import heapq
+import json
+import os
+import shutil
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from dedup import deduplicate
+
+SHARD_STRATEGIES = ("directory", "hash")
+LAYOUT_FILE = "shards.json"
+# 全シャードで同じ距離（コサイン距離）を使うので、シャードをまたいで距離を比較できる
+_COLLECTION_CONFIGURATION = {"hnsw": {"space": "cosine"}}
+
+
+def shard_name(file_path: str, strategy: str = "directory", num_shards: int = 8, depth: int = 2) -> str:
+    """
+    ファイルパスからシャード名を決める（同じファイルのチャンクは必ず同じシャードに入る）
+
+    Args:
+        file_path (str): リポジトリ相対パス
+        strategy (str): "directory"（先頭 depth 階層のディレクトリ）または "hash"（パスのCRC32）
+        num_shards (int): hashのときのシャード数
+        depth (int): directoryのときに使うディレクトリの階層数
+
+    Returns:
+        str: シャード名
+    """
+    if strategy == "hash":
+        return f"hash-{zlib.crc32(file_path.encode('utf-8')) % num_shards:03d}"
+    if strategy == "directory":
+        directory = "/".join(file_path.split("/")[:-1][:depth])
+        return directory or "_root"
+    raise ValueError(f"未対応のシャード分割方法です: {strategy}（{SHARD_STRATEGIES} から選択）")
+
+
+class ShardedVectorStore(VectorStore):
+    """
+    シャードごとのChromaをまとめて1つのベクターストアとして検索する
+
+    Args:
+        embedding: 埋め込みモデル
+        directory (str): シャードを保存したディレクトリ（create() で作成したもの）
+        max_workers (int | None): 問い合わせ・構築に使うスレッド数（省略時はシャード数、最大32）
+    """
+
+    def __init__(self, embedding, directory: str, max_workers: int = None):
+        self.embedding = embedding
+        self.directory = directory
+        with open(os.path.join(directory, LAYOUT_FILE), encoding="utf-8") as f:
+            self.layout = json.load(f)
+        self.shards = {name: self._open_shard(name) for name in self.layout["shards"]}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or min(32, max(1, len(self.shards))))
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def _shard_directory(self, name: str) -> str:
+        return os.path.join(self.directory, name.replace("/", "__"))
+
+    def _open_shard(self, name: str) -> Chroma:
+        return Chroma(persist_directory=self._shard_directory(name), embedding_function=self.embedding,
+                      collection_configuration=_COLLECTION_CONFIGURATION)
+
+    def _save_layout(self) -> None:
+        path = os.path.join(self.directory, LAYOUT_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.layout, f, ensure_ascii=False, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def shard_for(self, metadata: dict) -> str:
+        """メタデータ（file_path / source）からシャード名を決める"""
+        return shard_name(metadata.get("file_path") or metadata.get("source", ""), self.layout["strategy"],
+                          self.layout["num_shards"], self.layout["depth"])
+
+    @classmethod
+    def create(cls, docs, embedding, directory: str, strategy: str = "directory", num_shards: int = 8,
+               depth: int = 2, files: dict = None, max_workers: int = None,
+               dedup_threshold: float = None) -> "ShardedVectorStore":
+        """
+        文書をシャードに振り分け、シャードごとのChromaを並列に作成する
+
+        Args:
+            docs (list[Document]): 登録するチャンク
+            embedding: 埋め込みモデル
+            directory (str): 保存先ディレクトリ（既存の内容は削除される）
+            strategy (str): "directory" または "hash"
+            num_shards (int): hashのときのシャード数
+            depth (int): directoryのときに使うディレクトリの階層数
+            files (dict | None): 元ファイルの {パス: blob SHA}（シャードごとに記録し、差分更新に使う）
+            max_workers (int | None): スレッド数
+            dedup_threshold (float | None): 指定するとシャードごとに重複チャンクをまとめる（近似重複のしきい値）
+
+        Returns:
+            ShardedVectorStore: 作成したベクターストア
+        """
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        layout = {"strategy": strategy, "num_shards": num_shards, "depth": depth, "shards": {}}
+        with open(os.path.join(directory, LAYOUT_FILE), "w", encoding="utf-8") as f:
+            json.dump(layout, f)
+        store = cls(embedding, directory, max_workers=max_workers or 8)
+        groups, shard_files = {}, {}
+        for doc in docs:
+            groups.setdefault(store.shard_for(doc.metadata), []).append(doc)
+        for path, sha in (files or {}).items():
+            shard_files.setdefault(store.shard_for({"file_path": path}), {})[path] = sha
+        # 各シャードは独立しているので、埋め込みとupsertを並列に進められる
+        list(store.executor.map(
+            lambda name: store.rebuild_shard(name, groups[name], files=shard_files.get(name), save_layout=False,
+                                             dedup_threshold=dedup_threshold),
+            groups,
+        ))
+        store._save_layout()
+        return store
+
+    def rebuild_shard(self, name: str, docs: list[Document], files: dict = None, save_layout: bool = True,
+                      dedup_threshold: float = None) -> int:
+        """
+        1つのシャードだけを作り直す（他のシャードはそのまま検索に使える）
+
+        Args:
+            name (str): シャード名
+            docs (list[Document]): このシャードに入れるチャンク（空ならシャードを削除する）
+            files (dict | None): このシャードの元ファイルの {パス: blob SHA}
+            save_layout (bool): シャード一覧を保存するか
+            dedup_threshold (float | None): 指定するとこのシャードの中で重複チャンクをまとめる（近似重複のしきい値）
+
+        Returns:
+            int: 登録したチャンク数（重複をまとめた後）
+        """
+        if dedup_threshold is not None:
+            docs, _ = deduplicate(docs, threshold=dedup_threshold)
+        if name in self.shards:
+            # 開いているコレクションを削除してから作り直す（ディレクトリごと消すと開いたままの接続が壊れる）
+            self.shards.pop(name).delete_collection()
+        if docs:
+            shard = self._open_shard(name)
+            shard.add_documents(docs, ids=[f"{name}#{i}" for i in range(len(docs))])
+            self.shards[name] = shard
+            self.layout["shards"][name] = {"chunks": len(docs), "files": files or {}}
+        else:
+            self.layout["shards"].pop(name, None)
+        if save_layout:
+            self._save_layout()
+        return len(docs)
+
+    def stale_shards(self, files: dict) -> dict[str, dict]:
+        """
+        現在のファイル一覧と記録済みのblob SHAを比べ、作り直しが必要なシャードを返す
+
+        Args:
+            files (dict): 現在の {パス: blob SHA}
+
+        Returns:
+            dict[str, dict]: {シャード名: そのシャードの現在の {パス: blob SHA}}（消えたシャードは空dict）
+        """
+        current = {}
+        for path, sha in files.items():
+            current.setdefault(self.shard_for({"file_path": path}), {})[path] = sha
+        names = current.keys() | self.layout["shards"].keys()
+        return {name: current.get(name, {}) for name in sorted(names)
+                if current.get(name, {}) != self.layout["shards"].get(name, {}).get("files")}
+
+    def search_by_vector(self, query_vector, k: int = 4, ids: list[str] = None) -> list[tuple[Document, float]]:
+        """
+        全シャードへ並列に問い合わせ、距離の小さい順に上位k件をマージする
+
+        Args:
+            query_vector: クエリの埋め込みベクトル
+            k (int): 返す件数
+            ids (list[str] | None): 検索対象をこのIDに限定する（MetadataIndexで絞った候補など）
+
+        Returns:
+            list[tuple[Document, float]]: (文書, コサイン距離) のリスト
+        """
+        targets = {name: None for name in self.shards}
+        if ids is not None:
+            # IDは "<シャード名>#<連番>" なので、候補を含むシャードだけに問い合わせる
+            targets = {}
+            for doc_id in ids:
+                targets.setdefault(doc_id.rsplit("#", 1)[0], []).append(doc_id)
+
+        def query_shard(item):
+            name, shard_ids = item
+            collection = self.shards[name]._collection
+            result = collection.query(query_embeddings=[query_vector], ids=shard_ids,
+                                      n_results=min(k, len(shard_ids or []) or self.layout["shards"][name]["chunks"]),
+                                      include=["documents", "metadatas", "distances"])
+            return [(Document(page_content=text, metadata=metadata or {}, id=doc_id), distance)
+                    for doc_id, text, metadata, distance in zip(result["ids"][0], result["documents"][0],
+                                                                 result["metadatas"][0], result["distances"][0])]
+
+        results = self.executor.map(query_shard, [(n, i) for n, i in targets.items() if n in self.shards])
+        return list(islice(heapq.merge(*results, key=lambda item: item[1]), k))
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, directory: str = "./sharded_index", **kwargs):
+        metadatas = metadatas or [{} for _ in texts]
+        docs = [Document(page_content=text, metadata=metadata) for text, metadata in zip(texts, metadatas)]
+        return cls.create(docs, embedding, directory, **kwargs)
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, **kwargs):
+        return self.search_by_vector(embedding, k)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs):
+        return self.search_by_vector(self.embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.search_by_vector(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        return self._cosine_relevance_score_fn
@@ -0,0 +1,365 @@
+# チャンクと埋め込みベクトルのスナップショット（mmapで開ける列指向フォーマット）
+#
+# ビルド用マシンで作ったインデックスを、ChromaのAPIで1行ずつ入れ直さずに配信用マシンへ移すための形式。
+#
+#   snapshot.json          件数・次元数・ベクトルの型・列名
+#   vectors.npy            (N, D) の連続したfloat32またはint8行列（L2正規化済み）
+#   scale.npy              int8のときの行ごとのスケール (N,)
+#   <列名>.offsets.npy     Arrowの文字列列と同じレイアウト：(N+1,) のint64オフセット
+#   <列名>.data.bin        全行のUTF-8バイト列を連結したもの
+#   ann.faiss              （任意）build_ann() で作るFAISSインデックス
+#
+# 列は id / text / metadata（JSON文字列）。どのファイルもmmapで開くだけなので、
+# 数GBのスナップショットでもPythonオブジェクトへのコピーなしにすぐ検索を始められる。
+
+import json
+import os
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from faiss_store import make_faiss_index, set_search_params
+from streaming_ingest import upsert_embeddings
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DTYPES = ("float32", "int8")
+COLUMNS = ("id", "text", "metadata")
+ANN_FILE = "ann.faiss"
+
+# 全件探索は、この行数ずつ区切ってスコアを計算する（int8をfloat32に戻す一時配列を小さく保つ）
+_BLOCK_ROWS = 8_192
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class SnapshotWriter:
+    """
+    スナップショットをバッチ単位で書き出すライター
+
+    件数が分かっていれば、ベクトルは書き込み先の.npyをmmapして直接埋めるので、
+    全件をメモリに載せずに書き出せる。int8は行ごとのスケールで量子化する
+    （全体の統計を先に取る必要がないため、1パスで書ける）。
+
+    Args:
+        directory (str): 書き出し先ディレクトリ
+        count (int): 全件数
+        dim (int): ベクトルの次元数
+        dtype (str): "float32" または "int8"
+    """
+
+    def __init__(self, directory: str, count: int, dim: int, dtype: str = "float32"):
+        if dtype not in SNAPSHOT_DTYPES:
+            raise ValueError(f"未対応の型です: {dtype}（{SNAPSHOT_DTYPES} から選択）")
+        os.makedirs(directory, exist_ok=True)
+        # 上書き中に落ちても古い snapshot.json で開かれないよう、先に消しておく（close() で書き直す）
+        if os.path.exists(os.path.join(directory, "snapshot.json")):
+            os.remove(os.path.join(directory, "snapshot.json"))
+        self.directory = directory
+        self.count = count
+        self.dim = dim
+        self.dtype = dtype
+        self.rows = 0
+        self.vectors = np.lib.format.open_memmap(os.path.join(directory, "vectors.npy"), mode="w+",
+                                                 dtype=dtype, shape=(count, dim))
+        self.scale = np.ones(count if dtype == "int8" else 0, dtype=np.float32)
+        self.data_files = {name: open(os.path.join(directory, f"{name}.data.bin"), "wb") for name in COLUMNS}
+        self.offsets = {name: [0] for name in COLUMNS}
+
+    def append(self, ids: list[str], texts: list[str], metadatas: list[dict], vectors) -> None:
+        """1バッチ分の行を追加する"""
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        start, end = self.rows, self.rows + len(vectors)
+        if end > self.count:
+            raise ValueError(f"件数が指定値（{self.count}）を超えています")
+        if self.dtype == "int8":
+            scale = np.abs(vectors).max(axis=1) / 127.0
+            scale[scale == 0] = 1.0
+            self.vectors[start:end] = np.clip(np.rint(vectors / scale[:, None]), -127, 127)
+            self.scale[start:end] = scale
+        else:
+            self.vectors[start:end] = vectors
+        values = {"id": ids, "text": texts,
+                  "metadata": [json.dumps(m or {}, ensure_ascii=False) for m in metadatas]}
+        for name in COLUMNS:
+            for value in values[name]:
+                encoded = value.encode("utf-8")
+                self.data_files[name].write(encoded)
+                self.offsets[name].append(self.offsets[name][-1] + len(encoded))
+        self.rows = end
+
+    def close(self, info: dict = None) -> int:
+        """
+        オフセットと設定を書き込んで完了する（snapshot.json は最後に書く）
+
+        Args:
+            info (dict | None): snapshot.json の "info" に残す値（作成元データのチェックサムなど）
+
+        Returns:
+            int: 書き出した件数
+        """
+        if self.rows != self.count:
+            raise ValueError(f"書き出した件数（{self.rows}）が指定値（{self.count}）と一致しません")
+        self.vectors.flush()
+        del self.vectors
+        for name in COLUMNS:
+            self.data_files[name].close()
+            np.save(os.path.join(self.directory, f"{name}.offsets.npy"), np.array(self.offsets[name], dtype=np.int64))
+        np.save(os.path.join(self.directory, "scale.npy"), self.scale)
+        with open(os.path.join(self.directory, "snapshot.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": SNAPSHOT_VERSION, "count": self.count, "dim": self.dim,
+                       "dtype": self.dtype, "columns": list(COLUMNS), "info": info or {}}, f, ensure_ascii=False)
+        return self.count
+
+
+def _iter_collection_batches(collection, batch_size: int):
+    # Chromaのコレクションをページ単位で読み出す
+    for offset in range(0, collection.count(), batch_size):
+        page = collection.get(limit=batch_size, offset=offset, include=["documents", "metadatas", "embeddings"])
+        yield page["ids"], page["documents"], page["metadatas"], page["embeddings"]
+
+
+def _collection_dim(collection) -> int:
+    first = collection.get(limit=1, include=["embeddings"])
+    return len(first["embeddings"][0]) if len(first["ids"]) else 0
+
+
+def _iter_store_batches(db, batch_size: int):
+    # ベクターストアの中身を (ids, texts, metadatas, vectors) のバッチで読み出す
+    if hasattr(db, "_collection"):  # Chroma
+        yield from _iter_collection_batches(db._collection, batch_size)
+    elif hasattr(db, "shards"):  # ShardedVectorStore（シャードごとのChromaを順に読む）
+        for shard in db.shards.values():
+            yield from _iter_collection_batches(shard._collection, batch_size)
+    elif hasattr(db, "index_to_docstore_id"):  # LangChainのFAISS
+        if hasattr(db.index, "make_direct_map"):
+            db.index.make_direct_map()
+        for start in range(0, db.index.ntotal, batch_size):
+            end = min(start + batch_size, db.index.ntotal)
+            ids = [db.index_to_docstore_id[i] for i in range(start, end)]
+            docs = [db.docstore.search(doc_id) for doc_id in ids]
+            yield ids, [d.page_content for d in docs], [d.metadata for d in docs], db.index.reconstruct_n(start, end - start)
+    elif hasattr(db, "docs") and hasattr(db, "vectors"):  # QuantizedVectorStore
+        for start in range(0, len(db.docs), batch_size):
+            rows = range(start, min(start + batch_size, len(db.docs)))
+            docs = [db.docs[row] for row in rows]
+            yield ([str(row) for row in rows], [d["page_content"] for d in docs], [d["metadata"] for d in docs],
+                   db.vectors[rows.start:rows.stop])
+    else:
+        raise TypeError(f"スナップショットに書き出せないベクターストアです: {type(db).__name__}")
+
+
+def _store_size(db) -> tuple[int, int]:
+    if hasattr(db, "_collection"):
+        return db._collection.count(), _collection_dim(db._collection)
+    if hasattr(db, "shards"):
+        collections = [shard._collection for shard in db.shards.values()]
+        dims = [_collection_dim(collection) for collection in collections if collection.count()]
+        return sum(collection.count() for collection in collections), (dims[0] if dims else 0)
+    if hasattr(db, "index_to_docstore_id"):
+        return db.index.ntotal, db.index.d
+    if hasattr(db, "docs") and hasattr(db, "vectors"):
+        return len(db.docs), db.vectors.shape[1]
+    raise TypeError(f"スナップショットに書き出せないベクターストアです: {type(db).__name__}")
+
+
+def export_snapshot(db, directory: str, dtype: str = "float32", batch_size: int = 5_000, info: dict = None) -> int:
+    """
+    ベクターストア（Chroma / ShardedVectorStore / FAISS / QuantizedVectorStore）の中身をスナップショットへ書き出す
+
+    埋め込み済みのベクトルをそのまま書き出すので、再埋め込みは発生しない。
+
+    Args:
+        db: 書き出すベクターストア
+        directory (str): 書き出し先ディレクトリ
+        dtype (str): ベクトルの型（"float32" / "int8"）
+        batch_size (int): 1回に読み出す件数
+        info (dict | None): snapshot.json に残す値（snapshot_info() で読み出せる）
+
+    Returns:
+        int: 書き出した件数
+    """
+    count, dim = _store_size(db)
+    writer = SnapshotWriter(directory, count, dim, dtype)
+    for ids, texts, metadatas, vectors in _iter_store_batches(db, batch_size):
+        writer.append(ids, texts, metadatas, vectors)
+    return writer.close(info)
+
+
+def snapshot_info(directory: str) -> dict | None:
+    """
+    書き出し時に export_snapshot(info=...) で残した値を返す
+
+    Returns:
+        dict | None: info（書き出しが完了したスナップショットがなければ None）
+    """
+    path = os.path.join(directory, "snapshot.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("info", {})
+
+
+def import_snapshot(directory: str, db, batch_size: int = 5_000) -> int:
+    """
+    スナップショットを埋め込み済みベクトルごとベクターストアへ一括upsertする
+
+    Args:
+        directory (str): スナップショットのディレクトリ
+        db: 登録先のベクターストア（Chromaなど）
+        batch_size (int): 1回にupsertする件数
+
+    Returns:
+        int: 登録した件数
+    """
+    snapshot = SnapshotVectorStore(None, directory)
+    for start in range(0, len(snapshot), batch_size):
+        rows = range(start, min(start + batch_size, len(snapshot)))
+        upsert_embeddings(
+            db,
+            [snapshot.columns["id"][row] for row in rows],
+            [snapshot.columns["text"][row] for row in rows],
+            [json.loads(snapshot.columns["metadata"][row]) or None for row in rows],
+            snapshot.row_vectors(slice(rows.start, rows.stop)).tolist(),
+        )
+    return len(snapshot)
+
+
+def build_ann(directory: str, index_type: str = "hnsw", **index_kwargs) -> None:
+    """
+    スナップショットのベクトルからFAISSインデックスを作り、ann.faiss として保存する
+
+    Args:
+        directory (str): スナップショットのディレクトリ
+        index_type (str): "flat" / "ivfpq" / "hnsw"
+        **index_kwargs: make_faiss_index() に渡す追加の引数
+    """
+    snapshot = SnapshotVectorStore(None, directory)
+    index = make_faiss_index(index_type, snapshot.dim, len(snapshot), **index_kwargs)
+    if not index.is_trained:
+        sample = np.random.default_rng(0).choice(len(snapshot), min(len(snapshot), 256 * 1024), replace=False)
+        index.train(snapshot.row_vectors(np.sort(sample)))
+    for start in range(0, len(snapshot), _BLOCK_ROWS):
+        index.add(snapshot.row_vectors(slice(start, start + _BLOCK_ROWS)))
+    faiss.write_index(index, os.path.join(directory, ANN_FILE))
+
+
+class _StringColumn:
+    """Arrow形式（オフセット + 連結バイト列）の文字列列を、mmapしたまま1行ずつ読む"""
+
+    def __init__(self, directory: str, name: str):
+        self.offsets = np.load(os.path.join(directory, f"{name}.offsets.npy"), mmap_mode="r")
+        path = os.path.join(directory, f"{name}.data.bin")
+        # 長さ0のファイルはmmapできない
+        self.data = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else np.empty(0, np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return self.data[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+
+class SnapshotVectorStore(VectorStore):
+    """
+    スナップショットをmmapで開いて検索するベクターストア
+
+    テキストとメタデータは検索結果に返す行だけをデコードする。
+
+    Args:
+        embedding: クエリの埋め込みに使うモデル
+        directory (str): スナップショットのディレクトリ
+        use_ann (bool): ann.faiss があればそれで検索する（なければ全件探索）
+        nprobe (int): IVFの探索クラスタ数
+        ef_search (int): HNSWの探索幅
+    """
+
+    def __init__(self, embedding, directory: str, use_ann: bool = False, nprobe: int = 16, ef_search: int = 64):
+        self.embedding = embedding
+        self.directory = directory
+        with open(os.path.join(directory, "snapshot.json"), encoding="utf-8") as f:
+            config = json.load(f)
+        self.dim = config["dim"]
+        self.dtype = config["dtype"]
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        self.scale = np.load(os.path.join(directory, "scale.npy"), mmap_mode="r")
+        self.columns = {name: _StringColumn(directory, name) for name in config["columns"]}
+        self.ann = None
+        ann_path = os.path.join(directory, ANN_FILE)
+        if use_ann and os.path.exists(ann_path):
+            self.ann = faiss.read_index(ann_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            set_search_params(self.ann, nprobe=nprobe, ef_search=ef_search)
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, directory: str = "./snapshot",
+                   dtype: str = "float32", **kwargs):
+        texts = list(texts)
+        vectors = np.asarray(embedding.embed_documents(texts), dtype=np.float32)
+        writer = SnapshotWriter(directory, len(texts), vectors.shape[1], dtype)
+        writer.append(ids or [str(i) for i in range(len(texts))], texts, metadatas or [{} for _ in texts], vectors)
+        writer.close()
+        return cls(embedding, directory, **kwargs)
+
+    def row_vectors(self, rows) -> np.ndarray:
+        """
+        指定した行のベクトルをfloat32で返す（int8はスケールを掛けて戻す）
+
+        Args:
+            rows: スライスまたは行番号の配列
+        """
+        block = np.asarray(self.vectors[rows], dtype=np.float32)
+        return block * np.asarray(self.scale[rows])[:, None] if self.dtype == "int8" else block
+
+    def document(self, row: int) -> Document:
+        """指定した行の文書をデコードする"""
+        return Document(page_content=self.columns["text"][row], metadata=json.loads(self.columns["metadata"][row]),
+                        id=self.columns["id"][row])
+
+    def search_vector(self, query, k: int = 4) -> list[tuple[int, float]]:
+        """
+        クエリベクトルの上位k件を探す（ann.faissがあればANN、なければmmap行列の全件探索）
+
+        Returns:
+            list[tuple[int, float]]: (行番号, コサイン類似度) のリスト
+        """
+        query = _normalize(np.asarray(query, dtype=np.float32))
+        k = min(k, len(self))
+        if k == 0:
+            return []
+        if self.ann is not None:
+            scores, rows = self.ann.search(query[None, :], k)
+            return [(int(row), float(score)) for row, score in zip(rows[0], scores[0]) if row >= 0]
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), _BLOCK_ROWS):
+            end = min(start + _BLOCK_ROWS, len(self))
+            scores[start:end] = self.row_vectors(slice(start, end)) @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top]
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, **kwargs):
+        return [(self.document(row), score) for row, score in self.search_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs):
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        # コサイン類似度 [-1, 1] を [0, 1] に変換
+        return lambda score: (score + 1.0) / 2.0
@@ -0,0 +1,123 @@
+# メモリ使用量を一定に保つストリーミング取り込みパイプライン
+#
+# load → split → embed → upsert をジェネレーターでつなぎ、文書・チャンク・ベクトルを
+# 全件まとめてメモリに載せずに、固定サイズのバッチ単位でベクターストアへ書き込む。
+
+import resource
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from dedup import deduplicate
+
+
+def iter_documents(loader):
+    """ローダーから文書を1件ずつ読み込む（lazy_loadを使い、全件をリストにしない）"""
+    yield from loader.lazy_load()
+
+
+def iter_chunks(documents, text_splitter, dedup_threshold: float = None):
+    """
+    文書ごとに分割し、(チャンクID, チャンク) を1件ずつ返す
+
+    チャンクIDは "<ファイルパス>#<連番>" で、incremental_index と同じ形式にしている。
+
+    Args:
+        documents (Iterable[Document]): 分割する文書
+        text_splitter: テキストスプリッター
+        dedup_threshold (float | None): 指定すると文書ごとに完全一致・近似重複のチャンクをまとめる
+            （全件を溜めないので、文書をまたぐ重複はまとめない）
+
+    Yields:
+        tuple[str, Document]: (チャンクID, チャンク)
+    """
+    for doc in documents:
+        source = doc.metadata.get("file_path") or doc.metadata.get("source", "")
+        chunks = text_splitter.split_documents([doc])
+        if dedup_threshold is not None:
+            chunks, _ = deduplicate(chunks, threshold=dedup_threshold)
+        for i, chunk in enumerate(chunks):
+            yield f"{source}#{i}", chunk
+
+
+def batched(iterable, size: int):
+    """イテラブルを size 件ずつのリストに区切る"""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def upsert_embeddings(db, ids: list[str], texts: list[str], metadatas: list[dict],
+                      vectors: list[list[float]]) -> None:
+    """
+    計算済みのベクトルをベクターストアへupsertする
+
+    Args:
+        db: ベクターストア（Chroma、または add_embeddings を持つもの）
+        ids (list[str]): チャンクID
+        texts (list[str]): チャンク本文
+        metadatas (list[dict]): チャンクのメタデータ
+        vectors (list[list[float]]): 埋め込みベクトル
+    """
+    if hasattr(db, "add_embeddings"):
+        db.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+        return
+    # Chromaは空のメタデータを受け付けないため None にする
+    db._collection.upsert(
+        ids=ids,
+        embeddings=vectors,
+        documents=texts,
+        metadatas=[metadata or None for metadata in metadatas],
+    )
+
+
+def peak_rss_mb() -> float:
+    """このプロセスのピークRSS（MB）を返す"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linuxはキロバイト、macOSはバイト単位
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def ingest(chunks, embeddings, db, batch_size: int = 256, max_in_flight: int = 4) -> dict:
+    """
+    チャンクをバッチ単位で埋め込み、順次ベクターストアへupsertする
+
+    埋め込みはスレッドプールで並行に行うが、処理中のバッチが max_in_flight 個に達したら
+    最も古いバッチの完了を待ってから次を読み込む（バックプレッシャー）。
+
+    Args:
+        chunks (Iterable[tuple[str, Document]]): iter_chunks() の戻り値
+        embeddings: 埋め込みモデル
+        db: 書き込み先のベクターストア
+        batch_size (int): 1回の埋め込みで送るチャンク数
+        max_in_flight (int): 同時に処理中にしておく最大バッチ数
+
+    Returns:
+        dict: チャンク数、バッチ数、経過秒数、ピークRSS（MB）
+    """
+    started = time.perf_counter()
+    stats = {"chunks": 0, "batches": 0}
+    pending = deque()
+
+    def flush_oldest():
+        ids, texts, metadatas, future = pending.popleft()
+        upsert_embeddings(db, ids, texts, metadatas, future.result())
+        stats["chunks"] += len(ids)
+        stats["batches"] += 1
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for batch in batched(chunks, batch_size):
+            ids = [chunk_id for chunk_id, _ in batch]
+            texts = [chunk.page_content for _, chunk in batch]
+            metadatas = [chunk.metadata for _, chunk in batch]
+            pending.append((ids, texts, metadatas, executor.submit(embeddings.embed_documents, texts)))
+            if len(pending) >= max_in_flight:
+                flush_oldest()
+        while pending:
+            flush_oldest()
+
+    stats["seconds"] = time.perf_counter() - started
+    stats["peak_rss_mb"] = peak_rss_mb()
+    return stats
@@ -0,0 +1,5 @@
+# テストから train-1/RAG 直下のモジュール（web_fetcher / git_blob_loader など）を読み込めるようにする
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,41 @@
+# docs_crawler のテスト（test_web_fetcher と同じローカルのaiohttpサーバーを使う）
+
+import asyncio
+
+from docs_crawler import DocsCrawler, normalize_url
+from test_web_fetcher import DocsSite, serve
+from web_fetcher import HttpCache
+
+
+def html(body: str) -> str:
+    return f"<html><head><title>t</title></head><body><main>{body}</main></body></html>"
+
+
+def test_relative_links_resolve_against_directory_url(tmp_path):
+    # 末尾スラッシュ付きのページの href="b" は /docs/b を指す（/b ではない）
+    site = DocsSite({
+        "/docs/": html('<h1>Docs</h1><p>index page</p><a href="b">B</a> <a href="./c#usage">C</a>'),
+        "/docs/b": html("<p>page b v1</p>"),
+        "/docs/c": html("<p>page c</p>"),
+    })
+
+    def crawl(base):
+        crawler = DocsCrawler(state_path=str(tmp_path / "state.json"), cache=HttpCache(str(tmp_path / "cache")))
+        return crawler.acrawl(start_url=f"{base}/docs/")
+
+    async def scenario(base):
+        first = await crawl(base)
+        site.pages["/docs/b"] = html("<p>page b v2</p>")
+        second = await crawl(base)
+        return base, first, second
+
+    base, (first_docs, _, first_stats), (second_docs, second_deleted, second_stats) = asyncio.run(serve(site, scenario))
+
+    assert sorted(doc.metadata["source"] for doc in first_docs) == \
+        [normalize_url(f"{base}/docs/"), normalize_url(f"{base}/docs/b"), normalize_url(f"{base}/docs/c")]
+    assert first_stats["new"] == 3 and first_stats["errors"] == 0
+    # 2回目は変更した /docs/b だけが出力される
+    assert [doc.metadata["source"] for doc in second_docs] == [normalize_url(f"{base}/docs/b")]
+    assert "page b v2" in second_docs[0].page_content
+    assert second_stats["changed"] == 1 and second_stats["not_modified"] == 2 and second_stats["errors"] == 0
+    assert second_deleted == []
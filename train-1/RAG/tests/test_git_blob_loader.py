@@ -0,0 +1,114 @@
+# git_blob_loader のテスト（ローカルのbareリポジトリをクローン元に使う）
+
+import subprocess
+
+import pytest
+
+from git_blob_loader import GitBlobLoader
+
+
+def git(*args, cwd=None) -> str:
+    return subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd, capture_output=True, check=True,
+    ).stdout.decode().strip()
+
+
+def commit_files(work, files: dict[str, bytes], message: str) -> str:
+    for path, content in files.items():
+        target = work / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(content)
+    git("add", "-A", cwd=work)
+    git("commit", "-q", "-m", message, cwd=work)
+    git("push", "-q", "origin", "main", cwd=work)
+    return git("rev-parse", "HEAD", cwd=work)
+
+
+@pytest.fixture
+def origin(tmp_path):
+    """
+    `git init --bare` したクローン元と、そこへpushする作業リポジトリ
+
+    部分クローンとblob単位のフェッチができるよう、uploadpack の設定を有効にしておく。
+    """
+    bare = tmp_path / "origin.git"
+    git("init", "-q", "--bare", "-b", "main", str(bare))
+    git("config", "uploadpack.allowFilter", "true", cwd=bare)
+    git("config", "uploadpack.allowAnySHA1InWant", "true", cwd=bare)
+    work = tmp_path / "work"
+    git("init", "-q", "-b", "main", str(work))
+    git("remote", "add", "origin", str(bare), cwd=work)
+    head = commit_files(work, {
+        "docs/intro.md": "# Intro\n\nこんにちは\n".encode("utf-8"),
+        "docs/guide/setup.mdx": b"# Setup\n\npip install langchain\n",
+        "src/app.py": b"print('hello')\n",
+        "docs/legacy.md": "# Legacy\n\nshift_jis テキスト\n".encode("shift_jis"),
+    }, "initial")
+    return {"url": f"file://{bare}", "work": work, "head": head, "path": tmp_path}
+
+
+def markdown(path: str) -> bool:
+    return path.endswith((".md", ".mdx"))
+
+
+def missing_blobs(loader: GitBlobLoader) -> set[str]:
+    output = loader._git("rev-list", "--objects", "--no-walk", "--missing=print", loader.commit).decode()
+    return {line[1:] for line in output.splitlines() if line.startswith("?")}
+
+
+def test_sync_clones_bare_and_lists_filtered_files(origin):
+    loader = GitBlobLoader(str(origin["path"] / "clone.git"), clone_url=origin["url"], branch="main",
+                           file_filter=markdown)
+
+    assert loader.local_commit() is None
+    assert loader.sync() == origin["head"]
+    assert git("rev-parse", "--is-bare-repository", cwd=origin["path"] / "clone.git") == "true"
+    assert sorted(path for path, _ in loader.list_files()) == [
+        "docs/guide/setup.mdx", "docs/intro.md", "docs/legacy.md",
+    ]
+
+
+def test_partial_clone_fetches_missing_blobs_in_one_batch(origin):
+    loader = GitBlobLoader(str(origin["path"] / "clone.git"), clone_url=origin["url"], branch="main",
+                           file_filter=markdown)
+    loader.sync()
+    files = loader.list_files()
+    # --filter=blob:none のクローン直後は、blobの中身がまだローカルにない
+    assert {sha for _, sha in files} <= missing_blobs(loader)
+
+    contents = {path: content for path, _, content in loader.iter_blobs(files)}
+
+    assert contents["docs/intro.md"] == "# Intro\n\nこんにちは\n".encode("utf-8")
+    assert contents["docs/guide/setup.mdx"] == b"# Setup\n\npip install langchain\n"
+    assert not {sha for _, sha in files} & missing_blobs(loader)
+    # フィルターで除いたファイルのblobは取得しない
+    assert dict(GitBlobLoader(loader.repo_path, branch="main").list_files())["src/app.py"] in missing_blobs(loader)
+
+
+def test_load_skips_non_utf8_files(origin):
+    loader = GitBlobLoader(str(origin["path"] / "clone.git"), clone_url=origin["url"], branch="main",
+                           file_filter=markdown)
+
+    docs = loader.load()
+
+    assert sorted(doc.metadata["file_path"] for doc in docs) == ["docs/guide/setup.mdx", "docs/intro.md"]
+    intro = next(doc for doc in docs if doc.metadata["file_path"] == "docs/intro.md")
+    assert intro.page_content == "# Intro\n\nこんにちは\n"
+    assert intro.metadata == {"source": "docs/intro.md", "file_path": "docs/intro.md",
+                              "file_name": "intro.md", "file_type": ".md"}
+
+
+def test_sync_fetches_new_commits(origin):
+    loader = GitBlobLoader(str(origin["path"] / "clone.git"), clone_url=origin["url"], branch="main",
+                           file_filter=markdown)
+    loader.sync()
+    head = commit_files(origin["work"], {"docs/intro.md": b"# Intro\n\nupdated\n", "docs/new.md": b"# New\n"},
+                        "update")
+
+    # フェッチしなければ前回のコミットのまま
+    assert loader.local_commit() == origin["head"]
+    assert loader.sync() == head
+    docs = {doc.metadata["file_path"]: doc.page_content for doc in loader.load()}
+    assert docs["docs/intro.md"] == "# Intro\n\nupdated\n"
+    assert docs["docs/new.md"] == "# New\n"
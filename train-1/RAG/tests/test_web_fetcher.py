@@ -0,0 +1,141 @@
+# web_fetcher のテスト（ローカルのaiohttpサーバーをドキュメントサイトの代わりに使う）
+
+import asyncio
+import hashlib
+
+from aiohttp import web
+from langchain_core.documents import Document
+
+from web_fetcher import HttpCache, WebFetcher, afetch_documents
+
+
+class DocsSite:
+    """ETagを返し、If-None-Match が一致すれば 304 を返すサイト（同時処理数も記録する）"""
+
+    def __init__(self, pages: dict[str, str], delay: float = 0.0):
+        self.pages = pages
+        self.delay = delay
+        self.statuses = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def handler(self, request: web.Request) -> web.Response:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            body = self.pages.get(request.path)
+            if body is None:
+                raise web.HTTPNotFound()
+            etag = '"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:16] + '"'
+            if request.headers.get("If-None-Match") == etag:
+                self.statuses.append(304)
+                return web.Response(status=304, headers={"ETag": etag})
+            self.statuses.append(200)
+            return web.Response(text=body, content_type="text/html", headers={"ETag": etag})
+        finally:
+            self.in_flight -= 1
+
+
+async def serve(site: DocsSite, scenario):
+    # ポート0で起動し、ベースURLを渡してシナリオを実行する
+    app = web.Application()
+    app.router.add_get("/{path:.*}", site.handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    server = web.TCPSite(runner, "127.0.0.1", 0)
+    await server.start()
+    port = server._server.sockets[0].getsockname()[1]
+    try:
+        return await scenario(f"http://127.0.0.1:{port}")
+    finally:
+        await runner.cleanup()
+
+
+def counting_parser(calls: list):
+    def parse(html: str, url: str) -> Document:
+        calls.append(url)
+        return Document(page_content=html.replace("<p>", "").replace("</p>", ""), metadata={"source": url})
+    return parse
+
+
+def test_second_fetch_is_not_modified_and_not_reparsed(tmp_path):
+    site = DocsSite({f"/docs/{i}": f"<p>page {i}</p>" for i in range(5)})
+    calls = []
+
+    async def scenario(base):
+        urls = [f"{base}/docs/{i}" for i in range(5)]
+        first = await afetch_documents(urls, counting_parser(calls), "test", cache_directory=str(tmp_path))
+        second = await afetch_documents(urls, counting_parser(calls), "test", cache_directory=str(tmp_path))
+        return urls, first, second
+
+    urls, (first_docs, first_stats), (second_docs, second_stats) = asyncio.run(serve(site, scenario))
+
+    assert [doc.page_content for doc in first_docs] == [f"page {i}" for i in range(5)]
+    assert first_stats["fetched"] == 5 and first_stats["parsed"] == 5
+    # 2回目は全ページが 304 で、本文の転送も解析もしない
+    assert site.statuses[5:] == [304] * 5
+    assert second_stats["not_modified"] == 5 and second_stats["fetched"] == 0 and second_stats["parsed"] == 0
+    assert sorted(calls) == sorted(urls)
+    assert [(doc.page_content, doc.metadata) for doc in second_docs] == \
+        [(doc.page_content, doc.metadata) for doc in first_docs]
+
+
+def test_changed_page_is_fetched_and_reparsed(tmp_path):
+    site = DocsSite({"/a": "<p>old</p>", "/b": "<p>same</p>"})
+    calls = []
+
+    async def scenario(base):
+        urls = [f"{base}/a", f"{base}/b"]
+        await afetch_documents(urls, counting_parser(calls), "test", cache_directory=str(tmp_path))
+        site.pages["/a"] = "<p>new</p>"
+        calls.clear()
+        return await afetch_documents(urls, counting_parser(calls), "test", cache_directory=str(tmp_path))
+
+    docs, stats = asyncio.run(serve(site, scenario))
+
+    assert [doc.page_content for doc in docs] == ["new", "same"]
+    assert stats["fetched"] == 1 and stats["not_modified"] == 1 and stats["parsed"] == 1
+    assert [url.rsplit("/", 1)[1] for url in calls] == ["a"]
+
+
+def test_different_parser_key_reparses_cached_body(tmp_path):
+    site = DocsSite({"/a": "<p>text</p>"})
+    calls = []
+
+    async def scenario(base):
+        await afetch_documents([f"{base}/a"], counting_parser(calls), "first", cache_directory=str(tmp_path))
+        return await afetch_documents([f"{base}/a"], counting_parser(calls), "second", cache_directory=str(tmp_path))
+
+    docs, stats = asyncio.run(serve(site, scenario))
+
+    # 304 でも、別の解析方法ではキャッシュの本文を解析し直す
+    assert stats["not_modified"] == 1 and stats["parsed"] == 1 and len(calls) == 2
+    assert docs[0].page_content == "text"
+
+
+def test_per_host_limit_caps_concurrent_requests(tmp_path):
+    site = DocsSite({f"/docs/{i}": f"<p>{i}</p>" for i in range(12)}, delay=0.05)
+
+    async def scenario(base):
+        async with WebFetcher(HttpCache(str(tmp_path)), per_host_limit=3) as fetcher:
+            return await fetcher.fetch_documents([f"{base}/docs/{i}" for i in range(12)],
+                                                 counting_parser([]), "test")
+
+    docs = asyncio.run(serve(site, scenario))
+
+    assert len(docs) == 12
+    assert site.max_in_flight == 3
+
+
+def test_missing_page_is_counted_as_error(tmp_path):
+    site = DocsSite({"/a": "<p>a</p>"})
+
+    async def scenario(base):
+        return await afetch_documents([f"{base}/a", f"{base}/missing"], counting_parser([]), "test",
+                                      cache_directory=str(tmp_path))
+
+    docs, stats = asyncio.run(serve(site, scenario))
+
+    assert [doc.page_content for doc in docs] == ["a"]
+    assert stats["errors"] == 1
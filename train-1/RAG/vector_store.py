@@ -1,16 +1,108 @@
 # P94
 # RAGシステムの実装：LangChainのGitリポジトリから文書を読み込み、ベクターデータベースを作成して検索を行う
+# （作業ツリーはチェックアウトせず、bareの部分クローンからblobを直接読み込む）
 
-from langchain_community.document_loaders import GitLoader
 from langchain_text_splitters import CharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.document_loaders import GitLoader
 from langchain_chroma import Chroma
 from dotenv import load_dotenv
+import os
+import shutil
+
+from batch_embedder import embed_into
+from dedup import deduplicate
+from embedding_cache import EMBEDDING_BACKEND, get_embeddings
+from faiss_store import build_faiss_store, load_faiss_store
+from git_blob_loader import GitBlobLoader
+from incremental_index import update_index
+from index_manifest import build_manifest, manifest_diff, save_manifest
+from metadata_index import FilteredRetriever, MetadataIndex
+from mmr import MMRRetriever
+from parallel_splitter import split_documents_parallel
+from quantized_store import QuantizedVectorStore
+from sharded_store import ShardedVectorStore
+from snapshot import SnapshotVectorStore, build_ann, export_snapshot
+from streaming_ingest import ingest, iter_chunks, iter_documents
 
 # 環境変数を読み込み（OpenAI APIキーなど）
 load_dotenv()
 
+CLONE_URL = "https://github.com/langchain-ai/langchain"
+REPO_PATH = "./langchain.git"
+BRANCH = "master"
+# 起動時にリモートをフェッチして最新のコミットでインデックスを作り直すか（fullモード）
+# 無効の場合はローカルのリポジトリが指すコミットと比較するだけなので、ネットワークに出ない
+REFRESH_REPO = os.getenv("RAG_REFRESH_REPO", "0") == "1"
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# 埋め込みの次元数（0ならフルサイズの1536次元）。インデックス作成時と検索時の両方に同じ値が使われる
+#   api:      APIの dimensions パラメーターで縮小する
+#   truncate: フルサイズをキャッシュし、ローカルで切り詰め＋再正規化する（次元数を変えても再埋め込み不要）
+EMBEDDING_DIMENSIONS = int(os.getenv("RAG_EMBEDDING_DIMENSIONS", "0")) or None
+EMBEDDING_REDUCTION = os.getenv("RAG_EMBEDDING_REDUCTION", "api")
+
+# 取り込みモード
+#   incremental: 前回インデックスしたコミットとblob SHAを記録し、差分だけを再埋め込みする
+#   streaming:   load → split → embed → upsert をバッチ単位で流し、メモリ使用量を一定に保つ
+#   async:       トークン数で詰めたバッチをRPM/TPMの範囲内で並行に埋め込む
+#   full:        全文書を読み込んでから一括で作成する（従来の方法）
+INGEST_MODE = os.getenv("RAG_INGEST_MODE", "incremental")
+STREAM_BATCH_SIZE = 256
+STREAM_MAX_IN_FLIGHT = 4
+EMBED_CONCURRENCY = 8
+EMBED_RPM = 3_000
+EMBED_TPM = 1_000_000
+# 埋め込み前に完全一致・近似重複（MinHash/LSH）のチャンクを1つにまとめる
+# fullモードは全チャンクをまとめて、incremental / streaming / async モードはファイルごとに重複を除く
+# （fullモードでも sharded はシャードごとに除く。1シャードだけ作り直しても全体の作り直しと同じ結果にするため）
+DEDUP = True
+DEDUP_THRESHOLD = 0.85
+# ベクターストアの種類（fullモード）: chroma / faiss / quantized / sharded
+# いずれもディレクトリに永続化し、マニフェスト（コミット・分割設定・埋め込みモデルなど）が
+# 一致すれば次回起動時はそのまま開く
+# faissの場合は FAISS_INDEX_TYPE（flat / ivfpq / hnsw）と nprobe / efSearch で精度と速度を調整する
+# quantizedの場合は int8 / binary で候補を絞り、ディスク上のfloat32ベクトルで再スコアリングする
+# shardedの場合はディレクトリ（先頭 SHARD_DEPTH 階層）またはパスのハッシュでChromaを分割し、
+# 検索は全シャードへ並列に問い合わせる。コミットだけが変わったときは、変更のあったシャードだけを作り直す
+VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "chroma")
+FAISS_INDEX_TYPE = os.getenv("RAG_FAISS_INDEX_TYPE", "hnsw")
+FAISS_NPROBE = int(os.getenv("RAG_FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.getenv("RAG_FAISS_EF_SEARCH", "64"))
+FAISS_PERSIST_DIRECTORY = "./faiss_langchain"
+QUANTIZATION = os.getenv("RAG_QUANTIZATION", "int8")
+QUANTIZED_RESCORE_FACTOR = 10
+QUANTIZED_DIRECTORY = "./quantized_langchain"
+SHARD_STRATEGY = os.getenv("RAG_SHARD_STRATEGY", "directory")
+SHARD_COUNT = 8
+SHARD_DEPTH = 2
+SHARDED_DIRECTORY = "./sharded_langchain"
+CHROMA_FULL_DIRECTORY = "./chroma_langchain_full"
+PERSIST_DIRECTORY = "./chroma_langchain"
+STATE_PATH = os.path.join(PERSIST_DIRECTORY, "git_index_state.json")
+FULL_INDEX_DIRECTORIES = {
+    "chroma": CHROMA_FULL_DIRECTORY,
+    "faiss": FAISS_PERSIST_DIRECTORY,
+    "quantized": QUANTIZED_DIRECTORY,
+    "sharded": SHARDED_DIRECTORY,
+}
+# スナップショット（ベクトルはmmapできる.npy、テキストとメタデータは列指向のサイドカー）
+#   RAG_SNAPSHOT_DIRECTORY:        指定するとスナップショットをmmapで開いて検索だけを行う（取り込みはしない）
+#   RAG_SNAPSHOT_EXPORT_DIRECTORY: 指定すると作成したベクターストアをスナップショットとして書き出す
+#   RAG_SNAPSHOT_ANN:              書き出し時にANNインデックス（flat / ivfpq / hnsw）も作る
+SNAPSHOT_DIRECTORY = os.getenv("RAG_SNAPSHOT_DIRECTORY")
+SNAPSHOT_EXPORT_DIRECTORY = os.getenv("RAG_SNAPSHOT_EXPORT_DIRECTORY")
+SNAPSHOT_DTYPE = os.getenv("RAG_SNAPSHOT_DTYPE", "float32")
+SNAPSHOT_ANN = os.getenv("RAG_SNAPSHOT_ANN")
+# 検索対象をパスのglobで絞る（例: "docs/integrations/**/*.mdx"）。メタデータの転置インデックスで
+# 候補のチャンクを先に選び、その中だけでベクトル検索する
+FILTER_GLOB = os.getenv("RAG_FILTER_GLOB")
+METADATA_INDEX_FILE = "metadata_index.json"
+# 検索方法: "similarity"（類似度の上位） / "mmr"（類似度の上位 MMR_FETCH_K 件から、似た内容が重ならないように選ぶ）
+# MMR_LAMBDA は1に近いほど関連度、0に近いほど多様性を重視する
+RETRIEVER_SEARCH = os.getenv("RAG_RETRIEVER_SEARCH", "similarity")
+MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.5"))
+MMR_FETCH_K = int(os.getenv("RAG_MMR_FETCH_K", "20"))
+
 
 def file_filter(file_path: str) -> bool:
     """
@@ -25,55 +117,218 @@ def file_filter(file_path: str) -> bool:
     return file_path.endswith(('.md', '.mdx'))
 
 
-# GitLoaderを使用してLangChainリポジトリから文書を読み込み
-loader = GitLoader(
-    clone_url="https://github.com/langchain-ai/langchain",
-    repo_path="./langchain",
-    branch="master",
+# テキストスプリッターとOpenAIのembeddingモデル（埋め込み結果はディスクにキャッシュ）
+# RAG_EMBEDDING_BACKEND=local ならネットワーク不要のローカル埋め込みを使う
+text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
+embeddings = get_embeddings(
+    model=EMBEDDING_MODEL,
+    dimensions=EMBEDDING_DIMENSIONS,
+    reduction=EMBEDDING_REDUCTION,
+)
+# マニフェストに記録するモデル名（ローカル埋め込みは次元数・n-gramの設定を含む名前）
+embedding_model_name = embeddings.model if EMBEDDING_BACKEND == "local" else EMBEDDING_MODEL
+docs = []
+metadata_index = None
+
+# Gitのオブジェクトデータベースから.md/.mdxファイルを読み込むローダー
+loader = GitBlobLoader(
+    repo_path=REPO_PATH,
+    clone_url=CLONE_URL,
+    branch=BRANCH,
     file_filter=file_filter,
 )
 
-# 生の文書を読み込み
-raw_docs = loader.load()
-print(f"読み込み文書数: {len(raw_docs)}")
-
-# 取得したファイルの拡張子を確認
-print("\n=== 取得したファイルの拡張子確認 ===")
-file_extensions = {}
-for doc in raw_docs[:10]:  # 最初の10件をチェック
-    file_path = doc.metadata.get('file_path', '')
-    if file_path:
-        ext = file_path.split('.')[-1] if '.' in file_path else 'no_extension'
-        file_extensions[ext] = file_extensions.get(ext, 0) + 1
-        print(f"ファイルパス: {file_path}")
-
-print(f"\n拡張子の分布（最初の10件）: {file_extensions}")
-
-print("\n=== 生文書の最初のサンプル ===")
-if raw_docs:
-    first_raw_doc = raw_docs[0]
-    print(f"メタデータ: {first_raw_doc.metadata}")
-    print(f"内容（最初の500文字）: {first_raw_doc.page_content[:500]}...")
-    print(f"文書の全文字数: {len(first_raw_doc.page_content)}")
-
-# テキストスプリッターで文書をチャンクに分割
-text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-docs = text_splitter.split_documents(raw_docs)
-print(f"\n分割後のチャンク数: {len(docs)}")
-print("\n=== 分割後チャンクの最初のサンプル ===")
-if docs:
-    first_chunk = docs[0]
-    print(f"チャンクのメタデータ: {first_chunk.metadata}")
-    print(f"チャンクの内容: {first_chunk.page_content[:300]}...")
-    print(f"チャンクの文字数: {len(first_chunk.page_content)}")
+if SNAPSHOT_DIRECTORY:
+    # 配信用：ビルド済みのスナップショットを開くだけなので、起動直後から検索できる
+    db = SnapshotVectorStore(embeddings, SNAPSHOT_DIRECTORY, use_ann=True,
+                             nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH)
+    print(f"\n=== スナップショットを開きました（{SNAPSHOT_DIRECTORY}: {len(db)}件、{db.dtype}） ===")
+elif INGEST_MODE == "incremental":
+    # 永続化したChromaに、前回から変わったファイルの分だけを反映
+    # 埋め込みのバックエンド・モデル・次元数や分割の設定が前回と違えば、保存済みのベクトルは使えないので作り直す
+    # （コミットは状態ファイルで管理するので、マニフェストには記録しない）
+    print(f"\n=== インクリメンタル取り込み ===")
+    manifest = build_manifest(
+        None,
+        text_splitter,
+        embedding_model_name,
+        EMBEDDING_DIMENSIONS,
+        embedding_reduction=EMBEDDING_REDUCTION,
+        embedding_backend=EMBEDDING_BACKEND,
+        source={"clone_url": CLONE_URL, "branch": BRANCH, "extensions": [".md", ".mdx"]},
+        dedup={"enabled": DEDUP, "threshold": DEDUP_THRESHOLD, "scope": "file"},
+    )
+    mismatched = manifest_diff(PERSIST_DIRECTORY, manifest)
+    if mismatched:
+        print(f"インデックスを作り直します（マニフェストの不一致: {', '.join(mismatched)}）")
+        shutil.rmtree(PERSIST_DIRECTORY, ignore_errors=True)
+    db = Chroma(persist_directory=PERSIST_DIRECTORY, embedding_function=embeddings)
+    stats = update_index(db, text_splitter, loader, state_path=STATE_PATH,
+                         dedup_threshold=DEDUP_THRESHOLD if DEDUP else None)
+    save_manifest(PERSIST_DIRECTORY, manifest)
+    print(f"対象コミット: {stats['commit']}")
+    print(f"追加: {stats['added']}件 / 変更: {stats['modified']}件 / 削除: {stats['deleted']}件")
+    print(f"upsertしたチャンク数: {stats['upserted_chunks']} / 削除したチャンク数: {stats['deleted_chunks']}"
+          f" / 重複としてまとめたチャンク数: {stats['duplicate_chunks']}")
+elif INGEST_MODE == "streaming":
+    # 文書を1件ずつ読み込み・分割し、固定サイズのバッチで埋め込んでupsert
+    print(f"\n=== ストリーミング取り込み ===")
+    db = Chroma(embedding_function=embeddings)
+    stats = ingest(
+        iter_chunks(iter_documents(loader), text_splitter, DEDUP_THRESHOLD if DEDUP else None),
+        embeddings,
+        db,
+        batch_size=STREAM_BATCH_SIZE,
+        max_in_flight=STREAM_MAX_IN_FLIGHT,
+    )
+    print(f"チャンク数: {stats['chunks']} / バッチ数: {stats['batches']} / 経過時間: {stats['seconds']:.1f}秒")
+    print(f"ピークRSS: {stats['peak_rss_mb']:.1f} MB")
+elif INGEST_MODE == "async":
+    # レート制限を守りながら複数バッチを並行に埋め込み、そのままChromaへupsert
+    print(f"\n=== 並行バッチ埋め込み ===")
+    db = Chroma(embedding_function=embeddings)
+    stats = embed_into(
+        iter_chunks(iter_documents(loader), text_splitter, DEDUP_THRESHOLD if DEDUP else None),
+        embeddings,
+        db,
+        concurrency=EMBED_CONCURRENCY,
+        rpm=EMBED_RPM,
+        tpm=EMBED_TPM,
+    )
+    print(f"チャンク数: {stats['chunks']} / バッチ数: {stats['batches']} / 再試行: {stats['retries']}回")
+    if stats["failed_chunks"]:
+        print(f"埋め込みに失敗したチャンク数: {stats['failed_chunks']}（{stats['failed_batches']}バッチ）")
+    print(f"経過時間: {stats['seconds']:.1f}秒 / {stats['chunks_per_sec']:.1f} chunks/sec")
+else:
+    # 永続化したインデックスのマニフェストが現在の設定と一致すれば、分割・埋め込みをせずにそのまま開く
+    index_directory = FULL_INDEX_DIRECTORIES.get(VECTOR_BACKEND, CHROMA_FULL_DIRECTORY)
+    commit = loader.sync() if REFRESH_REPO else (loader.local_commit() or loader.sync())
+    manifest = build_manifest(
+        commit,
+        text_splitter,
+        embedding_model_name,
+        EMBEDDING_DIMENSIONS,
+        embedding_reduction=EMBEDDING_REDUCTION,
+        source={"clone_url": CLONE_URL, "branch": BRANCH, "extensions": [".md", ".mdx"]},
+        dedup={"enabled": DEDUP, "threshold": DEDUP_THRESHOLD,
+               "scope": "shard" if VECTOR_BACKEND == "sharded" else "all"},
+        backend={"type": VECTOR_BACKEND, "faiss_index_type": FAISS_INDEX_TYPE, "quantization": QUANTIZATION,
+                 "shard_strategy": SHARD_STRATEGY, "shard_count": SHARD_COUNT, "shard_depth": SHARD_DEPTH},
+        metadata_index=METADATA_INDEX_FILE,
+    )
+    mismatched = manifest_diff(index_directory, manifest)
+
+    if VECTOR_BACKEND == "sharded" and mismatched == ["commit"]:
+        # コミットだけが変わった場合は、blobが変わったファイルを含むシャードだけを作り直す
+        print(f"\n=== シャードの差分更新（コミット {commit[:12]}） ===")
+        db = ShardedVectorStore(embeddings, index_directory)
+        for name, shard_files in db.stale_shards(dict(loader.list_files())).items():
+            shard_docs = split_documents_parallel(list(loader.load_files(list(shard_files.items()))), text_splitter)
+            count = db.rebuild_shard(name, shard_docs, files=shard_files,
+                                     dedup_threshold=DEDUP_THRESHOLD if DEDUP else None)
+            print(f"シャード {name}: {len(shard_files)}ファイル / {count}チャンク")
+        metadata_index = MetadataIndex.from_vector_store(db)
+        metadata_index.save(os.path.join(index_directory, METADATA_INDEX_FILE))
+        save_manifest(index_directory, manifest)
+    elif not mismatched:
+        print(f"\n=== 保存済みインデックスを開きます（{index_directory}、コミット {commit[:12]}） ===")
+        if VECTOR_BACKEND == "faiss":
+            db = load_faiss_store(index_directory, embeddings, nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH)
+        elif VECTOR_BACKEND == "quantized":
+            db = QuantizedVectorStore(embeddings, index_directory, rescore_factor=QUANTIZED_RESCORE_FACTOR)
+        elif VECTOR_BACKEND == "sharded":
+            db = ShardedVectorStore(embeddings, index_directory)
+        else:
+            db = Chroma(persist_directory=index_directory, embedding_function=embeddings)
+        metadata_index = MetadataIndex.load(os.path.join(index_directory, METADATA_INDEX_FILE))
+    else:
+        print(f"\nインデックスを作り直します（マニフェストの不一致: {', '.join(mismatched)}）")
+        shutil.rmtree(index_directory, ignore_errors=True)
+
+        # 生の文書を読み込み
+        raw_docs = loader.load()
+        print(f"読み込み文書数: {len(raw_docs)}")
+
+        # 取得したファイルの拡張子を確認（メタデータの転置インデックスから集計）
+        print("\n=== 取得したファイルの拡張子確認 ===")
+        print(f"拡張子の分布: {MetadataIndex.from_documents(raw_docs).file_counts('extension')}")
+
+        print("\n=== 生文書の最初のサンプル ===")
+        if raw_docs:
+            first_raw_doc = raw_docs[0]
+            print(f"メタデータ: {first_raw_doc.metadata}")
+            print(f"内容（最初の500文字）: {first_raw_doc.page_content[:500]}...")
+            print(f"文書の全文字数: {len(first_raw_doc.page_content)}")
 
-# OpenAIのembeddingモデルを使用してベクター化
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+        # テキストスプリッターで文書をチャンクに分割（プロセスプールで並列に分割し、順序は維持）
+        docs = split_documents_parallel(raw_docs, text_splitter)
+        print(f"\n分割後のチャンク数: {len(docs)}")
+        print("\n=== 分割後チャンクの最初のサンプル ===")
+        if docs:
+            first_chunk = docs[0]
+            print(f"チャンクのメタデータ: {first_chunk.metadata}")
+            print(f"チャンクの内容: {first_chunk.page_content[:300]}...")
+            print(f"チャンクの文字数: {len(first_chunk.page_content)}")
 
-# Chromaベクターデータベースを作成
-print(f"\n=== ベクターデータベース作成中 ===")
-db = Chroma.from_documents(docs, embeddings)
-print(f"ベクターデータベースの作成完了")
+        # 定型文などの重複チャンクをまとめ、元ファイルのパスは source_paths に残す
+        # （shardedはシャードごとにまとめるので、ここではまとめずに ShardedVectorStore.create に任せる）
+        if DEDUP and VECTOR_BACKEND != "sharded":
+            docs, dedup_stats = deduplicate(docs, threshold=DEDUP_THRESHOLD)
+            print(f"\n重複除去: 完全一致 {dedup_stats['exact_duplicates']}件 / "
+                  f"近似重複 {dedup_stats['near_duplicates']}件 → {dedup_stats['output']}チャンク")
+
+        # file_path / ディレクトリ / 拡張子 / source の転置インデックス（行番号 = 登録順、IDは行番号）
+        metadata_index = MetadataIndex.from_documents(docs)
+
+        # ベクターデータベースを作成
+        print(f"\n=== ベクターデータベース作成中（{VECTOR_BACKEND}） ===")
+        if VECTOR_BACKEND == "faiss":
+            db = build_faiss_store(
+                docs,
+                embeddings,
+                index_type=FAISS_INDEX_TYPE,
+                nprobe=FAISS_NPROBE,
+                ef_search=FAISS_EF_SEARCH,
+                ids=metadata_index.ids,
+            )
+            db.save_local(index_directory)
+        elif VECTOR_BACKEND == "quantized":
+            db = QuantizedVectorStore.from_documents(
+                docs,
+                embeddings,
+                directory=index_directory,
+                quantization=QUANTIZATION,
+                rescore_factor=QUANTIZED_RESCORE_FACTOR,
+            )
+            memory = db.memory_bytes()
+            print(f"量子化ベクトル: {memory['quantized'] / 1e6:.1f} MB（float32: {memory['float32'] / 1e6:.1f} MB）")
+        elif VECTOR_BACKEND == "sharded":
+            db = ShardedVectorStore.create(
+                docs,
+                embeddings,
+                index_directory,
+                strategy=SHARD_STRATEGY,
+                num_shards=SHARD_COUNT,
+                depth=SHARD_DEPTH,
+                files=dict(loader.list_files()),
+                dedup_threshold=DEDUP_THRESHOLD if DEDUP else None,
+            )
+            # シャードのIDは "<シャード名>#<連番>" になるので、インデックスはストアから作り直す
+            metadata_index = MetadataIndex.from_vector_store(db)
+            print(f"シャード数: {len(db.shards)}")
+        else:
+            db = Chroma.from_documents(docs, embeddings, ids=metadata_index.ids, persist_directory=index_directory)
+        metadata_index.save(os.path.join(index_directory, METADATA_INDEX_FILE))
+        # インデックスを書き終えてから最後にマニフェストを書く（途中で落ちたら次回は作り直し）
+        save_manifest(index_directory, manifest)
+        print(f"ベクターデータベースの作成完了")
+
+# 作成したベクターストアをスナップショットとして書き出す（配信用マシンへ移すため）
+if SNAPSHOT_EXPORT_DIRECTORY and not SNAPSHOT_DIRECTORY:
+    count = export_snapshot(db, SNAPSHOT_EXPORT_DIRECTORY, dtype=SNAPSHOT_DTYPE)
+    if SNAPSHOT_ANN:
+        build_ann(SNAPSHOT_EXPORT_DIRECTORY, index_type=SNAPSHOT_ANN)
+    print(f"\nスナップショットを書き出しました: {SNAPSHOT_EXPORT_DIRECTORY}（{count}件、{SNAPSHOT_DTYPE}）")
 
 # ベクター化のサンプルを確認（最初のチャンクをベクター化して確認）
 print("\n=== ベクターデータのサンプル ===")
@@ -84,8 +339,21 @@ if docs:
     print(f"ベクターの次元数: {len(sample_vector)}")
     print(f"ベクターの最初の10要素: {sample_vector[:10]}")
 
-# 検索用のretrieverを作成
-retriever = db.as_retriever()
+# 検索用のretrieverを作成（フィルター指定時は、条件に合うチャンクだけを検索する）
+if FILTER_GLOB:
+    if metadata_index is None:
+        metadata_index = MetadataIndex.from_vector_store(db)
+    # RAG_RETRIEVER_SEARCH=mmr なら、絞った候補の中でMMRを行う
+    retriever = FilteredRetriever(vector_store=db, metadata_index=metadata_index, filter={"path_glob": FILTER_GLOB},
+                                  search_type=RETRIEVER_SEARCH, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA)
+    print(f"\n検索対象: {FILTER_GLOB}（{len(metadata_index.select(path_glob=FILTER_GLOB))} / {len(metadata_index)} チャンク）")
+    if RETRIEVER_SEARCH == "mmr":
+        print(f"検索方法: MMR（候補 {MMR_FETCH_K} 件、lambda={MMR_LAMBDA}）")
+elif RETRIEVER_SEARCH == "mmr":
+    retriever = MMRRetriever(vector_store=db, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA)
+    print(f"\n検索方法: MMR（候補 {MMR_FETCH_K} 件、lambda={MMR_LAMBDA}）")
+else:
+    retriever = db.as_retriever()
 
 # 検索クエリ
 query = "AWSのS3からデータを読み込むためのDocument loaderはありますか？"
@@ -106,3 +374,5 @@ for i, doc in enumerate(context_docs):
     if i >= 2:  # 最初の3件のみ表示
         print(f"\n（残り{len(context_docs)-3}件の結果は省略）")
         break
+
+print(f"\n埋め込みキャッシュ: {embeddings.stats()}")
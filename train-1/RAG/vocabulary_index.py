@@ -0,0 +1,124 @@
+# 語彙の埋め込み行列を事前計算し、近い単語を探すインデックス
+#
+#   vocabulary.json   モデル名・次元数・語数
+#   vectors.npy       (N, D) のL2正規化済みfloat32行列（mmapで開く）
+#   words.txt         1行1語の単語リスト（vectors.npy の行と同じ順番）
+#
+# 起動時は .npy をmmapで開くだけで語彙を埋め込み直さない。検索はクエリベクトルとの
+# 行列×ベクトル1回と argpartition で上位k件を取り出す。
+
+import json
+import os
+
+import numpy as np
+
+VOCABULARY_VERSION = 1
+META_FILE = "vocabulary.json"
+# 構築時に1回の embed_documents へ渡す語数
+EMBED_BATCH_SIZE = 2_048
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _model_name(embeddings) -> str:
+    return getattr(embeddings, "model_name", None) or getattr(embeddings, "model", type(embeddings).__name__)
+
+
+def build_vocabulary_index(embeddings, words: list[str], directory: str,
+                           batch_size: int = EMBED_BATCH_SIZE) -> "VocabularyIndex":
+    """
+    語彙を埋め込み、mmapで開ける形式で保存する
+
+    ベクトルは書き込み先の.npyをmmapしてバッチごとに直接埋めるので、語彙全体をメモリに載せない。
+
+    Args:
+        embeddings: 埋め込みモデル
+        words (list[str]): 語彙（重複は除いておく）
+        directory (str): 保存先ディレクトリ
+        batch_size (int): 1回の embed_documents に渡す語数
+
+    Returns:
+        VocabularyIndex: 保存したインデックス
+    """
+    os.makedirs(directory, exist_ok=True)
+    vectors = None
+    for start in range(0, len(words), batch_size):
+        batch = _normalize(np.asarray(embeddings.embed_documents(words[start:start + batch_size]), dtype=np.float32))
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(os.path.join(directory, "vectors.npy"), mode="w+",
+                                                dtype=np.float32, shape=(len(words), batch.shape[1]))
+        vectors[start:start + len(batch)] = batch
+    if vectors is None:
+        raise ValueError("語彙が空です")
+    vectors.flush()
+    del vectors
+    with open(os.path.join(directory, "words.txt"), "w", encoding="utf-8") as f:
+        f.writelines(word + "\n" for word in words)
+    # メタデータは最後に書く（途中で失敗したインデックスは開けないようにする）
+    meta = {"version": VOCABULARY_VERSION, "model": _model_name(embeddings),
+            "dimensions": getattr(embeddings, "dimensions", None), "count": len(words)}
+    with open(os.path.join(directory, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return VocabularyIndex(directory, embeddings)
+
+
+class VocabularyIndex:
+    """
+    保存済みの語彙インデックスをmmapで開き、近い単語を検索する
+
+    Args:
+        directory (str): build_vocabulary_index() の保存先
+        embeddings: クエリの埋め込みに使うモデル（構築時と同じモデルであることを確認する）
+    """
+
+    def __init__(self, directory: str, embeddings=None):
+        with open(os.path.join(directory, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != VOCABULARY_VERSION:
+            raise ValueError(f"未対応の語彙インデックスのバージョンです: {self.meta['version']}")
+        if embeddings is not None and (_model_name(embeddings), getattr(embeddings, "dimensions", None)) != (
+                self.meta["model"], self.meta["dimensions"]):
+            raise ValueError(f"語彙インデックスのモデル（{self.meta['model']}, {self.meta['dimensions']}）と"
+                             f"埋め込みモデルが一致しません。作り直してください")
+        self.embeddings = embeddings
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "words.txt"), encoding="utf-8") as f:
+            self.words = f.read().splitlines()
+        self._rows = {word: row for row, word in enumerate(self.words)}
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def nearest_by_vector(self, vector, k: int = 10, exclude: str = None) -> list[tuple[str, float]]:
+        """
+        ベクトルに近い単語を返す
+
+        Args:
+            vector: クエリベクトル
+            k (int): 返す件数
+            exclude (str | None): 結果から除く単語（クエリの単語自身など）
+
+        Returns:
+            list[tuple[str, float]]: (単語, コサイン類似度) の類似度の高い順
+        """
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+        scores = self.vectors @ query
+        if exclude in self._rows:
+            scores[self._rows[exclude]] = -np.inf
+        k = min(k, len(scores) - (exclude in self._rows))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.words[row], float(scores[row])) for row in top]
+
+    def nearest(self, word: str, k: int = 10) -> list[tuple[str, float]]:
+        """
+        単語に近い単語を返す（語彙にある単語は保存済みのベクトルを使い、埋め込みAPIを呼ばない）
+        """
+        if word in self._rows:
+            return self.nearest_by_vector(self.vectors[self._rows[word]], k, exclude=word)
+        return self.nearest_by_vector(self.embeddings.embed_query(word), k, exclude=word)
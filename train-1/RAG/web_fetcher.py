@@ -0,0 +1,242 @@
+# 接続を使い回す並行Webフェッチャー（条件付きGETのディスクキャッシュ付き）
+#
+# WebBaseLoader.load() はURLを1件ずつ取得し、aload() は同時接続数の上限もキャッシュもない。
+# ここでは keep-alive の aiohttp セッションを1つだけ作り、ホストごとの同時接続数を制限して並行に取得する。
+# 取得したページの ETag / Last-Modified と本文、解析済みの文書をディスクに保存しておき、
+# 次回は If-None-Match / If-Modified-Since を付けて問い合わせる。304 が返ったページは本文を転送せず、
+# 解析もやり直さずに保存済みの文書を返す。
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import aiohttp
+import bs4
+from langchain_core.documents import Document
+
+DEFAULT_CACHE_DIRECTORY = os.getenv(
+    "WEB_CACHE_DIRECTORY",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".web_cache"),
+)
+DEFAULT_PER_HOST_LIMIT = 4
+DEFAULT_TOTAL_LIMIT = 32
+DEFAULT_TIMEOUT_SECONDS = 30
+USER_AGENT = "Mozilla/5.0 (compatible; langchain-train-rag/1.0)"
+# WebBaseLoaderの例と同じく、本文が入りやすい要素だけを解析する
+CONTENT_TAGS = ["article", "main", "section", "div", "p", "h1", "h2", "h3", "h4", "h5", "h6"]
+
+
+def soup_document(html: str, url: str, css_class: str = None) -> Document:
+    """
+    BeautifulSoup（SoupStrainer）でHTMLから本文を取り出す（WebBaseLoaderと同じ形のDocument）
+
+    Args:
+        html (str): HTML
+        url (str): ページのURL（metadataのsource）
+        css_class (str | None): 指定するとこのクラスの要素だけを解析する
+
+    Returns:
+        Document: 本文とメタデータ（source / title / description / language のうち取れたもの）
+    """
+    parse_only = bs4.SoupStrainer(class_=css_class) if css_class else bs4.SoupStrainer(CONTENT_TAGS)
+    soup = bs4.BeautifulSoup(html, "html.parser", parse_only=parse_only)
+    metadata = {"source": url}
+    if title := soup.find("title"):
+        metadata["title"] = title.get_text()
+    if description := soup.find("meta", attrs={"name": "description"}):
+        metadata["description"] = description.get("content", "No description found.")
+    if html_tag := soup.find("html"):
+        metadata["language"] = html_tag.get("lang", "No language found.")
+    return Document(page_content=soup.get_text(), metadata=metadata)
+
+
+class HttpCache:
+    """
+    URLごとの検証子（ETag / Last-Modified）・本文・解析済み文書を保存するディスクキャッシュ
+
+    Args:
+        directory (str): 保存先ディレクトリ
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIRECTORY):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url: str, suffix: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(url.encode("utf-8")).hexdigest() + suffix)
+
+    def _read_json(self, path: str):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write(self, path: str, text: str) -> None:
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(path + ".tmp", path)
+
+    def get(self, url: str) -> dict:
+        """保存済みの検証子（{"etag", "last_modified", ...}）を返す（なければ None）"""
+        entry = self._read_json(self._path(url, ".json"))
+        if entry is None or not os.path.exists(self._path(url, ".body")):
+            return None
+        return entry
+
+    def body(self, url: str) -> str:
+        with open(self._path(url, ".body"), encoding="utf-8") as f:
+            return f.read()
+
+    def put(self, url: str, headers, body: str) -> None:
+        """レスポンスを保存する（本文が変わったので、解析済みの文書は捨てる）"""
+        self._write(self._path(url, ".body"), body)
+        self._write(self._path(url, ".json"), json.dumps({
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "content_type": headers.get("Content-Type"),
+            "fetched_at": time.time(),
+        }, ensure_ascii=False))
+        if os.path.exists(self._path(url, ".parsed.json")):
+            os.remove(self._path(url, ".parsed.json"))
+
+    def get_parsed(self, url: str, parser_key: str) -> list[Document]:
+        """parser_key で解析済みの文書を返す（なければ None）"""
+        docs = (self._read_json(self._path(url, ".parsed.json")) or {}).get(parser_key)
+        return None if docs is None else [Document(**doc) for doc in docs]
+
+    def put_parsed(self, url: str, parser_key: str, docs: list[Document]) -> None:
+        parsed = self._read_json(self._path(url, ".parsed.json")) or {}
+        parsed[parser_key] = [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+        self._write(self._path(url, ".parsed.json"), json.dumps(parsed, ensure_ascii=False))
+
+
+class WebFetcher:
+    """
+    keep-aliveのセッション1つでURLを並行に取得するフェッチャー（async with で使う）
+
+    Args:
+        cache (HttpCache | None): 条件付きGETに使うキャッシュ（None ならキャッシュしない）
+        per_host_limit (int): ホストごとの同時接続数
+        total_limit (int): 全体の同時接続数
+        timeout (float): 1リクエストのタイムアウト（秒）
+    """
+
+    def __init__(self, cache: HttpCache = None, per_host_limit: int = DEFAULT_PER_HOST_LIMIT,
+                 total_limit: int = DEFAULT_TOTAL_LIMIT, timeout: float = DEFAULT_TIMEOUT_SECONDS):
+        self.cache = cache
+        self.per_host_limit = per_host_limit
+        self.total_limit = total_limit
+        self.timeout = timeout
+        self.session = None
+        self.stats = {"pages": 0, "fetched": 0, "not_modified": 0, "errors": 0, "bytes": 0,
+                      "parsed": 0, "seconds": 0.0}
+
+    async def __aenter__(self) -> "WebFetcher":
+        # 同じホストへの接続は limit_per_host 本までに抑え、使い終わった接続は閉じずに再利用する
+        connector = aiohttp.TCPConnector(limit=self.total_limit, limit_per_host=self.per_host_limit)
+        self.session = aiohttp.ClientSession(connector=connector, headers={"User-Agent": USER_AGENT},
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.session.close()
+
+    async def fetch(self, url: str) -> dict:
+        """
+        URLを取得する（キャッシュに検証子があれば条件付きGETにする）
+
+        Returns:
+            dict: {"url", "final_url", "status", "text", "not_modified"}。304のときは text にキャッシュの本文が入る
+                final_url はリダイレクト後のURL（相対リンクの基準にする）
+        """
+        cached = self.cache.get(url) if self.cache else None
+        headers = {}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+        async with self.session.get(url, headers=headers) as response:
+            if response.status == 304 and cached:
+                self.stats["not_modified"] += 1
+                return {"url": url, "final_url": str(response.url), "status": 304, "text": self.cache.body(url),
+                        "not_modified": True}
+            response.raise_for_status()
+            body = await response.read()
+            text = body.decode(response.get_encoding(), errors="replace")
+            self.stats["fetched"] += 1
+            self.stats["bytes"] += len(body)
+            if self.cache:
+                self.cache.put(url, response.headers, text)
+            return {"url": url, "final_url": str(response.url), "status": response.status, "text": text,
+                    "not_modified": False}
+
+    async def fetch_documents(self, urls, parser=soup_document, parser_key: str = "soup") -> list[Document]:
+        """
+        URLをまとめて並行に取得し、文書に変換する
+
+        304のページは、同じ parser_key で解析済みの文書があれば解析をやり直さない。
+        取得に失敗したURLは stats["errors"] に数えて読み飛ばす。
+
+        Args:
+            urls (Iterable[str]): 取得するURL
+            parser: (HTML, URL) を受け取り Document（またはそのリスト）を返す関数
+            parser_key (str): 解析済み文書のキャッシュキー（解析方法を変えたら別の値にする）
+
+        Returns:
+            list[Document]: URLの順番どおりの文書
+        """
+        started = time.perf_counter()
+        urls = list(dict.fromkeys(urls))
+
+        async def load(url: str) -> list[Document]:
+            try:
+                page = await self.fetch(url)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"取得に失敗しました: {url} ({e})")
+                self.stats["errors"] += 1
+                return []
+            if page["not_modified"] and self.cache:
+                docs = self.cache.get_parsed(url, parser_key)
+                if docs is not None:
+                    return docs
+            docs = parser(page["text"], url)
+            docs = docs if isinstance(docs, list) else [docs]
+            self.stats["parsed"] += 1
+            if self.cache:
+                self.cache.put_parsed(url, parser_key, docs)
+            return docs
+
+        results = await asyncio.gather(*(load(url) for url in urls))
+        self.stats["pages"] += len(urls)
+        self.stats["seconds"] += time.perf_counter() - started
+        self.stats["pages_per_sec"] = self.stats["pages"] / self.stats["seconds"] if self.stats["seconds"] else 0.0
+        return [doc for docs in results for doc in docs]
+
+
+async def afetch_documents(urls, parser=soup_document, parser_key: str = "soup", cache_directory: str = None,
+                           **kwargs) -> tuple[list[Document], dict]:
+    """
+    WebFetcher でURLを取得して文書に変換する
+
+    Args:
+        urls (Iterable[str]): 取得するURL
+        parser: (HTML, URL) を受け取り Document を返す関数
+        parser_key (str): 解析済み文書のキャッシュキー
+        cache_directory (str | None): キャッシュの保存先（省略時は DEFAULT_CACHE_DIRECTORY）
+        **kwargs: WebFetcher に渡す引数（per_host_limit など）
+
+    Returns:
+        tuple[list[Document], dict]: (文書, 統計)
+    """
+    async with WebFetcher(HttpCache(cache_directory or DEFAULT_CACHE_DIRECTORY), **kwargs) as fetcher:
+        docs = await fetcher.fetch_documents(urls, parser, parser_key)
+    return docs, fetcher.stats
+
+
+def fetch_documents(urls, parser=soup_document, parser_key: str = "soup", **kwargs) -> tuple[list[Document], dict]:
+    """afetch_documents() の同期版"""
+    return asyncio.run(afetch_documents(urls, parser, parser_key, **kwargs))
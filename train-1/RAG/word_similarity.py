@@ -1,12 +1,30 @@
-from langchain_openai import OpenAIEmbeddings
 from dotenv import load_dotenv
 import numpy as np
+import os
+import time
+
+from embedding_cache import get_embeddings
+from vocabulary_index import META_FILE, VocabularyIndex, build_vocabulary_index
 
 load_dotenv()
 
+# 埋め込みの次元数（Noneならフルサイズの3072次元）。256 / 1024 などに減らすと計算量とメモリが減る
+EMBEDDING_DIMENSIONS = None
+# 一括モード: 1行1語の用語ファイルを指定すると、全用語の組み合わせの類似度をまとめて計算する
+#   WORD_SIMILARITY_TERMS_FILE: 用語ファイル（未指定なら2語を入力する対話モード）
+#   WORD_SIMILARITY_CSV:        指定するとN×Nの類似度行列をCSVに書き出す（未指定なら各語の上位 TOP_K 件を表示）
+TERMS_FILE = os.getenv("WORD_SIMILARITY_TERMS_FILE")
+SIMILARITY_CSV = os.getenv("WORD_SIMILARITY_CSV")
+TOP_K = 5
+# 近傍単語モード: 語彙インデックスを指定すると、入力した単語に近い単語を語彙から探す
+#   WORD_SIMILARITY_VOCAB_INDEX: 語彙インデックスのディレクトリ（なければ VOCAB_FILE から作る）
+#   WORD_SIMILARITY_VOCAB_FILE:  インデックスを作るときの1行1語の語彙ファイル
+VOCAB_INDEX_DIRECTORY = os.getenv("WORD_SIMILARITY_VOCAB_INDEX")
+VOCAB_FILE = os.getenv("WORD_SIMILARITY_VOCAB_FILE")
+
 
 def calculate_word_similarity():
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+    embeddings = get_embeddings(model="text-embedding-3-large", dimensions=EMBEDDING_DIMENSIONS)
 
     word1 = input("最初の単語を入力してください: ")
     word2 = input("二番目の単語を入力してください: ")
@@ -40,5 +58,104 @@ def calculate_word_similarity():
     return similarity
 
 
+def load_terms(path: str) -> list[str]:
+    """1行1語のファイルから用語を読み込む（空行と重複は除き、順番は保つ）"""
+    with open(path, encoding="utf-8") as f:
+        return list(dict.fromkeys(line.strip() for line in f if line.strip()))
+
+
+def similarity_matrix(embeddings, terms: list[str]) -> np.ndarray:
+    """
+    全用語の組み合わせのコサイン類似度を計算する
+
+    embed_documents を1回だけ呼び、L2正規化したベクトルの行列積1回で N×N の行列を作る。
+
+    Args:
+        embeddings: 埋め込みモデル
+        terms (list[str]): 用語のリスト
+
+    Returns:
+        np.ndarray: (N, N) の類似度行列（float32）
+    """
+    vectors = np.asarray(embeddings.embed_documents(terms), dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors @ vectors.T
+
+
+def top_k_neighbors(matrix: np.ndarray, k: int = TOP_K) -> tuple[np.ndarray, np.ndarray]:
+    """
+    各用語について、自分以外で類似度の高い上位k件を返す
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (添字, 類似度)。どちらも (N, k) で類似度の高い順
+    """
+    k = min(k, len(matrix) - 1)
+    scores = matrix.copy()
+    np.fill_diagonal(scores, -np.inf)
+    # 行ごとに上位k件だけを取り出してから並べ替える（全体のソートはしない）
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def write_similarity_csv(path: str, terms: list[str], matrix: np.ndarray) -> None:
+    """類似度行列をCSVに書き出す（1行目と1列目が用語）"""
+    quote = lambda term: '"' + term.replace('"', '""') + '"'
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(",".join([""] + [quote(term) for term in terms]) + "\n")
+        for term, row in zip(terms, matrix):
+            f.write(quote(term) + "," + ",".join(f"{value:.4f}" for value in row) + "\n")
+
+
+def calculate_similarity_matrix(terms: list[str], csv_path: str = None, top_k: int = TOP_K) -> np.ndarray:
+    embeddings = get_embeddings(model="text-embedding-3-large", dimensions=EMBEDDING_DIMENSIONS)
+    matrix = similarity_matrix(embeddings, terms)
+    print(f"{len(terms)}語の類似度行列を計算しました（{matrix.shape[0]}x{matrix.shape[1]}）")
+
+    if csv_path:
+        write_similarity_csv(csv_path, terms, matrix)
+        print(f"CSVに書き出しました: {csv_path}")
+    elif len(terms) > 1:
+        neighbors, scores = top_k_neighbors(matrix, top_k)
+        for term, row, row_scores in zip(terms, neighbors, scores):
+            print(f"{term}: " + ", ".join(f"{terms[j]} ({score:.4f})" for j, score in zip(row, row_scores)))
+
+    print(f"埋め込みキャッシュ: {embeddings.stats()}")
+    return matrix
+
+
+def find_nearest_words(top_k: int = 10):
+    index_exists = os.path.exists(os.path.join(VOCAB_INDEX_DIRECTORY, META_FILE))
+    if not index_exists and not (VOCAB_FILE and os.path.exists(VOCAB_FILE)):
+        print(f"語彙インデックスがありません: {VOCAB_INDEX_DIRECTORY}")
+        print("作成するには WORD_SIMILARITY_VOCAB_FILE に1行1語の語彙ファイルを指定してください")
+        print("  例: WORD_SIMILARITY_VOCAB_INDEX=./vocab_index WORD_SIMILARITY_VOCAB_FILE=words.txt python word_similarity.py")
+        return
+    embeddings = get_embeddings(model="text-embedding-3-large", dimensions=EMBEDDING_DIMENSIONS)
+    if index_exists:
+        # 保存済みの行列をmmapで開くだけなので、語彙は埋め込み直さない
+        index = VocabularyIndex(VOCAB_INDEX_DIRECTORY, embeddings)
+    else:
+        print("語彙インデックスを作成します...")
+        index = build_vocabulary_index(embeddings, load_terms(VOCAB_FILE), VOCAB_INDEX_DIRECTORY)
+    print(f"語彙数: {len(index)}")
+
+    while True:
+        word = input("単語を入力してください（空行で終了）: ").strip()
+        if not word:
+            break
+        started = time.perf_counter()
+        results = index.nearest(word, top_k)
+        print(f"'{word}' に近い単語（{(time.perf_counter() - started) * 1000:.1f}ms）:")
+        for rank, (neighbor, score) in enumerate(results, 1):
+            print(f"  {rank}. {neighbor} ({score:.4f})")
+
+
 if __name__ == "__main__":
-    calculate_word_similarity()
\ No newline at end of file
+    if VOCAB_INDEX_DIRECTORY:
+        find_nearest_words()
+    elif TERMS_FILE:
+        calculate_similarity_matrix(load_terms(TERMS_FILE), SIMILARITY_CSV)
+    else:
+        calculate_word_similarity()
\ No newline at end of file